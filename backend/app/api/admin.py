@@ -237,6 +237,10 @@ async def create_widget_config(
         lead_fields=config_data.get("lead_fields"),
         escalation_contact_level_1=config_data.get("escalation_contact_level_1", DEFAULT_ESCALATION_CONTACT_LEVEL_1),
         escalation_contact_level_2=config_data.get("escalation_contact_level_2", DEFAULT_ESCALATION_CONTACT_LEVEL_2),
+        mmr_enabled=config_data.get("mmr_enabled"),
+        mmr_top_k=config_data.get("mmr_top_k"),
+        mmr_lambda=config_data.get("mmr_lambda"),
+        mmr_similarity_cap=config_data.get("mmr_similarity_cap"),
     )
     db.add(config)
     db.commit()
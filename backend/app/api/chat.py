@@ -1,18 +1,23 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import List, Optional, Tuple
 from pydantic import BaseModel, EmailStr
 from app.database import get_db
 from app.models import Conversation, WidgetConfig, User
 from app.schemas import ChatMessage, ChatResponse, ConversationHistoryItem, TranslateRequest, TranslateResponse, SuggestedQuestionsResponse
-from app.services import generate_chat_response, should_capture_lead, translate_text, stream_chat_response, persist_conversation, get_suggested_questions
+from app.services import generate_chat_response, should_capture_lead, translate_text, stream_chat_response, persist_conversation, get_suggested_questions, remember_answer, run_blocking
+from app.services.answer_cache import iter_answer_tokens
+from app.services.suggestion_cache import suggestion_cache
 from app.services.limits_service import get_effective_limits
-from app.services.limits_service import get_effective_limits, get_or_create_subscription_usage, increment_usage
+from app.services.limits_service import get_effective_limits, get_or_create_subscription_usage, increment_usage, get_prompt_token_budget
+from app.services.context_selection import TokenBudgetExceeded
+from app.config import settings
 from app.services.email_service import send_conversation_email
 from app.auth import get_current_user, get_current_user_optional
 import logging
 import json
+import anyio
 
 from app.services.shopify_service import handle_shopify_intent, verify_shopify_customer
 
@@ -27,30 +32,46 @@ class EmailConversationRequest(BaseModel):
     widget_id: Optional[str] = None
 
 
+def _suggestion_headers(etag: str) -> dict:
+    return {
+        "ETag": f'"{etag}"',
+        "Cache-Control": f"public, max-age={settings.SUGGESTED_QUESTIONS_MAX_AGE_SECONDS}",
+    }
+
+
 @router.get("/suggested-questions", response_model=SuggestedQuestionsResponse)
 async def suggested_questions(
     widget_id: str,
+    request: Request,
+    response: Response,
     db: Session = Depends(get_db),
     current_user = Depends(get_current_user_optional)
 ):
     try:
-        organization_id = None
         if widget_id:
-            widget_config = db.query(WidgetConfig).filter(
-                WidgetConfig.widget_id == widget_id
-            ).first()
-            if widget_config:
-                organization_id = widget_config.organization_id
-        elif current_user:
-            organization_id = current_user.organization_id
+            # Widget open path: precomputed list from memory, loaded from the database on a miss
+            entry = suggestion_cache.get(widget_id)
+            if entry is None:
+                entry = await run_blocking(suggestion_cache.load, widget_id, db)
+            if entry is None:
+                raise HTTPException(
+                    status_code=400,
+                    detail="Invalid widget_id or user not found. Please provide a valid widget_id or authenticate."
+                )
+            headers = _suggestion_headers(entry.etag)
+            if request.headers.get("if-none-match") == headers["ETag"]:
+                return Response(status_code=304, headers=headers)
+            response.headers.update(headers)
+            return SuggestedQuestionsResponse(questions=entry.questions)
 
+        organization_id = current_user.organization_id if current_user else None
         if organization_id is None:
             raise HTTPException(
                 status_code=400,
                 detail="Invalid widget_id or user not found. Please provide a valid widget_id or authenticate."
             )
 
-        questions = get_suggested_questions(widget_id, organization_id, db)
+        questions = await run_blocking(get_suggested_questions, widget_id, organization_id, db)
         return SuggestedQuestionsResponse(questions=questions)
     except HTTPException:
         raise
@@ -59,6 +80,93 @@ async def suggested_questions(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _load_chat_context(message: ChatMessage, db: Session, current_user) -> Tuple[int, User, dict, object]:
+    """Resolve the widget owner and enforce plan limits; returns (user_id, user, limits, usage)"""
+    # Get user_id from widget_id or authenticated user
+    user_id = None
+    if message.widget_id:
+        widget_config = db.query(WidgetConfig).filter(
+            WidgetConfig.widget_id == message.widget_id
+        ).first()
+        if widget_config:
+            user_id = widget_config.user_id
+    elif current_user:
+        # If authenticated admin user, use their ID
+        user_id = current_user.id
+
+    # If no user_id found, return error
+    if user_id is None:
+        raise HTTPException(
+            status_code=400,
+            detail="Invalid widget_id or user not found. Please provide a valid widget_id or authenticate."
+        )
+
+    # Resolve organization for scoping
+    user = db.query(User).filter(User.id == user_id).first()
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found for chat context")
+
+    limits = get_effective_limits(db, user.organization_id)
+    if not limits.get("subscription_active"):
+        raise HTTPException(status_code=403, detail="Subscription inactive or expired")
+
+    usage = get_or_create_subscription_usage(db, user.organization_id)
+    if not usage:
+        raise HTTPException(status_code=403, detail="Subscription inactive or expired")
+
+    word_count = len(message.message.split())
+    if limits.get("max_query_words") and word_count > limits["max_query_words"]:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Query exceeds max word limit of {limits['max_query_words']}",
+        )
+
+    if limits.get("monthly_conversation_limit") and usage.conversations_count >= limits["monthly_conversation_limit"]:
+        raise HTTPException(
+            status_code=403,
+            detail="Monthly conversation limit exceeded",
+        )
+
+    if limits.get("monthly_token_limit") and usage.tokens_used >= limits["monthly_token_limit"]:
+        raise HTTPException(
+            status_code=403,
+            detail={
+                "message": "Monthly token limit exceeded",
+                "tokens_used": usage.tokens_used,
+                "token_limit": limits["monthly_token_limit"],
+            },
+        )
+
+    return user_id, user, limits, usage
+
+
+def _record_chat_turn(
+    db: Session,
+    message: ChatMessage,
+    user_id: int,
+    organization_id: int,
+    response_text: str,
+    token_usage: dict
+) -> None:
+    persist_conversation(
+        db,
+        session_id=message.session_id,
+        widget_id=message.widget_id,
+        user_id=user_id,
+        organization_id=organization_id,
+        message=message.message,
+        response_text=response_text,
+        token_usage=token_usage
+    )
+    increment_usage(
+        db,
+        organization_id,
+        conversations_count=2,
+        messages_count=2,
+        tokens_used=token_usage.get("total_tokens", 0)
+    )
+
+
 @router.post("", response_model=ChatResponse)
 async def chat(
     message: ChatMessage,
@@ -67,67 +175,14 @@ async def chat(
 ):
     """Chat endpoint with RAG - uses user's knowledge base"""
     try:
-        # Get user_id from widget_id or authenticated user
-        user_id = None
-        if message.widget_id:
-            widget_config = db.query(WidgetConfig).filter(
-                WidgetConfig.widget_id == message.widget_id
-            ).first()
-            if widget_config:
-                user_id = widget_config.user_id
-        elif current_user:
-            # If authenticated admin user, use their ID
-            user_id = current_user.id
-        
-        # If no user_id found, return error
-        if user_id is None:
-            raise HTTPException(
-                status_code=400, 
-                detail="Invalid widget_id or user not found. Please provide a valid widget_id or authenticate."
-            )
-           
+        user_id, user, limits, usage = await run_blocking(_load_chat_context, message, db, current_user)
+
         use_shopify = False
         if message.customer_id and message.shop_domain:
             is_valid_customer  = await verify_shopify_customer(db, message.shop_domain, int(message.customer_id))
             use_shopify = is_valid_customer
             
         print(f"Shopify customer verified: {use_shopify}")
-        
-        # Resolve organization for scoping
-        user = db.query(User).filter(User.id == user_id).first()
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found for chat context")
-
-        limits = get_effective_limits(db, user.organization_id)
-        if not limits.get("subscription_active"):
-            raise HTTPException(status_code=403, detail="Subscription inactive or expired")
-
-        usage = get_or_create_subscription_usage(db, user.organization_id)
-        if not usage:
-            raise HTTPException(status_code=403, detail="Subscription inactive or expired")
-
-        word_count = len(message.message.split())
-        if limits.get("max_query_words") and word_count > limits["max_query_words"]:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Query exceeds max word limit of {limits['max_query_words']}",
-            )
-
-        if limits.get("monthly_conversation_limit") and usage.conversations_count >= limits["monthly_conversation_limit"]:
-            raise HTTPException(
-                status_code=403,
-                detail="Monthly conversation limit exceeded",
-            )
-
-        if limits.get("monthly_token_limit") and usage.tokens_used >= limits["monthly_token_limit"]:
-            raise HTTPException(
-                status_code=403,
-                detail={
-                    "message": "Monthly token limit exceeded",
-                    "tokens_used": usage.tokens_used,
-                    "token_limit": limits["monthly_token_limit"],
-                },
-            )
 
         # ----------------------
         # Generate Response
@@ -146,7 +201,7 @@ async def chat(
             )
         else:
             # Generate response with organization-scoped knowledge base
-            response_text, sources, token_usage = generate_chat_response(
+            response_text, sources, token_usage = await generate_chat_response(
                 message.message,
                 message.session_id,
                 message.widget_id,
@@ -155,10 +210,12 @@ async def chat(
                 db,
                 language_code=message.language_code,
                 language_label=message.language_label,
-                retrieval_message=message.retrieval_message
+                retrieval_message=message.retrieval_message,
+                prompt_token_budget=get_prompt_token_budget(limits, usage, settings.CHAT_MAX_COMPLETION_TOKENS)
             )
 
-            increment_usage(
+            await run_blocking(
+                increment_usage,
                 db,
                 user.organization_id,
                 conversations_count=2,
@@ -173,6 +230,15 @@ async def chat(
             )
     except HTTPException:
         raise
+    except TokenBudgetExceeded as e:
+        raise HTTPException(
+            status_code=403,
+            detail={
+                "message": "Prompt token budget exceeded",
+                "required_tokens": e.required_tokens,
+                "token_budget": e.budget,
+            },
+        )
     except Exception as e:
         logger.error(f"Error in chat endpoint: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -185,58 +251,9 @@ async def chat_stream(
     current_user = Depends(get_current_user_optional)
 ):
     try:
-        user_id = None
-        if message.widget_id:
-            widget_config = db.query(WidgetConfig).filter(
-                WidgetConfig.widget_id == message.widget_id
-            ).first()
-            if widget_config:
-                user_id = widget_config.user_id
-        elif current_user:
-            user_id = current_user.id
-
-        if user_id is None:
-            raise HTTPException(
-                status_code=400,
-                detail="Invalid widget_id or user not found. Please provide a valid widget_id or authenticate."
-            )
+        user_id, user, limits, usage = await run_blocking(_load_chat_context, message, db, current_user)
 
-        user = db.query(User).filter(User.id == user_id).first()
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found for chat context")
-
-        limits = get_effective_limits(db, user.organization_id)
-        if not limits.get("subscription_active"):
-            raise HTTPException(status_code=403, detail="Subscription inactive or expired")
-
-        usage = get_or_create_subscription_usage(db, user.organization_id)
-        if not usage:
-            raise HTTPException(status_code=403, detail="Subscription inactive or expired")
-
-        word_count = len(message.message.split())
-        if limits.get("max_query_words") and word_count > limits["max_query_words"]:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Query exceeds max word limit of {limits['max_query_words']}",
-            )
-
-        if limits.get("monthly_conversation_limit") and usage.conversations_count >= limits["monthly_conversation_limit"]:
-            raise HTTPException(
-                status_code=403,
-                detail="Monthly conversation limit exceeded",
-            )
-
-        if limits.get("monthly_token_limit") and usage.tokens_used >= limits["monthly_token_limit"]:
-            raise HTTPException(
-                status_code=403,
-                detail={
-                    "message": "Monthly token limit exceeded",
-                    "tokens_used": usage.tokens_used,
-                    "token_limit": limits["monthly_token_limit"],
-                },
-            )
-
-        stream, sources, escalation_fallback_text = stream_chat_response(
+        stream, sources, fallback_text, cache_probe = await stream_chat_response(
             message.message,
             message.session_id,
             message.widget_id,
@@ -245,19 +262,23 @@ async def chat_stream(
             db,
             language_code=message.language_code,
             language_label=message.language_label,
-            retrieval_message=message.retrieval_message
+            retrieval_message=message.retrieval_message,
+            prompt_token_budget=get_prompt_token_budget(limits, usage, settings.CHAT_MAX_COMPLETION_TOKENS)
         )
 
-        def event_generator():
+        async def event_generator():
             collected_parts = []
             usage_tokens = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+            stream_completed = False
             try:
                 if stream is None:
-                    fallback_text = escalation_fallback_text or "Sorry—I don’t have a reliable answer for this right now."
-                    collected_parts.append(fallback_text)
-                    yield f"data: {{\"type\": \"token\", \"text\": {json.dumps(fallback_text)} }}\n\n"
+                    # Semantic-cache hit or escalation message: replay it as tokens
+                    replay_text = fallback_text or "Sorry—I don’t have a reliable answer for this right now."
+                    for token in iter_answer_tokens(replay_text):
+                        collected_parts.append(token)
+                        yield f"data: {{\"type\": \"token\", \"text\": {json.dumps(token)} }}\n\n"
                 else:
-                    for chunk in stream:
+                    async for chunk in stream:
                         if getattr(chunk, "usage", None):
                             usage = chunk.usage
                             usage_tokens = {
@@ -273,30 +294,39 @@ async def chat_stream(
                         if delta:
                             collected_parts.append(delta)
                             yield f"data: {{\"type\": \"token\", \"text\": {json.dumps(delta)} }}\n\n"
+                    stream_completed = True
             finally:
                 full_text = "".join(collected_parts)
-                persist_conversation(
-                    db,
-                    session_id=message.session_id,
-                    widget_id=message.widget_id,
-                    user_id=user_id,
-                    organization_id=user.organization_id,
-                    message=message.message,
-                    response_text=full_text,
-                    token_usage=usage_tokens
-                )
-                increment_usage(
-                    db,
-                    user.organization_id,
-                    conversations_count=2,
-                    messages_count=2,
-                    tokens_used=usage_tokens.get("total_tokens", 0)
-                )
-                yield f"data: {{\"type\": \"done\", \"sources\": {json.dumps(sources)} }}\n\n"
+                if stream_completed:
+                    remember_answer(cache_probe, full_text, sources)
+                # Shielded so a client disconnect cannot cancel closing the
+                # upstream stream or recording the turn and its usage
+                with anyio.CancelScope(shield=True):
+                    if stream is not None and not stream_completed:
+                        await stream.close()
+                    await run_blocking(
+                        _record_chat_turn,
+                        db,
+                        message,
+                        user_id,
+                        user.organization_id,
+                        full_text,
+                        usage_tokens
+                    )
+            yield f"data: {{\"type\": \"done\", \"sources\": {json.dumps(sources)} }}\n\n"
 
         return StreamingResponse(event_generator(), media_type="text/event-stream")
     except HTTPException:
         raise
+    except TokenBudgetExceeded as e:
+        raise HTTPException(
+            status_code=403,
+            detail={
+                "message": "Prompt token budget exceeded",
+                "required_tokens": e.required_tokens,
+                "token_budget": e.budget,
+            },
+        )
     except Exception as e:
         logger.error(f"Error in chat stream endpoint: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -328,7 +358,7 @@ async def translate(
         if not limits.get("multilingual_text_enabled", False):
             raise HTTPException(status_code=403, detail="Multilingual text support is disabled")
 
-        translated = translate_text(
+        translated = await translate_text(
             request.text,
             target_language_code=request.target_language_code,
             target_language_label=request.target_language_label
@@ -1,20 +1,24 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, BackgroundTasks, Form
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
 from sqlalchemy.orm import Session
-from typing import List, Dict
+from typing import BinaryIO, List, Dict, Optional
 from pydantic import BaseModel
+from app.config import settings
 from app.database import get_db
 from app.auth import require_admin
-from app.models import User, KnowledgeSource, SourceType
+from app.models import User, KnowledgeSource, SourceType, IngestionJob
 from app.schemas import (
     KnowledgeSourceResponse,
     WebCrawlRequest,
-    DocumentUploadResponse,
-    WebCrawlResponse
+    IngestionJobResponse,
 )
-from app.services import ingest_web_content, ingest_document, ingest_text_content, delete_knowledge_source
-from app.services.limits_service import get_effective_limits, get_or_create_subscription_usage, increment_usage
+from app.services import delete_knowledge_source, run_blocking
+from app.services.ingestion_jobs import ACTIVE_STATUSES, cancel_job, enqueue_job, pending_job_totals, stage_upload
+from app.services.limits_service import get_effective_limits, get_or_create_subscription_usage
 from app.services.rag import chroma_client
+import json
 import logging
+import os
+import zipfile
 
 logger = logging.getLogger(__name__)
 
@@ -27,14 +31,67 @@ class TextIngestRequest(BaseModel):
     content: str
 
 
-@router.post("/crawl", response_model=WebCrawlResponse)
+def _job_response(job: IngestionJob) -> IngestionJobResponse:
+    progress = json.loads(job.progress) if job.progress else {}
+    written = progress.get("chunks_written", 0)
+    return IngestionJobResponse(
+        id=job.id,
+        widget_id=job.widget_id,
+        job_type=job.job_type,
+        status=job.status,
+        stage=job.stage,
+        progress=progress,
+        embedding_hit_ratio=(progress.get("embeddings_reused", 0) / written) if written else None,
+        result=json.loads(job.result) if job.result else None,
+        error=job.error,
+        cancel_requested=job.cancel_requested,
+        attempts=job.attempts,
+        created_at=job.created_at,
+        started_at=job.started_at,
+        finished_at=job.finished_at,
+    )
+
+
+def _source_type_for(filename: str) -> Optional[SourceType]:
+    filename = filename.lower()
+    if filename.endswith('.pdf'):
+        return SourceType.PDF
+    if filename.endswith(('.docx', '.doc')):
+        return SourceType.DOCX
+    if filename.endswith(('.xlsx', '.xls')):
+        return SourceType.XLSX
+    return None
+
+
+def _check_document_limits(db: Session, organization_id: int, size_bytes: int, limits: dict, usage, label: str) -> None:
+    max_bytes = limits["max_document_size_mb"] * 1024 * 1024
+    if size_bytes > max_bytes:
+        raise HTTPException(
+            status_code=400,
+            detail=f"{label} size exceeds {limits['max_document_size_mb']} MB limit",
+        )
+
+    # Jobs still in the queue count against the limit they will consume
+    pending = pending_job_totals(db, organization_id)
+    if usage.documents_count + pending["documents"] >= limits["monthly_document_limit"]:
+        raise HTTPException(
+            status_code=403,
+            detail="Monthly document limit exceeded",
+        )
+
+
+def _discard_staged(path: Optional[str]) -> None:
+    if path and os.path.exists(path):
+        os.remove(path)
+
+
+@router.post("/crawl", response_model=IngestionJobResponse, status_code=202)
 async def crawl_website(
     request: WebCrawlRequest,
-    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     current_user: User = Depends(require_admin)
 ):
-    """Crawl website and ingest content for the current user"""
+    """Queue a website crawl for the current user; poll /jobs/{id} for progress"""
     try:
         limits = get_effective_limits(db, current_user.organization_id)
         if not limits.get("subscription_active"):
@@ -50,45 +107,39 @@ async def crawl_website(
                 detail=f"Max crawl depth exceeded. Limit is {limits['max_crawl_depth']}",
             )
 
-        remaining_pages = limits["monthly_crawl_pages_limit"] - usage.crawl_pages_count
+        pending = pending_job_totals(db, current_user.organization_id)
+        remaining_pages = limits["monthly_crawl_pages_limit"] - usage.crawl_pages_count - pending["crawl_pages"]
         if request.max_pages > remaining_pages:
             raise HTTPException(
                 status_code=403,
-                detail=f"Monthly crawl page limit exceeded. Remaining pages: {remaining_pages}",
+                detail=f"Monthly crawl page limit exceeded. Remaining pages: {max(remaining_pages, 0)}",
             )
 
-        source, pages_crawled, pages_scanned = ingest_web_content(
-            request.url,
-            request.max_pages,
-            request.max_depth,
+        job = enqueue_job(
+            db,
+            "crawl",
+            current_user.organization_id,
             current_user.id,
             request.widget_id,
-            db,
-        )
-
-        increment_usage(db, current_user.organization_id, crawl_pages_count=pages_crawled)
-        unchanged = pages_crawled == 0
-        message = "No changes detected. Page already embedded." if unchanged else f"Crawled {pages_crawled} updated pages."
-        return WebCrawlResponse(
-            source=source,
-            pages_crawled=pages_crawled,
-            pages_scanned=pages_scanned,
-            unchanged=unchanged,
-            message=message
+            {"url": request.url, "max_pages": request.max_pages, "max_depth": request.max_depth},
         )
+        return _job_response(job)
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error crawling website: {str(e)}")
+        logger.error(f"Error queueing crawl: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.post("/upload", response_model=DocumentUploadResponse)
+@router.post("/upload", response_model=IngestionJobResponse, status_code=202)
 async def upload_document(
     file: UploadFile = File(...),
     widget_id: str = Form(...),
     db: Session = Depends(get_db),
     current_user: User = Depends(require_admin)
 ):
-    """Upload and ingest document for the current user"""
+    """Queue an uploaded document for ingestion; poll /jobs/{id} for progress"""
+    staged_path = None
     try:
         limits = get_effective_limits(db, current_user.organization_id)
         if not limits.get("subscription_active"):
@@ -99,58 +150,186 @@ async def upload_document(
             raise HTTPException(status_code=403, detail="Subscription inactive or expired")
 
         # Determine file type
-        filename = file.filename.lower()
-        if filename.endswith('.pdf'):
-            source_type = SourceType.PDF
-        elif filename.endswith(('.docx', '.doc')):
-            source_type = SourceType.DOCX
-        elif filename.endswith(('.xlsx', '.xls')):
-            source_type = SourceType.XLSX
-        else:
+        source_type = _source_type_for(file.filename)
+        if source_type is None:
             raise HTTPException(status_code=400, detail="Unsupported file type")
         
-        # Read file content
-        content = await file.read()
-
+        # The worker reads the file from disk, so the request does not hold it;
+        # the copy runs off the event loop and stops at the size limit
         max_bytes = limits["max_document_size_mb"] * 1024 * 1024
-        if len(content) > max_bytes:
+        staged_path = await run_blocking(stage_upload, file.file, file.filename, max_bytes)
+        if staged_path is None:
             raise HTTPException(
                 status_code=400,
                 detail=f"Document size exceeds {limits['max_document_size_mb']} MB limit",
             )
+        _check_document_limits(db, current_user.organization_id, os.path.getsize(staged_path), limits, usage, "Document")
 
-        if usage.documents_count >= limits["monthly_document_limit"]:
+        job = enqueue_job(
+            db,
+            "document",
+            current_user.organization_id,
+            current_user.id,
+            widget_id,
+            {"filename": file.filename, "source_type": source_type.value, "staged_path": staged_path},
+        )
+        staged_path = None  # the job owns the file now
+        return _job_response(job)
+    except HTTPException:
+        _discard_staged(staged_path)
+        raise
+    except Exception as e:
+        _discard_staged(staged_path)
+        logger.error(f"Error uploading document: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+class _BulkStager:
+    """Stages the files of one bulk upload as they are read.
+
+    The request is rejected as soon as it holds more than `max_files`
+    supported files or `max_total_bytes` in total, before the rest of the
+    upload is read or decompressed.
+    """
+    def __init__(self, max_bytes: int, max_files: int, max_total_bytes: int):
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self.max_total_bytes = max_total_bytes
+        self.total_bytes = 0
+        self.files: List[Dict] = []
+        self.skipped: List[Dict] = []
+
+    def stage(self, stream: BinaryIO, filename: str, source_type: SourceType) -> bool:
+        """Copy one file to the staging directory; False if it exceeds the per-file limit"""
+        if len(self.files) >= self.max_files:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Too many files; the limit per upload is {self.max_files}",
+            )
+        remaining = self.max_total_bytes - self.total_bytes
+        path = stage_upload(stream, filename, max_bytes=min(self.max_bytes, remaining))
+        if path is None:
+            if remaining < self.max_bytes:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Upload exceeds the {self.max_total_bytes // (1024 * 1024)} MB limit per request",
+                )
+            return False
+        self.total_bytes += os.path.getsize(path)
+        self.files.append({"filename": filename, "source_type": source_type.value, "staged_path": path})
+        return True
+
+    def discard(self) -> None:
+        for f in self.files:
+            _discard_staged(f["staged_path"])
+        self.files = []
+
+
+def _stage_zip_members(stager: _BulkStager, stream: BinaryIO, archive_name: str) -> None:
+    """Stage the supported files inside a ZIP upload one member at a time; runs off the event loop"""
+    try:
+        archive = zipfile.ZipFile(stream)
+    except zipfile.BadZipFile:
+        raise HTTPException(status_code=400, detail=f"{archive_name} is not a valid ZIP archive")
+    with archive:
+        for member in archive.infolist():
+            name = os.path.basename(member.filename)
+            if member.is_dir() or not name or name.startswith(".") or member.filename.startswith("__MACOSX/"):
+                continue
+            source_type = _source_type_for(name)
+            if source_type is None:
+                stager.skipped.append({"filename": name, "error": "Unsupported file type"})
+                continue
+            if member.file_size > stager.max_bytes:
+                stager.skipped.append({"filename": name, "error": "Document size exceeds limit"})
+                continue
+            # Don't trust the declared size of a compressed member: the copy
+            # stops at the limit
+            with archive.open(member) as f:
+                if not stager.stage(f, name, source_type):
+                    stager.skipped.append({"filename": name, "error": "Document size exceeds limit"})
+
+
+@router.post("/upload/bulk", response_model=IngestionJobResponse, status_code=202)
+async def upload_documents_bulk(
+    files: List[UploadFile] = File(...),
+    widget_id: str = Form(...),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_admin)
+):
+    """Queue many documents, or ZIP archives of them, as one ingestion job.
+
+    The whole batch is checked against the monthly document limit at once;
+    the job result lists the outcome of every file.
+    """
+    stager = None
+    try:
+        limits = get_effective_limits(db, current_user.organization_id)
+        if not limits.get("subscription_active"):
+            raise HTTPException(status_code=403, detail="Subscription inactive or expired")
+
+        usage = get_or_create_subscription_usage(db, current_user.organization_id)
+        if not usage:
+            raise HTTPException(status_code=403, detail="Subscription inactive or expired")
+
+        stager = _BulkStager(
+            limits["max_document_size_mb"] * 1024 * 1024,
+            settings.BULK_UPLOAD_MAX_FILES,
+            settings.BULK_UPLOAD_MAX_TOTAL_MB * 1024 * 1024,
+        )
+        for upload in files:
+            if upload.filename.lower().endswith(".zip"):
+                await run_blocking(_stage_zip_members, stager, upload.file, upload.filename)
+                continue
+            source_type = _source_type_for(upload.filename)
+            if source_type is None:
+                raise HTTPException(status_code=400, detail=f"Unsupported file type: {upload.filename}")
+            if not await run_blocking(stager.stage, upload.file, upload.filename, source_type):
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"{upload.filename} exceeds {limits['max_document_size_mb']} MB limit",
+                )
+
+        if not stager.files:
+            raise HTTPException(status_code=400, detail="No supported documents in upload")
+
+        # One reservation for the whole batch, including jobs still in the queue
+        pending = pending_job_totals(db, current_user.organization_id)
+        remaining = limits["monthly_document_limit"] - usage.documents_count - pending["documents"]
+        if len(stager.files) > remaining:
             raise HTTPException(
                 status_code=403,
-                detail="Monthly document limit exceeded",
+                detail=f"Monthly document limit exceeded. Remaining documents: {max(remaining, 0)}",
             )
-        
-        # Ingest document
-        source = ingest_document(content, file.filename, source_type, current_user.id, widget_id, db)
 
-        increment_usage(db, current_user.organization_id, documents_count=1)
-        
-        return DocumentUploadResponse(
-            id=source.id,
-            name=source.name,
-            source_type=source.source_type.value,
-            status=source.status,
-            widget_id=source.widget_id or widget_id,
+        job = enqueue_job(
+            db,
+            "bulk",
+            current_user.organization_id,
+            current_user.id,
+            widget_id,
+            {"files": stager.files, "skipped": stager.skipped},
         )
+        stager = None  # the job owns the files now
+        return _job_response(job)
     except HTTPException:
+        if stager:
+            stager.discard()
         raise
     except Exception as e:
-        logger.error(f"Error uploading document: {str(e)}")
+        if stager:
+            stager.discard()
+        logger.error(f"Error queueing bulk upload: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@router.post("/ingest-text", response_model=DocumentUploadResponse)
+@router.post("/ingest-text", response_model=IngestionJobResponse, status_code=202)
 async def ingest_text(
     request: TextIngestRequest,
     db: Session = Depends(get_db),
     current_user: User = Depends(require_admin)
 ):
-    """Ingest raw text content (used for knowledge gap suggestions)."""
+    """Queue raw text content for ingestion (used for knowledge gap suggestions)."""
     try:
         limits = get_effective_limits(db, current_user.organization_id)
         if not limits.get("subscription_active"):
@@ -160,30 +339,20 @@ async def ingest_text(
         if not usage:
             raise HTTPException(status_code=403, detail="Subscription inactive or expired")
 
-        max_bytes = limits["max_document_size_mb"] * 1024 * 1024
         content_bytes = len((request.content or "").encode("utf-8"))
-        if content_bytes > max_bytes:
-            raise HTTPException(
-                status_code=400,
-                detail=f"Content size exceeds {limits['max_document_size_mb']} MB limit",
-            )
-
-        if usage.documents_count >= limits["monthly_document_limit"]:
-            raise HTTPException(
-                status_code=403,
-                detail="Monthly document limit exceeded",
-            )
+        _check_document_limits(db, current_user.organization_id, content_bytes, limits, usage, "Content")
+        if not request.content or not request.content.strip():
+            raise HTTPException(status_code=400, detail="Text content is empty")
 
-        source = ingest_text_content(request.content, request.title, current_user.id, request.widget_id, db)
-        increment_usage(db, current_user.organization_id, documents_count=1)
-
-        return DocumentUploadResponse(
-            id=source.id,
-            name=source.name,
-            source_type=source.source_type.value,
-            status=source.status,
-            widget_id=source.widget_id or request.widget_id,
+        job = enqueue_job(
+            db,
+            "text",
+            current_user.organization_id,
+            current_user.id,
+            request.widget_id,
+            {"title": request.title, "content": request.content},
         )
+        return _job_response(job)
     except HTTPException:
         raise
     except Exception as e:
@@ -191,6 +360,55 @@ async def ingest_text(
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _get_org_job(job_id: int, db: Session, current_user: User) -> IngestionJob:
+    job = db.query(IngestionJob).filter(
+        IngestionJob.id == job_id,
+        IngestionJob.organization_id == current_user.organization_id,
+    ).first()
+    if not job:
+        raise HTTPException(status_code=404, detail="Ingestion job not found")
+    return job
+
+
+@router.get("/jobs", response_model=List[IngestionJobResponse])
+async def list_jobs(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_admin),
+    widget_id: str = None,
+    active_only: bool = False,
+    limit: int = 50,
+):
+    """List the organization's ingestion jobs, newest first"""
+    query = db.query(IngestionJob).filter(IngestionJob.organization_id == current_user.organization_id)
+    if widget_id:
+        query = query.filter(IngestionJob.widget_id == widget_id)
+    if active_only:
+        query = query.filter(IngestionJob.status.in_(ACTIVE_STATUSES))
+    jobs = query.order_by(IngestionJob.id.desc()).limit(min(max(limit, 1), 200)).all()
+    return [_job_response(job) for job in jobs]
+
+
+@router.get("/jobs/{job_id}", response_model=IngestionJobResponse)
+async def get_job(
+    job_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_admin)
+):
+    """Status, stage and per-stage counters of an ingestion job"""
+    return _job_response(_get_org_job(job_id, db, current_user))
+
+
+@router.post("/jobs/{job_id}/cancel", response_model=IngestionJobResponse)
+async def cancel_ingestion_job(
+    job_id: int,
+    db: Session = Depends(get_db),
+    current_user: User = Depends(require_admin)
+):
+    """Cancel a queued job, or stop a running one at its next checkpoint"""
+    job = _get_org_job(job_id, db, current_user)
+    return _job_response(cancel_job(db, job))
+
+
 @router.get("/sources", response_model=List[KnowledgeSourceResponse])
 async def list_sources(
     db: Session = Depends(get_db),
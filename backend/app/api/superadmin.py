@@ -443,3 +443,28 @@ async def superadmin_analytics_by_org(
         })
 
     return data
+
+
+@router.get("/performance")
+async def superadmin_performance_stats(
+    superadmin: SuperAdmin = Depends(require_superadmin)
+):
+    """Process-level retrieval and caching counters for this worker."""
+    from app.services.embeddings import get_embedding_cache_stats, get_embedding_scheduler_stats
+    from app.services.answer_cache import answer_cache
+    from app.services.suggestion_cache import suggestion_cache
+    from app.services.ingestion_jobs import ingestion_workers
+    from app.services.chunk_embedding_store import chunk_embedding_store
+    from app.services.context_selection import context_token_stats
+    from app.services.rag import chroma_client
+
+    return {
+        "embedding_cache": get_embedding_cache_stats(),
+        "embedding_scheduler": get_embedding_scheduler_stats(),
+        "answer_cache": answer_cache.stats(),
+        "suggestion_cache": suggestion_cache.stats(),
+        "ingestion_queue": ingestion_workers.stats(),
+        "chunk_embedding_store": chunk_embedding_store.stats(),
+        "vector_store": chroma_client.stats(),
+        "context_tokens": context_token_stats.stats(),
+    }
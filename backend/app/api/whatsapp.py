@@ -8,8 +8,15 @@ from sqlalchemy.orm import Session
 from app.auth import require_admin
 from app.database import get_db
 from app.models import User, WidgetConfig, WhatsAppChannel
+from app.config import settings
 from app.services.chat_service import generate_chat_response
-from app.services.limits_service import get_effective_limits, increment_usage
+from app.services.context_selection import TokenBudgetExceeded
+from app.services.limits_service import (
+    get_effective_limits,
+    get_or_create_subscription_usage,
+    get_prompt_token_budget,
+    increment_usage,
+)
 from app.services.whatsapp_service import (
     send_whatsapp_text_message,
     verify_meta_signature,
@@ -229,14 +236,21 @@ async def receive_whatsapp_webhook(
 
                 session_id = f"wa:{channel.organization_id}:{from_number}"
 
-                response_text, _sources, token_usage = generate_chat_response(
-                    text_body,
-                    session_id,
-                    channel.widget_id,
-                    user.id,
-                    channel.organization_id,
-                    db,
-                )
+                usage = get_or_create_subscription_usage(db, channel.organization_id)
+                try:
+                    response_text, _sources, token_usage = await generate_chat_response(
+                        text_body,
+                        session_id,
+                        channel.widget_id,
+                        user.id,
+                        channel.organization_id,
+                        db,
+                        prompt_token_budget=get_prompt_token_budget(limits, usage, settings.CHAT_MAX_COMPLETION_TOKENS),
+                    )
+                except TokenBudgetExceeded:
+                    # Same pre-flight check as the chat endpoints; no reply once the budget is spent
+                    ignored += 1
+                    continue
 
                 increment_usage(
                     db,
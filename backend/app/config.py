@@ -8,6 +8,34 @@ class Settings(BaseSettings):
     EMBEDDING_MODEL: str = "text-embedding-ada-002"
     USE_LOCAL_EMBEDDINGS: bool = True
     LOCAL_EMBEDDING_MODEL: str = "all-MiniLM-L6-v2"
+    # "torch" (sentence-transformers) or "onnx" (model exported by app.services.onnx_export)
+    LOCAL_EMBEDDING_RUNTIME: str = "torch"
+    ONNX_EMBEDDING_MODEL_DIR: str = "./data/onnx/all-MiniLM-L6-v2"
+    ONNX_EMBEDDING_QUANTIZED: bool = True
+    ONNX_EMBEDDING_THREADS: int = 0
+    EMBEDDING_CACHE_SIZE: int = 5000
+    EMBEDDING_CACHE_TTL_SECONDS: int = 3600
+    # Unix socket of the shared embedding server; empty loads the model in every worker
+    EMBEDDING_SERVER_SOCKET: str = ""
+    EMBEDDING_SERVER_TIMEOUT_SECONDS: float = 30.0
+    # Local-model scheduler: query micro-batches and ingestion chunk size
+    EMBEDDING_BATCH_MAX_SIZE: int = 64
+    EMBEDDING_BATCH_MAX_WAIT_MS: float = 5.0
+    EMBEDDING_BULK_CHUNK_SIZE: int = 32
+    ANSWER_CACHE_ENABLED: bool = True
+    ANSWER_CACHE_MAX_DISTANCE: float = 0.08
+    ANSWER_CACHE_MAX_ENTRIES_PER_WIDGET: int = 500
+    ANSWER_CACHE_TTL_SECONDS: int = 86400
+    SUGGESTED_QUESTIONS_REFRESH_SECONDS: int = 300  # re-read the stored list per worker
+    SUGGESTED_QUESTIONS_MAX_AGE_SECONDS: int = 300  # Cache-Control max-age sent to widgets
+    MMR_ENABLED: bool = True
+    MMR_TOP_K: int = 6
+    MMR_LAMBDA: float = 0.7
+    MMR_SIMILARITY_CAP: float = 0.92
+    CHAT_MODEL: str = "gpt-4o-mini"
+    CHAT_MAX_COMPLETION_TOKENS: int = 500
+    CHAT_BLOCKING_WORKERS: int = 16
+    TOKENIZER_ENCODING: str = "o200k_base"
     OUTCOME_CLASSIFICATION_MODEL: str = "gpt-4o-mini"
     OUTCOME_DAEMON_HOUR_UTC: int = 2
     OUTCOME_DAEMON_MINUTE_UTC: int = 15
@@ -20,7 +48,41 @@ class Settings(BaseSettings):
     # Database Configuration
     DATABASE_URL: str = "sqlite:///./chatbot.db"
     CHROMA_PERSIST_DIR: str = "./data/chroma"
+    CHROMA_MEMORY_BUDGET_MB: int = 1024  # 0 disables collection eviction
+    CHROMA_BYTES_PER_CHUNK_ESTIMATE: int = 3072
+    VECTOR_STORE_BACKEND: str = "chroma"  # "chroma" or "numpy"
+    VECTOR_WRITE_BATCH_SIZE: int = 256  # chunks embedded and written per vector-store call
+    # Chunk vectors keyed by (model, text hash), reused across re-crawls and widgets
+    CHUNK_EMBEDDING_STORE_ENABLED: bool = True
+    CHUNK_EMBEDDING_STORE_PATH: str = "./data/embeddings/chunks.db"
+    CHUNK_EMBEDDING_STORE_MAX_AGE_DAYS: int = 90  # prune vectors unused this long; 0 keeps all
+    NUMPY_STORE_DIR: str = "./data/vectors"
+    NUMPY_STORE_IVF_MIN_ROWS: int = 50000  # 0 keeps every tenant on flat search
+    NUMPY_STORE_IVF_NPROBE: int = 8
+    NUMPY_STORE_QUANTIZATION: str = "none"  # "none", "float16" or "int8"
+    NUMPY_STORE_RESCORE_FACTOR: int = 4  # float32 re-scoring shortlist = n_results * factor
+    LEXICAL_INDEX_PATH: str = "./data/lexical/index.db"
     UPLOAD_DIR: str = "./data/uploads"
+    # Large PDFs are split into page ranges parsed in a process pool; 0 workers parses in-process
+    PDF_PARSE_WORKERS: int = 4
+    PDF_PAGES_PER_TASK: int = 20
+    PDF_PARALLEL_MIN_PAGES: int = 40
+    # Web crawler: one pooled HTTP client per crawl, per-host concurrency adapts (AIMD) between 1 and the max
+    CRAWLER_MAX_CONCURRENCY: int = 16
+    CRAWLER_INITIAL_CONCURRENCY: int = 4
+    CRAWLER_MIN_REQUEST_INTERVAL_SECONDS: float = 0.0  # politeness spacing between requests to one host
+    CRAWLER_REQUEST_TIMEOUT_SECONDS: float = 10.0
+    CRAWLER_RESPECT_ROBOTS: bool = True  # robots.txt Disallow rules and Crawl-delay
+    CRAWLER_USE_SITEMAPS: bool = True  # seed the frontier from sitemap.xml; lastmod skips unchanged pages
+    BULK_UPLOAD_MAX_FILES: int = 200  # files per bulk request, ZIP members included
+    BULK_UPLOAD_MAX_TOTAL_MB: int = 500  # staged bytes per bulk request, after decompression
+    # Background ingestion queue (app.services.ingestion_jobs); 0 workers leaves it to dedicated processes
+    INGESTION_WORKERS: int = 3
+    INGESTION_MAX_JOBS_PER_ORG: int = 2
+    INGESTION_POLL_SECONDS: float = 2.0
+    INGESTION_HEARTBEAT_SECONDS: int = 30
+    INGESTION_JOB_STALE_SECONDS: int = 600
+    INGESTION_MAX_ATTEMPTS: int = 3
     EXPORT_DIR: str = "./data/exports"
     
     # JWT Configuration
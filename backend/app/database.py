@@ -59,6 +59,8 @@ def init_db():
                     conn.execute(text("ALTER TABLE organization_limits ADD COLUMN multilingual_text_enabled BOOLEAN"))
                 if "whatsapp_enabled" not in col_names:
                     conn.execute(text("ALTER TABLE organization_limits ADD COLUMN whatsapp_enabled BOOLEAN"))
+                if "max_prompt_tokens" not in col_names:
+                    conn.execute(text("ALTER TABLE organization_limits ADD COLUMN max_prompt_tokens INTEGER"))
             except Exception:
                 # If table doesn't exist yet, create_all already handled it
                 pass
@@ -72,6 +74,8 @@ def init_db():
                     conn.execute(text("ALTER TABLE plans ADD COLUMN multilingual_text_enabled BOOLEAN DEFAULT 0"))
                 if "whatsapp_enabled" not in col_names:
                     conn.execute(text("ALTER TABLE plans ADD COLUMN whatsapp_enabled BOOLEAN DEFAULT 0"))
+                if "max_prompt_tokens" not in col_names:
+                    conn.execute(text("ALTER TABLE plans ADD COLUMN max_prompt_tokens INTEGER DEFAULT 3000"))
             except Exception:
                 pass
 
@@ -98,6 +102,14 @@ def init_db():
                     conn.execute(text("ALTER TABLE widget_configs ADD COLUMN escalation_contact_level_1 TEXT"))
                 if "escalation_contact_level_2" not in col_names:
                     conn.execute(text("ALTER TABLE widget_configs ADD COLUMN escalation_contact_level_2 TEXT"))
+                if "mmr_enabled" not in col_names:
+                    conn.execute(text("ALTER TABLE widget_configs ADD COLUMN mmr_enabled BOOLEAN"))
+                if "mmr_top_k" not in col_names:
+                    conn.execute(text("ALTER TABLE widget_configs ADD COLUMN mmr_top_k INTEGER"))
+                if "mmr_lambda" not in col_names:
+                    conn.execute(text("ALTER TABLE widget_configs ADD COLUMN mmr_lambda FLOAT"))
+                if "mmr_similarity_cap" not in col_names:
+                    conn.execute(text("ALTER TABLE widget_configs ADD COLUMN mmr_similarity_cap FLOAT"))
             except Exception:
                 pass
 
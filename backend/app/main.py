@@ -6,6 +6,7 @@ from app.api import admin_router, knowledge_router, chat_router, leads_router, o
 from app.api.feedback import router as feedback_router
 from app.api.reports import router as reports_router
 from app.services.conversation_outcome_service import run_daily_outcome_daemon
+from app.services.ingestion_jobs import ingestion_workers
 import logging
 import asyncio
 
@@ -68,6 +69,8 @@ async def startup_event():
     outcome_daemon_task = asyncio.create_task(run_daily_outcome_daemon(outcome_daemon_stop_event))
     logger.info("Conversation outcome daemon started")
 
+    ingestion_workers.start()
+
     logger.info("✅ Backend is ready!")
 
 
@@ -76,6 +79,7 @@ async def shutdown_event():
     """Gracefully stop background tasks"""
     global outcome_daemon_task
     outcome_daemon_stop_event.set()
+    ingestion_workers.stop()
     if outcome_daemon_task:
         try:
             await outcome_daemon_task
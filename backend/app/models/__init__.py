@@ -6,9 +6,12 @@ from app.models.plan import Plan
 from app.models.organization_subscription import OrganizationSubscription
 from app.models.organization_subscription_usage import OrganizationSubscriptionUsage
 from app.models.knowledge_source import KnowledgeSource, SourceType
+from app.models.ingestion_job import IngestionJob
+from app.models.crawl_page_state import CrawlPageState
 from app.models.conversation import Conversation
 from app.models.lead import Lead
 from app.models.widget_config import WidgetConfig
+from app.models.widget_suggestions import WidgetSuggestions
 from app.models.feedback import MessageFeedback
 from app.models.report_metrics import ConversationMetrics
 from app.models.whatsapp_channel import WhatsAppChannel
@@ -25,9 +28,12 @@ __all__ = [
     "OrganizationSubscriptionUsage",
     "KnowledgeSource",
     "SourceType",
+    "IngestionJob",
+    "CrawlPageState",
     "Conversation",
     "Lead",
     "WidgetConfig",
+    "WidgetSuggestions",
     "MessageFeedback",
     "ConversationMetrics",
     "WhatsAppChannel",
@@ -0,0 +1,18 @@
+from sqlalchemy import Column, Integer, String, DateTime, Float, ForeignKey, UniqueConstraint
+from sqlalchemy.sql import func
+from app.database import Base
+
+
+class CrawlPageState(Base):
+    """Per-URL re-crawl state of a web source (see `crawl_state`)"""
+    __tablename__ = "crawl_page_states"
+    __table_args__ = (UniqueConstraint("source_id", "url", name="uq_crawl_page_states_source_url"),)
+
+    id = Column(Integer, primary_key=True, index=True)
+    source_id = Column(Integer, ForeignKey("knowledge_sources.id"), nullable=False)
+    url = Column(String, nullable=False)  # canonical URL (crawl_frontier.canonicalize_url)
+    content_hash = Column(String, nullable=True)
+    etag = Column(String, nullable=True)
+    last_modified = Column(String, nullable=True)  # Last-Modified header as sent by the site
+    last_crawled_at = Column(Float, nullable=True)  # unix time, compared with sitemap lastmod
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -0,0 +1,27 @@
+from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, ForeignKey
+from sqlalchemy.sql import func
+from app.database import Base
+
+
+class IngestionJob(Base):
+    """A queued crawl, document upload or text ingestion (see `ingestion_jobs`)"""
+    __tablename__ = "ingestion_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    organization_id = Column(Integer, ForeignKey("organizations.id"), nullable=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    widget_id = Column(String, nullable=False, index=True)
+    job_type = Column(String, nullable=False)  # crawl, document, text
+    status = Column(String, nullable=False, default="queued", index=True)  # queued, running, succeeded, failed, cancelled
+    payload = Column(Text, nullable=False)  # JSON: job arguments
+    stage = Column(String, nullable=True)
+    progress = Column(Text, nullable=True)  # JSON: per-stage counters
+    result = Column(Text, nullable=True)  # JSON: endpoint-shaped result on success
+    error = Column(Text, nullable=True)
+    cancel_requested = Column(Boolean, default=False, nullable=False)
+    attempts = Column(Integer, default=0, nullable=False)
+    worker_id = Column(String, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
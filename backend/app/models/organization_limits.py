@@ -18,6 +18,7 @@ class OrganizationLimits(Base):
     max_document_size_mb = Column(Integer, nullable=True)
     monthly_token_limit = Column(Integer, nullable=True)
     max_query_words = Column(Integer, nullable=True)
+    max_prompt_tokens = Column(Integer, nullable=True)
     lead_generation_enabled = Column(Boolean, nullable=True)
     voice_chat_enabled = Column(Boolean, nullable=True)
     multilingual_text_enabled = Column(Boolean, nullable=True)
@@ -20,6 +20,7 @@ class Plan(Base):
     max_document_size_mb = Column(Integer, default=20)
     monthly_token_limit = Column(Integer, default=200000)
     max_query_words = Column(Integer, default=200)
+    max_prompt_tokens = Column(Integer, default=3000)
     lead_generation_enabled = Column(Boolean, default=True)
     voice_chat_enabled = Column(Boolean, default=False)
     multilingual_text_enabled = Column(Boolean, default=False)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, Float, ForeignKey
 from sqlalchemy.sql import func
 from app.database import Base
 
@@ -20,5 +20,10 @@ class WidgetConfig(Base):
     lead_fields = Column(Text, nullable=True)  # JSON array string
     escalation_contact_level_1 = Column(Text, nullable=True)
     escalation_contact_level_2 = Column(Text, nullable=True)
+    # Context diversification (nullable => use global MMR_* settings)
+    mmr_enabled = Column(Boolean, nullable=True)
+    mmr_top_k = Column(Integer, nullable=True)
+    mmr_lambda = Column(Float, nullable=True)
+    mmr_similarity_cap = Column(Float, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
@@ -0,0 +1,17 @@
+from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey
+from sqlalchemy.sql import func
+from app.database import Base
+
+
+class WidgetSuggestions(Base):
+    """Precomputed suggested questions for one widget (see `suggestion_cache`)"""
+    __tablename__ = "widget_suggestions"
+
+    id = Column(Integer, primary_key=True, index=True)
+    widget_id = Column(String, unique=True, index=True, nullable=False)
+    organization_id = Column(Integer, ForeignKey("organizations.id"), nullable=True, index=True)
+    questions = Column(Text, nullable=False)  # JSON array string
+    knowledge_version = Column(String, nullable=True)  # answer_cache.knowledge_version() when computed
+    etag = Column(String, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -4,6 +4,9 @@ from app.schemas.knowledge import (
     WebCrawlRequest,
     WebCrawlResponse,
     DocumentUploadResponse,
+    BulkUploadFileResult,
+    BulkUploadResponse,
+    IngestionJobResponse,
 )
 from app.schemas.chat import (
     ChatMessage,
@@ -51,6 +54,9 @@ __all__ = [
     "WebCrawlRequest",
     "WebCrawlResponse",
     "DocumentUploadResponse",
+    "BulkUploadFileResult",
+    "BulkUploadResponse",
+    "IngestionJobResponse",
     "ChatMessage",
     "ChatResponse",
     "ConversationHistoryItem",
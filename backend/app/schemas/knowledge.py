@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Any, Dict, Optional, List
 from datetime import datetime
 
 
@@ -45,3 +45,33 @@ class DocumentUploadResponse(BaseModel):
     source_type: str
     status: str
     widget_id: str
+
+
+class BulkUploadFileResult(BaseModel):
+    filename: str
+    status: str  # succeeded, failed, skipped
+    source_id: Optional[int] = None
+    chunks: int = 0
+    error: Optional[str] = None
+
+
+class BulkUploadResponse(BaseModel):
+    documents_ingested: int
+    files: List[BulkUploadFileResult]
+
+
+class IngestionJobResponse(BaseModel):
+    id: int
+    widget_id: str
+    job_type: str
+    status: str
+    stage: Optional[str] = None
+    progress: Dict[str, int] = {}
+    embedding_hit_ratio: Optional[float] = None  # share of written chunks whose vector was reused
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    cancel_requested: bool
+    attempts: int
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
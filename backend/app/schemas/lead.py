@@ -39,6 +39,10 @@ class WidgetConfigBase(BaseModel):
     position: str = "bottom-right"
     lead_capture_enabled: bool = True
     lead_fields: Optional[str] = None
+    mmr_enabled: Optional[bool] = None
+    mmr_top_k: Optional[int] = None
+    mmr_lambda: Optional[float] = None
+    mmr_similarity_cap: Optional[float] = None
 
 
 class WidgetConfigCreate(WidgetConfigBase):
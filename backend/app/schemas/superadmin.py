@@ -29,6 +29,7 @@ class OrganizationLimitsBase(BaseModel):
     max_document_size_mb: Optional[int] = None
     monthly_token_limit: Optional[int] = None
     max_query_words: Optional[int] = None
+    max_prompt_tokens: Optional[int] = None
     lead_generation_enabled: Optional[bool] = None
     voice_chat_enabled: Optional[bool] = None
     multilingual_text_enabled: Optional[bool] = None
@@ -43,6 +44,7 @@ class OrganizationLimitsUpdate(BaseModel):
     max_document_size_mb: Optional[int] = None
     monthly_token_limit: Optional[int] = None
     max_query_words: Optional[int] = None
+    max_prompt_tokens: Optional[int] = None
     lead_generation_enabled: Optional[bool] = None
     voice_chat_enabled: Optional[bool] = None
     multilingual_text_enabled: Optional[bool] = None
@@ -120,6 +122,7 @@ class PlanCreate(BaseModel):
     max_document_size_mb: int
     monthly_token_limit: int
     max_query_words: int
+    max_prompt_tokens: int = 3000
     lead_generation_enabled: bool
     voice_chat_enabled: bool
     multilingual_text_enabled: bool
@@ -139,6 +142,7 @@ class PlanUpdate(BaseModel):
     max_document_size_mb: Optional[int] = None
     monthly_token_limit: Optional[int] = None
     max_query_words: Optional[int] = None
+    max_prompt_tokens: Optional[int] = None
     lead_generation_enabled: Optional[bool] = None
     voice_chat_enabled: Optional[bool] = None
     multilingual_text_enabled: Optional[bool] = None
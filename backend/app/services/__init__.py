@@ -1,8 +1,8 @@
 from app.services.embeddings import generate_embedding, generate_embeddings
 from app.services.web_crawler import WebCrawler
 from app.services.rag import chroma_client
-from app.services.ingestion import ingest_web_content, ingest_document, ingest_text_content, delete_knowledge_source
-from app.services.chat_service import generate_chat_response, translate_text, stream_chat_response, persist_conversation, get_suggested_questions
+from app.services.ingestion import ingest_web_content, ingest_document, ingest_documents_bulk, ingest_text_content, delete_knowledge_source
+from app.services.chat_service import generate_chat_response, translate_text, stream_chat_response, persist_conversation, get_suggested_questions, remember_answer, run_blocking
 from app.services.lead_service import should_capture_lead
 
 __all__ = [
@@ -12,6 +12,7 @@ __all__ = [
     "chroma_client",
     "ingest_web_content",
     "ingest_document",
+    "ingest_documents_bulk",
     "ingest_text_content",
     "delete_knowledge_source",
     "generate_chat_response",
@@ -19,5 +20,7 @@ __all__ = [
     "persist_conversation",
     "translate_text",
     "get_suggested_questions",
+    "remember_answer",
+    "run_blocking",
     "should_capture_lead",
 ]
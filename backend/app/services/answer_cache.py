@@ -0,0 +1,167 @@
+from collections import OrderedDict
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.models import KnowledgeSource
+from app.services.rag import chroma_client
+from typing import Dict, Iterator, List, Optional, Tuple
+import logging
+import re
+import threading
+import time
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+BucketKey = Tuple[int, str, str]
+
+
+class CachedAnswer:
+    """A stored answer together with the question vector it was produced for"""
+    def __init__(self, question: str, vector: np.ndarray, answer: str, sources: List[Dict], knowledge_version: str):
+        self.question = question
+        self.vector = vector
+        self.answer = answer
+        self.sources = sources
+        self.knowledge_version = knowledge_version
+        self.created_at = time.monotonic()
+
+
+class CacheProbe:
+    """Result of a cache miss; pass it back to `store` once the answer is generated"""
+    def __init__(self, key: BucketKey, question: str, vector: np.ndarray, knowledge_version: str):
+        self.key = key
+        self.question = question
+        self.vector = vector
+        self.knowledge_version = knowledge_version
+
+
+def knowledge_version(db: Session, organization_id: int, widget_id: str) -> str:
+    """Cheap signature of a widget's knowledge sources.
+
+    Adding a source raises max(id), deleting one lowers the count and a re-crawl
+    bumps updated_at, so the signature changes whenever retrieval could differ.
+    Because it is read from the database, it stays consistent across workers.
+    """
+    count, max_id, last_updated = db.query(
+        func.count(KnowledgeSource.id),
+        func.max(KnowledgeSource.id),
+        func.max(KnowledgeSource.updated_at),
+    ).filter(
+        KnowledgeSource.organization_id == organization_id,
+        KnowledgeSource.widget_id == widget_id,
+    ).one()
+    return f"{count}:{max_id}:{last_updated}"
+
+
+class SemanticAnswerCache:
+    """Per-(organization, widget, language) cache of answers keyed by question embedding.
+
+    A new question is served from the cache when its cosine distance to a stored
+    question is within `max_distance` and the widget's knowledge has not changed
+    since the answer was generated.
+    """
+    def __init__(self, max_distance: float, max_entries_per_widget: int, ttl_seconds: float):
+        self.max_distance = max_distance
+        self.max_entries_per_widget = max(1, max_entries_per_widget)
+        self.ttl_seconds = ttl_seconds
+        self._buckets: Dict[BucketKey, "OrderedDict[str, CachedAnswer]"] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _normalize(text: str) -> str:
+        return " ".join((text or "").split()).lower()
+
+    @staticmethod
+    def _embed(text: str) -> np.ndarray:
+        vector = np.asarray(chroma_client.embedding_function([text])[0], dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _is_stale(self, entry: CachedAnswer, version: str, now: float) -> bool:
+        if entry.knowledge_version != version:
+            return True
+        return self.ttl_seconds > 0 and now - entry.created_at > self.ttl_seconds
+
+    def lookup(
+        self,
+        db: Session,
+        organization_id: int,
+        widget_id: str,
+        language: Optional[str],
+        question: str,
+    ) -> Tuple[Optional[CachedAnswer], Optional[CacheProbe]]:
+        """Return (cached_answer, None) on a hit or (None, probe) on a miss"""
+        key: BucketKey = (organization_id, str(widget_id), (language or "").lower())
+        version = knowledge_version(db, organization_id, widget_id)
+        normalized = self._normalize(question)
+        vector = self._embed(normalized)
+        now = time.monotonic()
+
+        with self._lock:
+            bucket = self._buckets.get(key)
+            best_entry = None
+            if bucket:
+                for stale_key in [k for k, entry in bucket.items() if self._is_stale(entry, version, now)]:
+                    del bucket[stale_key]
+                if bucket:
+                    entries = list(bucket.values())
+                    matrix = np.stack([entry.vector for entry in entries])
+                    distances = 1.0 - matrix @ vector
+                    best = int(np.argmin(distances))
+                    if distances[best] <= self.max_distance:
+                        best_entry = entries[best]
+                        bucket.move_to_end(best_entry.question)
+
+            if best_entry is not None:
+                self.hits += 1
+                return best_entry, None
+
+            self.misses += 1
+            return None, CacheProbe(key, normalized, vector, version)
+
+    def store(self, probe: Optional[CacheProbe], answer: str, sources: List[Dict]) -> None:
+        if probe is None or not answer:
+            return
+        entry = CachedAnswer(probe.question, probe.vector, answer, sources, probe.knowledge_version)
+        with self._lock:
+            bucket = self._buckets.setdefault(probe.key, OrderedDict())
+            bucket[probe.question] = entry
+            bucket.move_to_end(probe.question)
+            while len(bucket) > self.max_entries_per_widget:
+                bucket.popitem(last=False)
+
+    def invalidate(self, organization_id: int, widget_id: str) -> None:
+        """Drop every cached answer for a widget, across all languages"""
+        with self._lock:
+            for key in [k for k in self._buckets if k[0] == organization_id and k[1] == str(widget_id)]:
+                del self._buckets[key]
+        logger.info(f"Invalidated answer cache for org {organization_id} widget {widget_id}")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "widgets": len(self._buckets),
+                "entries": sum(len(bucket) for bucket in self._buckets.values()),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits / lookups) if lookups else 0.0,
+            }
+
+
+def iter_answer_tokens(text: str) -> Iterator[str]:
+    """Split a complete answer into word-sized pieces for SSE replay"""
+    for match in re.finditer(r"\s*\S+", text or ""):
+        yield match.group(0)
+
+
+# Singleton instance
+answer_cache = SemanticAnswerCache(
+    max_distance=settings.ANSWER_CACHE_MAX_DISTANCE,
+    max_entries_per_widget=settings.ANSWER_CACHE_MAX_ENTRIES_PER_WIDGET,
+    ttl_seconds=settings.ANSWER_CACHE_TTL_SECONDS,
+)
@@ -1,17 +1,40 @@
-from openai import OpenAI
+from openai import AsyncOpenAI
 from app.config import settings
 from app.services.rag import chroma_client
+from app.services.answer_cache import answer_cache, CachedAnswer, CacheProbe
+from app.services.lexical_index import reciprocal_rank_fusion
+from app.services.context_selection import maximal_marginal_relevance, count_tokens, assemble_prompt, context_token_stats
 from app.models import Conversation, KnowledgeSource, WidgetConfig
 from app.services.report_service import sync_conversation_metrics
 from sqlalchemy.orm import Session
 import logging
-from typing import Tuple, List, Dict, Optional
+from typing import Any, Callable, Tuple, List, Dict, Optional
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import asyncio
 import re
 from urllib.parse import urlparse
 
 logger = logging.getLogger(__name__)
 
-client = OpenAI(api_key=settings.OPENAPI_KEY2)
+async_client = AsyncOpenAI(api_key=settings.OPENAPI_KEY2)
+
+# Runs the keyword leg of hybrid retrieval alongside the vector query
+_retrieval_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="retrieval")
+
+# Bounded pool for the blocking parts of the chat path (SQLAlchemy session,
+# Chroma, embeddings) so they never run on the event loop
+_blocking_executor = ThreadPoolExecutor(max_workers=settings.CHAT_BLOCKING_WORKERS, thread_name_prefix="chat-blocking")
+
+
+async def run_blocking(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """Run a blocking call on the chat worker pool and await its result.
+
+    A request's SQLAlchemy session is only ever used by one of these calls at
+    a time, because each one is awaited before the next is scheduled.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_blocking_executor, partial(func, *args, **kwargs))
 
 DEFAULT_ESCALATION_CONTACT_LEVEL_1 = "Support Team: support@example.com | +1-555-0101"
 DEFAULT_ESCALATION_CONTACT_LEVEL_2 = "Escalation Manager: escalation@example.com | +1-555-0102"
@@ -25,18 +48,8 @@ _STOPWORDS = {
 }
 
 
-_QUERY_GROUPS = [
-    {"address", "location", "office", "hq", "head", "branch"},
-    {"contact", "email", "phone", "support", "help"},
-    {"price", "pricing", "cost", "fee", "charge", "plan"},
-    {"hours", "timing", "opening", "open", "close"},
-    {"delivery", "shipping", "ship"},
-    {"refund", "return", "cancel", "cancellation"},
-    {"features", "capabilities", "feature"},
-    {"integration", "integrations", "api", "webhook", "sdk"},
-    {"security", "privacy", "compliance", "gdpr", "soc"},
-    {"setup", "install", "onboarding", "getting", "started"},
-]
+_PRIMARY_RESULTS = 8
+_FALLBACK_RESULTS = 15
 
 
 _SUGGESTION_PATTERNS = [
@@ -156,21 +169,136 @@ def _keyword_query(text: str) -> str:
     return " ".join(keywords[:12])
 
 
-def _expand_queries(base_query: str, raw_message: str) -> List[str]:
-    queries = [base_query]
-    raw_tokens = set(re.findall(r"[a-zA-Z0-9]+", raw_message.lower()))
-    for group in _QUERY_GROUPS:
-        if raw_tokens & group:
-            related = " ".join(sorted(group))
-            queries.append(f"{base_query}\n\nRelated terms: {related}")
-            break
+def _results_for_query(results: Dict, query_index: int, limit: int) -> Dict:
+    """Slice one query's top-``limit`` hits out of a batched Chroma result."""
+    sliced: Dict = {}
+    if not results:
+        return sliced
+    for key in ("ids", "documents", "metadatas", "distances"):
+        rows = results.get(key)
+        if rows and query_index < len(rows) and rows[query_index] is not None:
+            sliced[key] = [rows[query_index][:limit]]
+    return sliced
+
+
+def _select_context(results: Dict, max_chunks: int = 12) -> List[Dict]:
+    """Turn ranked results into labelled context chunks.
+
+    Each chunk is a dict with ``text``, ``tokens`` and ``source_id``. Token
+    counts come from the ``token_count`` stored at ingestion when available.
+    The top hits are filtered by a distance threshold relative to the best
+    match; if nothing survives, the whole list is used without a threshold.
+    """
+    context_parts: List[Dict] = []
+    seen_chunks = set()
+
+    def _add_results(results: Dict, max_chunks: int = 12, apply_threshold: bool = True) -> None:
+        distances = None
+        if results and results.get('distances') and results['distances'][0]:
+            distances = results['distances'][0]
+        known_distances = [d for d in distances if d is not None] if distances else []
+        min_distance = min(known_distances) if known_distances else None
+        distance_threshold = None
+        if apply_threshold and min_distance is not None:
+            distance_threshold = min(0.6, min_distance + 0.2)
+
+        if results and results.get('documents') and results['documents'][0]:
+            for idx, doc in enumerate(results['documents'][0]):
+                if len(context_parts) >= max_chunks:
+                    break
+                if not doc:
+                    continue
+                if distances and distance_threshold is not None and idx < len(distances):
+                    if distances[idx] is not None and distances[idx] > distance_threshold:
+                        continue
+
+                normalized = " ".join(doc.split()).strip().lower()
+                if normalized in seen_chunks:
+                    continue
+                seen_chunks.add(normalized)
+
+                chunk = {"text": doc, "tokens": None, "source_id": None}
+                metadata = None
+                if results.get('metadatas') and results['metadatas'][0] and idx < len(results['metadatas'][0]):
+                    metadata = results['metadatas'][0][idx]
+                if isinstance(metadata, dict):
+                    if 'source_id' in metadata:
+                        chunk["source_id"] = int(metadata['source_id'])
+                    if metadata.get('token_count') is not None:
+                        chunk["tokens"] = int(metadata['token_count'])
+
+                    label = metadata.get('title') or metadata.get('filename') or metadata.get('url')
+                    if label:
+                        prefix = f"Source: {label}\n"
+                        chunk["text"] = f"{prefix}{doc}"
+                        if chunk["tokens"] is not None:
+                            chunk["tokens"] += count_tokens(prefix)
+                if chunk["tokens"] is None:
+                    chunk["tokens"] = count_tokens(chunk["text"])
+                context_parts.append(chunk)
+
+    _add_results(_results_for_query(results, 0, _PRIMARY_RESULTS), max_chunks=max_chunks, apply_threshold=True)
+
+    if not context_parts:
+        _add_results(results, max_chunks=max_chunks, apply_threshold=False)
 
-    keyword_query = _keyword_query(raw_message)
-    if keyword_query and keyword_query not in base_query:
-        queries.append(keyword_query)
+    return context_parts
 
-    # limit to avoid latency spikes
-    return queries[:3]
+
+def _mmr_options(widget_config: Optional[WidgetConfig]) -> Tuple[bool, int, float, float]:
+    """Per-widget MMR settings, falling back to the global defaults"""
+    def pick(attr: str, default):
+        value = getattr(widget_config, attr, None) if widget_config else None
+        return default if value is None else value
+
+    return (
+        bool(pick("mmr_enabled", settings.MMR_ENABLED)),
+        int(pick("mmr_top_k", settings.MMR_TOP_K)),
+        float(pick("mmr_lambda", settings.MMR_LAMBDA)),
+        float(pick("mmr_similarity_cap", settings.MMR_SIMILARITY_CAP)),
+    )
+
+
+def _diversify_results(
+    results: Dict,
+    query_text: str,
+    organization_id: int,
+    widget_id: str,
+    top_k: int,
+    lambda_mult: float,
+    similarity_cap: float,
+) -> Dict:
+    """Re-rank fused results with maximal marginal relevance, keeping at most top_k hits"""
+    ids = (results.get("ids") or [[]])[0] or []
+    if not ids:
+        return results
+    embeddings = list((results.get("embeddings") or [[None] * len(ids)])[0])
+
+    # Keyword-only hits come back without vectors; fetch them in one call
+    missing = [doc_id for doc_id, vector in zip(ids, embeddings) if vector is None]
+    if missing:
+        stored = chroma_client.get_embeddings(missing, organization_id, widget_id)
+        embeddings = [stored.get(doc_id) if vector is None else vector for doc_id, vector in zip(ids, embeddings)]
+
+    usable = [idx for idx, vector in enumerate(embeddings) if vector is not None]
+    if not usable:
+        return results
+
+    query_vector = chroma_client.embedding_function([query_text])[0]
+    picked = maximal_marginal_relevance(
+        query_vector,
+        [embeddings[idx] for idx in usable],
+        k=top_k,
+        lambda_mult=lambda_mult,
+        similarity_cap=similarity_cap,
+    )
+    order = [usable[idx] for idx in picked]
+
+    diversified = {}
+    for key, rows in results.items():
+        if rows is not None and len(rows) and rows[0] is not None:
+            diversified[key] = [[rows[0][idx] for idx in order]]
+    return diversified
 
 
 def _build_escalation_message(level_1: str, level_2: str) -> str:
@@ -209,7 +337,8 @@ def _prepare_chat_payload(
     db: Session,
     language_code: Optional[str] = None,
     language_label: Optional[str] = None,
-    retrieval_message: Optional[str] = None
+    retrieval_message: Optional[str] = None,
+    prompt_token_budget: Optional[int] = None
 ) -> Tuple[List[Dict], List[Dict], bool, str]:
     history = db.query(Conversation).filter(
         Conversation.session_id == session_id,
@@ -222,83 +351,60 @@ def _prepare_chat_payload(
         if recent_user_message and recent_user_message.strip() and recent_user_message.strip() != message.strip():
             query_text = f"{query_text}\n\nPrevious user message: {recent_user_message.strip()}"
 
-    context_parts = []
-    source_ids = set()
-    seen_chunks = set()
-
-    def _add_results(results: Dict, max_chunks: int = 12, apply_threshold: bool = True) -> None:
-        nonlocal context_parts
-        distances = None
-        if results and results.get('distances') and results['distances'][0]:
-            distances = results['distances'][0]
-        min_distance = min(distances) if distances else None
-        distance_threshold = None
-        if apply_threshold and min_distance is not None:
-            distance_threshold = min(0.6, min_distance + 0.2)
-
-        if results and results.get('documents') and results['documents'][0]:
-            for idx, doc in enumerate(results['documents'][0]):
-                if len(context_parts) >= max_chunks:
-                    break
-                if not doc:
-                    continue
-                if distances and distance_threshold is not None and idx < len(distances):
-                    if distances[idx] is not None and distances[idx] > distance_threshold:
-                        continue
-
-                normalized = " ".join(doc.split()).strip().lower()
-                if normalized in seen_chunks:
-                    continue
-                seen_chunks.add(normalized)
-
-                context_parts.append(doc)
-                if results.get('metadatas') and results['metadatas'][0] and idx < len(results['metadatas'][0]):
-                    metadata = results['metadatas'][0][idx]
-                    if isinstance(metadata, dict) and 'source_id' in metadata:
-                        source_ids.add(int(metadata['source_id']))
-
-                    if isinstance(metadata, dict):
-                        label = metadata.get('title') or metadata.get('filename') or metadata.get('url')
-                        if label:
-                            context_parts[-1] = f"Source: {label}\n{context_parts[-1]}"
-
-    primary_results = chroma_client.query(
+    widget_config = db.query(WidgetConfig).filter(
+        WidgetConfig.widget_id == widget_id,
+        WidgetConfig.organization_id == organization_id,
+    ).first()
+    mmr_enabled, mmr_top_k, mmr_lambda, mmr_similarity_cap = _mmr_options(widget_config)
+
+    # Hybrid retrieval: the BM25 keyword leg runs in parallel with the vector
+    # query and the two rankings are merged with reciprocal-rank fusion, so
+    # exact terms (SKUs, order numbers, names) surface without a query cascade.
+    keyword_future = _retrieval_executor.submit(
+        chroma_client.keyword_query,
+        _keyword_query(retrieval_message or message),
+        n_results=_FALLBACK_RESULTS,
+        organization_id=organization_id,
+        widget_id=widget_id,
+    )
+    vector_results = chroma_client.query(
         query_text,
-        n_results=8,
+        n_results=_FALLBACK_RESULTS,
         organization_id=organization_id,
         widget_id=widget_id,
+        include_embeddings=mmr_enabled,
     )
-    _add_results(primary_results, apply_threshold=True)
-
-    if not context_parts:
-        query_variants = _expand_queries(query_text, message)
-        for q in query_variants[1:]:
-            if len(context_parts) >= 12:
-                break
-            results = chroma_client.query(
-                q,
-                n_results=8,
-                organization_id=organization_id,
-                widget_id=widget_id,
+    try:
+        keyword_results = keyword_future.result()
+    except Exception as e:
+        logger.warning(f"Keyword retrieval failed: {str(e)}")
+        keyword_results = {}
+
+    fused_results = reciprocal_rank_fusion([vector_results, keyword_results], n_results=_FALLBACK_RESULTS)
+
+    context_chunks = _select_context(fused_results)
+
+    if mmr_enabled and context_chunks:
+        try:
+            diversified = _diversify_results(
+                fused_results,
+                query_text,
+                organization_id,
+                widget_id,
+                top_k=mmr_top_k,
+                lambda_mult=mmr_lambda,
+                similarity_cap=mmr_similarity_cap,
             )
-            _add_results(results, apply_threshold=False)
+            mmr_chunks = _select_context(diversified)
+            if mmr_chunks:
+                tokens_before = sum(chunk["tokens"] for chunk in context_chunks)
+                tokens_after = sum(chunk["tokens"] for chunk in mmr_chunks)
+                context_token_stats.record(tokens_before, tokens_after)
+                logger.info(f"MMR context for widget {widget_id}: {len(context_chunks)}->{len(mmr_chunks)} chunks, {tokens_before}->{tokens_after} tokens")
+                context_chunks = mmr_chunks
+        except Exception as e:
+            logger.warning(f"MMR diversification failed: {str(e)}")
 
-    if not context_parts:
-        fallback_results = chroma_client.query(
-            query_text,
-            n_results=15,
-            organization_id=organization_id,
-            widget_id=widget_id,
-        )
-        _add_results(fallback_results, max_chunks=12, apply_threshold=False)
-
-    context = "\n\n".join(context_parts) if context_parts else ""
-    has_context = bool(context_parts)
-
-    widget_config = db.query(WidgetConfig).filter(
-        WidgetConfig.widget_id == widget_id,
-        WidgetConfig.organization_id == organization_id,
-    ).first()
     escalation_level_1 = (
         widget_config.escalation_contact_level_1
         if widget_config and widget_config.escalation_contact_level_1
@@ -311,33 +417,13 @@ def _prepare_chat_payload(
     )
     escalation_message = _build_escalation_message(escalation_level_1, escalation_level_2)
 
-    sources = []
-    if source_ids:
-        source_records = db.query(KnowledgeSource).filter(
-            KnowledgeSource.id.in_(source_ids),
-            KnowledgeSource.organization_id == organization_id,
-            KnowledgeSource.widget_id == widget_id,
-        ).all()
-
-        for source in source_records:
-            source_info = {
-                "id": source.id,
-                "name": source.name,
-                "type": source.source_type.value,
-                "url": source.url
-            }
-            sources.append(source_info)
-
     language_instruction = ''
     if language_label or language_code:
         label = language_label or 'the requested language'
         code = language_code or 'unknown'
         language_instruction = f"\n\nAlways respond in {label} ({code})."
 
-    messages = [
-        {
-            "role": "system",
-            "content": f"""You are a friendly and empathetic assistant chatting like a real human.
+    system_prefix = f"""You are a friendly and empathetic assistant chatting like a real human.
 Use warm, natural language, short sentences, and contractions when appropriate.
 Answer using only the context from the user's knowledge base and the conversation history.
 If the answer is not in the context, do not guess. Politely acknowledge it and offer escalation using this exact message:
@@ -347,15 +433,40 @@ You may derive simple aggregates (e.g., price ranges) from the provided context
 {language_instruction}
 
 Context:
-{context if context else "(No relevant context found in the knowledge base.)"}"""
-        }
-    ]
+"""
 
-    for conv in reversed(history):
-        messages.append({"role": "user", "content": conv.message})
-        messages.append({"role": "assistant", "content": conv.response})
+    # Pack context and history into the prompt budget before calling the LLM
+    messages, packed_chunks, prompt_tokens = assemble_prompt(
+        system_prefix,
+        context_chunks,
+        [(conv.message, conv.response) for conv in history],
+        message,
+        prompt_token_budget,
+        "(No relevant context found in the knowledge base.)",
+    )
+    if len(packed_chunks) < len(context_chunks):
+        logger.info(f"Trimmed context for widget {widget_id} from {len(context_chunks)} to {len(packed_chunks)} chunks to fit {prompt_token_budget} tokens")
+    logger.debug(f"Estimated prompt tokens for widget {widget_id}: {prompt_tokens}")
 
-    messages.append({"role": "user", "content": message})
+    has_context = bool(packed_chunks)
+    source_ids = {chunk["source_id"] for chunk in packed_chunks if chunk["source_id"] is not None}
+
+    sources = []
+    if source_ids:
+        source_records = db.query(KnowledgeSource).filter(
+            KnowledgeSource.id.in_(source_ids),
+            KnowledgeSource.organization_id == organization_id,
+            KnowledgeSource.widget_id == widget_id,
+        ).all()
+
+        for source in source_records:
+            source_info = {
+                "id": source.id,
+                "name": source.name,
+                "type": source.source_type.value,
+                "url": source.url
+            }
+            sources.append(source_info)
 
     return messages, sources, has_context, escalation_message
 
@@ -386,20 +497,63 @@ def persist_conversation(
     db.commit()
 
 
-def generate_chat_response(
+def _lookup_cached_answer(
     message: str,
     session_id: str,
     widget_id: str,
-    user_id: int,
     organization_id: int,
     db: Session,
     language_code: Optional[str] = None,
     language_label: Optional[str] = None,
     retrieval_message: Optional[str] = None
+) -> Tuple[Optional[CachedAnswer], Optional[CacheProbe]]:
+    if not settings.ANSWER_CACHE_ENABLED or not widget_id:
+        return None, None
+    try:
+        # A follow-up is answered from the session's history (retrieval and
+        # prompt both use it), so its answer is neither served from nor
+        # stored under the bare question text
+        has_history = db.query(Conversation.id).filter(
+            Conversation.session_id == session_id,
+            Conversation.widget_id == widget_id,
+        ).first() is not None
+        if has_history:
+            return None, None
+        return answer_cache.lookup(
+            db,
+            organization_id,
+            widget_id,
+            language_code or language_label,
+            retrieval_message or message,
+        )
+    except Exception as e:
+        logger.warning(f"Answer cache lookup failed: {str(e)}")
+        return None, None
+
+
+def remember_answer(cache_probe: Optional[CacheProbe], response_text: str, sources: List[Dict]) -> None:
+    """Store a generated answer in the semantic cache unless it is an escalation/no-answer reply."""
+    if cache_probe is None or _looks_like_no_answer(response_text):
+        return
+    answer_cache.store(cache_probe, response_text, sources)
+
+
+async def generate_chat_response(
+    message: str,
+    session_id: str,
+    widget_id: str,
+    user_id: int,
+    organization_id: int,
+    db: Session,
+    language_code: Optional[str] = None,
+    language_label: Optional[str] = None,
+    retrieval_message: Optional[str] = None,
+    prompt_token_budget: Optional[int] = None
 ) -> Tuple[str, List[Dict], Dict]:
     """Generate AI response using RAG with organization-scoped knowledge base. Returns (response, sources, token_usage)."""
     try:
-        messages, sources, has_context, escalation_message = _prepare_chat_payload(
+        cached_answer, cache_probe = await run_blocking(
+            _lookup_cached_answer,
             message,
             session_id,
             widget_id,
@@ -409,18 +563,47 @@ def generate_chat_response(
             language_label=language_label,
             retrieval_message=retrieval_message
         )
+        if cached_answer is not None:
+            token_usage = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+            await run_blocking(
+                persist_conversation,
+                db,
+                session_id=session_id,
+                widget_id=widget_id,
+                user_id=user_id,
+                organization_id=organization_id,
+                message=message,
+                response_text=cached_answer.answer,
+                token_usage=token_usage
+            )
+            return cached_answer.answer, cached_answer.sources, token_usage
+
+        messages, sources, has_context, escalation_message = await run_blocking(
+            _prepare_chat_payload,
+            message,
+            session_id,
+            widget_id,
+            organization_id,
+            db,
+            language_code=language_code,
+            language_label=language_label,
+            retrieval_message=retrieval_message,
+            prompt_token_budget=prompt_token_budget
+        )
         
         # Generate response
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
+        response = await async_client.chat.completions.create(
+            model=settings.CHAT_MODEL,
             messages=messages,
-            max_tokens=500,
+            max_tokens=settings.CHAT_MAX_COMPLETION_TOKENS,
             temperature=0.3
         )
         
         ai_response = response.choices[0].message.content
         if not has_context or _looks_like_no_answer(ai_response):
             ai_response = escalation_message
+        else:
+            remember_answer(cache_probe, ai_response, sources)
 
         usage = getattr(response, "usage", None)
         token_usage = {
@@ -429,7 +612,8 @@ def generate_chat_response(
             "total_tokens": getattr(usage, "total_tokens", 0) if usage else 0,
         }
         
-        persist_conversation(
+        await run_blocking(
+            persist_conversation,
             db,
             session_id=session_id,
             widget_id=widget_id,
@@ -447,7 +631,7 @@ def generate_chat_response(
         raise
 
 
-def stream_chat_response(
+async def stream_chat_response(
     message: str,
     session_id: str,
     widget_id: str,
@@ -456,9 +640,18 @@ def stream_chat_response(
     db: Session,
     language_code: Optional[str] = None,
     language_label: Optional[str] = None,
-    retrieval_message: Optional[str] = None
+    retrieval_message: Optional[str] = None,
+    prompt_token_budget: Optional[int] = None
 ):
-    messages, sources, has_context, escalation_message = _prepare_chat_payload(
+    """Start a streamed chat completion.
+
+    Returns (stream, sources, fallback_text, cache_probe), where stream is an
+    async iterator of completion chunks. When stream is None the caller should
+    send fallback_text instead: either a semantic-cache hit or the escalation
+    message when no context was found.
+    """
+    cached_answer, cache_probe = await run_blocking(
+        _lookup_cached_answer,
         message,
         session_id,
         widget_id,
@@ -468,29 +661,44 @@ def stream_chat_response(
         language_label=language_label,
         retrieval_message=retrieval_message
     )
+    if cached_answer is not None:
+        return None, cached_answer.sources, cached_answer.answer, None
+
+    messages, sources, has_context, escalation_message = await run_blocking(
+        _prepare_chat_payload,
+        message,
+        session_id,
+        widget_id,
+        organization_id,
+        db,
+        language_code=language_code,
+        language_label=language_label,
+        retrieval_message=retrieval_message,
+        prompt_token_budget=prompt_token_budget
+    )
 
     if not has_context:
-        return None, sources, escalation_message
+        return None, sources, escalation_message, None
 
-    stream = client.chat.completions.create(
-        model="gpt-4o-mini",
+    stream = await async_client.chat.completions.create(
+        model=settings.CHAT_MODEL,
         messages=messages,
-        max_tokens=500,
+        max_tokens=settings.CHAT_MAX_COMPLETION_TOKENS,
         temperature=0.3,
         stream=True,
         stream_options={"include_usage": True}
     )
 
-    return stream, sources, escalation_message
+    return stream, sources, escalation_message, cache_probe
 
 
-def translate_text(text: str, target_language_code: Optional[str] = None, target_language_label: Optional[str] = None) -> str:
+async def translate_text(text: str, target_language_code: Optional[str] = None, target_language_label: Optional[str] = None) -> str:
     if not text.strip():
         return text
 
     label = target_language_label or 'the requested language'
     code = target_language_code or 'unknown'
-    response = client.chat.completions.create(
+    response = await async_client.chat.completions.create(
         model="gpt-4o-mini",
         messages=[
             {
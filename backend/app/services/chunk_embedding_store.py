@@ -0,0 +1,134 @@
+from app.config import settings
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# SQLite caps bound parameters per statement; stay well below the default
+_LOOKUP_BATCH = 500
+
+
+def chunk_sha(text: str) -> str:
+    """SHA-256 of a chunk's whitespace-normalized text"""
+    return hashlib.sha256(" ".join((text or "").split()).encode("utf-8")).hexdigest()
+
+
+class ChunkEmbeddingStore:
+    """Persistent chunk vectors keyed by (embedding model, chunk text hash).
+
+    Ingestion looks every chunk up here before embedding it, so a re-crawled
+    page only embeds the chunks whose text changed and the same document
+    uploaded to several widgets is embedded once. Vectors are stored as
+    float32 blobs in a SQLite file shared by all workers; rows not used for
+    `max_age_days` are pruned (0 keeps everything).
+    """
+    def __init__(self, path: str, max_age_days: int = 0):
+        self.path = path
+        self.max_age_days = max_age_days
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._write_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._last_prune = 0.0
+        self.hits = 0
+        self.misses = 0
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunk_embeddings ("
+                "model TEXT NOT NULL, sha TEXT NOT NULL, dim INTEGER NOT NULL, vector BLOB NOT NULL, "
+                "last_used_at REAL NOT NULL, PRIMARY KEY (model, sha))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_chunk_embeddings_used ON chunk_embeddings (last_used_at)")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            yield conn
+            conn.commit()
+        finally:
+            conn.close()
+
+    def get_many(self, model_name: str, texts: Sequence[str]) -> List[Optional[List[float]]]:
+        """Stored vector per text, or None where the chunk has not been embedded with this model"""
+        shas = [chunk_sha(text) for text in texts]
+        found: Dict[str, List[float]] = {}
+        unique = list(dict.fromkeys(shas))
+        with self._connect() as conn:
+            for start in range(0, len(unique), _LOOKUP_BATCH):
+                batch = unique[start:start + _LOOKUP_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = conn.execute(
+                    f"SELECT sha, vector FROM chunk_embeddings WHERE model = ? AND sha IN ({placeholders})",
+                    (model_name, *batch),
+                ).fetchall()
+                for sha, blob in rows:
+                    found[sha] = np.frombuffer(blob, dtype=np.float32).tolist()
+
+        vectors = [found.get(sha) for sha in shas]
+        hits = sum(1 for vector in vectors if vector is not None)
+        with self._stats_lock:
+            self.hits += hits
+            self.misses += len(vectors) - hits
+        if found:
+            self._touch(model_name, list(found))
+        return vectors
+
+    def _touch(self, model_name: str, shas: List[str]) -> None:
+        now = time.time()
+        with self._write_lock, self._connect() as conn:
+            conn.executemany(
+                "UPDATE chunk_embeddings SET last_used_at = ? WHERE model = ? AND sha = ?",
+                [(now, model_name, sha) for sha in shas],
+            )
+
+    def put_many(self, model_name: str, texts: Sequence[str], vectors: Sequence[Sequence[float]]) -> None:
+        now = time.time()
+        rows = []
+        for text, vector in zip(texts, vectors):
+            array = np.asarray(vector, dtype=np.float32)
+            rows.append((model_name, chunk_sha(text), int(array.shape[0]), array.tobytes(), now))
+        with self._write_lock, self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO chunk_embeddings (model, sha, dim, vector, last_used_at) VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+        self._maybe_prune()
+
+    def _maybe_prune(self) -> None:
+        # At most once an hour per process
+        if self.max_age_days <= 0 or time.monotonic() - self._last_prune < 3600:
+            return
+        self._last_prune = time.monotonic()
+        cutoff = time.time() - self.max_age_days * 86400
+        with self._write_lock, self._connect() as conn:
+            removed = conn.execute("DELETE FROM chunk_embeddings WHERE last_used_at < ?", (cutoff,)).rowcount
+        if removed:
+            logger.info(f"Pruned {removed} chunk embeddings unused for {self.max_age_days} days")
+
+    def stats(self) -> Dict:
+        with self._connect() as conn:
+            rows = conn.execute("SELECT COUNT(*) FROM chunk_embeddings").fetchone()[0]
+        with self._stats_lock:
+            lookups = self.hits + self.misses
+            return {
+                "rows": rows,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits / lookups) if lookups else 0.0,
+            }
+
+
+# Singleton instance
+chunk_embedding_store = ChunkEmbeddingStore(
+    os.path.join(os.getcwd(), settings.CHUNK_EMBEDDING_STORE_PATH),
+    max_age_days=settings.CHUNK_EMBEDDING_STORE_MAX_AGE_DAYS,
+)
@@ -0,0 +1,196 @@
+from app.config import settings
+from typing import Dict, List, Optional, Sequence, Tuple
+import logging
+import math
+import threading
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Chat-format overhead per message (role markers, separators)
+MESSAGE_TOKEN_OVERHEAD = 4
+
+_encoder = None
+_encoder_loaded = False
+
+
+class TokenBudgetExceeded(Exception):
+    """Raised before the LLM call when even a context-free prompt does not fit the token budget"""
+    def __init__(self, required_tokens: int, budget: int):
+        super().__init__(f"Request needs at least {required_tokens} prompt tokens but only {budget} are available")
+        self.required_tokens = required_tokens
+        self.budget = budget
+
+
+def _get_encoder():
+    global _encoder, _encoder_loaded
+    if not _encoder_loaded:
+        _encoder_loaded = True
+        try:
+            import tiktoken
+            _encoder = tiktoken.get_encoding(settings.TOKENIZER_ENCODING)
+        except Exception as e:
+            logger.warning(f"tiktoken unavailable ({e}); falling back to estimated token counts")
+            _encoder = None
+    return _encoder
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token for English text)"""
+    return math.ceil(len(text or "") / 4)
+
+
+def count_tokens(text: str) -> int:
+    """Count tokens with the chat model's tokenizer, or estimate when it is unavailable"""
+    if not text:
+        return 0
+    encoder = _get_encoder()
+    if encoder is None:
+        return estimate_tokens(text)
+    return len(encoder.encode(text, disallowed_special=()))
+
+
+def assemble_prompt(
+    system_prefix: str,
+    chunks: List[Dict],
+    history: List[Tuple[str, str]],
+    message: str,
+    budget: Optional[int],
+    empty_context_text: str,
+) -> Tuple[List[Dict], List[Dict], int]:
+    """Pack context chunks and history turns into a prompt that fits `budget` tokens.
+
+    `chunks` are dicts with ``text`` and ``tokens`` in rank order; `history`
+    is (user, assistant) pairs, most recent first. The system prefix and the
+    new message are always kept. Priority after that is: the latest history
+    turn, then context chunks in rank order, then older turns newest-first.
+
+    Returns (messages, packed_chunks, prompt_tokens). Raises
+    `TokenBudgetExceeded` when even the fixed parts do not fit.
+    """
+    separator_tokens = count_tokens("\n\n")
+    fixed_tokens = (
+        count_tokens(system_prefix)
+        + count_tokens(empty_context_text)
+        + count_tokens(message)
+        + 2 * MESSAGE_TOKEN_OVERHEAD
+    )
+    if budget is not None and fixed_tokens > budget:
+        raise TokenBudgetExceeded(fixed_tokens, budget)
+
+    remaining = None if budget is None else budget - fixed_tokens
+
+    def fits(cost: int) -> bool:
+        return remaining is None or cost <= remaining
+
+    turn_costs = [
+        count_tokens(user_text) + count_tokens(assistant_text) + 2 * MESSAGE_TOKEN_OVERHEAD
+        for user_text, assistant_text in history
+    ]
+
+    kept_turns = set()
+    if history and fits(turn_costs[0]):
+        kept_turns.add(0)
+        if remaining is not None:
+            remaining -= turn_costs[0]
+
+    packed_chunks: List[Dict] = []
+    for chunk in chunks:
+        cost = chunk["tokens"] + separator_tokens
+        if fits(cost):
+            packed_chunks.append(chunk)
+            if remaining is not None:
+                remaining -= cost
+
+    for idx in range(1, len(history)):
+        if fits(turn_costs[idx]):
+            kept_turns.add(idx)
+            if remaining is not None:
+                remaining -= turn_costs[idx]
+
+    context = "\n\n".join(chunk["text"] for chunk in packed_chunks)
+    messages = [{"role": "system", "content": system_prefix + (context if context else empty_context_text)}]
+    for idx in reversed(range(len(history))):
+        if idx in kept_turns:
+            user_text, assistant_text = history[idx]
+            messages.append({"role": "user", "content": user_text})
+            messages.append({"role": "assistant", "content": assistant_text})
+    messages.append({"role": "user", "content": message})
+
+    prompt_tokens = sum(count_tokens(m["content"]) + MESSAGE_TOKEN_OVERHEAD for m in messages)
+    return messages, packed_chunks, prompt_tokens
+
+
+def maximal_marginal_relevance(
+    query_vector: Sequence[float],
+    candidate_vectors: Sequence[Sequence[float]],
+    k: int,
+    lambda_mult: float = 0.7,
+    similarity_cap: float = 0.92,
+) -> List[int]:
+    """Pick up to `k` candidate indexes balancing relevance and diversity.
+
+    Each step selects the candidate maximizing
+    ``lambda * sim(query, d) - (1 - lambda) * max(sim(d, selected))``.
+    Candidates whose similarity to an already selected chunk exceeds
+    `similarity_cap` are treated as near-duplicates and never selected.
+    """
+    if not len(candidate_vectors) or k <= 0:
+        return []
+
+    matrix = np.asarray(candidate_vectors, dtype=np.float32)
+    query = np.asarray(query_vector, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    matrix = matrix / np.where(norms == 0, 1.0, norms)
+    query_norm = np.linalg.norm(query)
+    query = query / (query_norm if query_norm else 1.0)
+
+    relevance = matrix @ query
+    pairwise = matrix @ matrix.T
+
+    selected: List[int] = []
+    max_similarity = np.full(len(matrix), -np.inf, dtype=np.float32)
+    available = np.ones(len(matrix), dtype=bool)
+
+    while len(selected) < k and available.any():
+        redundancy = np.where(np.isinf(max_similarity), 0.0, max_similarity)
+        scores = lambda_mult * relevance - (1.0 - lambda_mult) * redundancy
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        max_similarity = np.maximum(max_similarity, pairwise[best])
+        available &= max_similarity <= similarity_cap
+
+    return selected
+
+
+class ContextTokenStats:
+    """Running totals of prompt-context tokens with and without MMR diversification"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.tokens_before = 0
+        self.tokens_after = 0
+
+    def record(self, tokens_before: int, tokens_after: int) -> None:
+        with self._lock:
+            self.requests += 1
+            self.tokens_before += tokens_before
+            self.tokens_after += tokens_after
+
+    def stats(self) -> Dict:
+        with self._lock:
+            saved = self.tokens_before - self.tokens_after
+            return {
+                "requests": self.requests,
+                "context_tokens_before": self.tokens_before,
+                "context_tokens_after": self.tokens_after,
+                "avg_tokens_before": (self.tokens_before / self.requests) if self.requests else 0.0,
+                "avg_tokens_after": (self.tokens_after / self.requests) if self.requests else 0.0,
+                "saved_ratio": (saved / self.tokens_before) if self.tokens_before else 0.0,
+            }
+
+
+# Singleton instance
+context_token_stats = ContextTokenStats()
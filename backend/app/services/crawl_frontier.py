@@ -0,0 +1,206 @@
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from urllib.parse import parse_qsl, urlencode, urljoin, urlsplit
+from urllib.robotparser import RobotFileParser
+import asyncio
+import gzip
+import itertools
+import logging
+import re
+import xml.etree.ElementTree as ET
+
+logger = logging.getLogger(__name__)
+
+# Query parameters that never change page content: campaign/click tracking and session ids
+_TRACKING_PARAMS = {
+    "gclid", "dclid", "gbraid", "wbraid", "fbclid", "msclkid", "yclid", "twclid", "igshid",
+    "mc_cid", "mc_eid", "_ga", "_gl", "_hsenc", "_hsmi", "mkt_tok", "ref_src",
+}
+_SESSION_PARAMS = {"sid", "sessionid", "session_id", "jsessionid", "phpsessid", "aspsessionid", "cfid", "cftoken"}
+_PATH_SESSION_RE = re.compile(r";(?:jsessionid|phpsessid|sid)=[^/?#]*", re.IGNORECASE)
+
+DEFAULT_PRIORITY = 0.5
+# Sitemaps allow 50,000 URLs per file; stop following an index after this many files
+MAX_SITEMAP_FILES = 20
+MAX_SITEMAP_URLS = 50000
+
+
+def _strip_param(name: str) -> bool:
+    name = name.lower()
+    return name.startswith("utm_") or name in _TRACKING_PARAMS or name in _SESSION_PARAMS
+
+
+def canonicalize_url(url: str, base: Optional[str] = None) -> str:
+    """Canonical form used for the visited check and as the page cache key.
+
+    Lower-cases scheme and host, drops default ports, fragments, tracking and
+    session parameters (``utm_*``, ``gclid``, ``sessionid``, ``;jsessionid=``
+    ...) and a trailing slash, and sorts the remaining query parameters.
+    """
+    if base:
+        url = urljoin(base, url)
+    parsed = urlsplit(url.strip())
+    scheme = parsed.scheme.lower()
+    netloc = parsed.netloc.lower()
+    if (scheme == "http" and netloc.endswith(":80")) or (scheme == "https" and netloc.endswith(":443")):
+        netloc = netloc.rsplit(":", 1)[0]
+    path = _PATH_SESSION_RE.sub("", parsed.path) or "/"
+    if path != "/" and path.endswith("/"):
+        path = path[:-1]
+    normalized = f"{scheme}://{netloc}{path}"
+    params = [(k, v) for k, v in parse_qsl(parsed.query, keep_blank_values=True) if not _strip_param(k)]
+    if params:
+        normalized = f"{normalized}?{urlencode(sorted(params))}"
+    return normalized
+
+
+def parse_lastmod(value: Optional[str]) -> Optional[float]:
+    """Unix time of a sitemap <lastmod> (W3C datetime), None if missing or malformed"""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+class SitemapEntry:
+    """One <url> of a sitemap"""
+    def __init__(self, url: str, lastmod: Optional[float] = None, priority: float = DEFAULT_PRIORITY):
+        self.url = url
+        self.lastmod = lastmod
+        self.priority = priority
+
+
+def parse_sitemap(content: bytes) -> Tuple[List[SitemapEntry], List[str]]:
+    """Entries of a <urlset> and child sitemap URLs of a <sitemapindex>; accepts gzipped files"""
+    if content[:2] == b"\x1f\x8b":
+        content = gzip.decompress(content)
+    try:
+        root = ET.fromstring(content)
+    except ET.ParseError as e:
+        logger.warning(f"Unreadable sitemap: {e}")
+        return [], []
+
+    def local(tag: str) -> str:
+        return tag.rsplit("}", 1)[-1]
+
+    def child_text(element, name: str) -> Optional[str]:
+        for child in element:
+            if local(child.tag) == name and child.text:
+                return child.text.strip()
+        return None
+
+    entries: List[SitemapEntry] = []
+    sitemaps: List[str] = []
+    for element in root:
+        kind = local(element.tag)
+        loc = child_text(element, "loc")
+        if not loc:
+            continue
+        if kind == "sitemap":
+            sitemaps.append(loc)
+        elif kind == "url":
+            try:
+                priority = float(child_text(element, "priority") or DEFAULT_PRIORITY)
+            except ValueError:
+                priority = DEFAULT_PRIORITY
+            entries.append(SitemapEntry(loc, parse_lastmod(child_text(element, "lastmod")), min(max(priority, 0.0), 1.0)))
+    return entries, sitemaps
+
+
+class RobotsPolicy:
+    """robots.txt rules for one host; allows everything when there is no robots.txt"""
+    def __init__(self, agent: str, text: Optional[str] = None):
+        self.agent = agent
+        self._parser: Optional[RobotFileParser] = None
+        if text is not None:
+            self._parser = RobotFileParser()
+            self._parser.parse(text.splitlines())
+
+    def can_fetch(self, url: str) -> bool:
+        return self._parser is None or self._parser.can_fetch(self.agent, url)
+
+    def crawl_delay(self) -> Optional[float]:
+        if self._parser is None:
+            return None
+        delay = self._parser.crawl_delay(self.agent)
+        if delay is None:
+            rate = self._parser.request_rate(self.agent)
+            delay = rate.seconds / rate.requests if rate and rate.requests else None
+        return float(delay) if delay is not None else None
+
+    def sitemaps(self) -> List[str]:
+        return list((self._parser and self._parser.site_maps()) or [])
+
+
+class CrawlFrontier:
+    """URLs still to fetch, as an asyncio priority queue with the seen set.
+
+    Entries come out by depth, then sitemap priority, then most recent
+    `lastmod`, then insertion order, so sitemap pages and shallow links are
+    fetched before deep ones. `add` takes already canonical URLs and returns
+    False for URLs that were seen before, are too deep or that robots.txt
+    disallows.
+    """
+    def __init__(self, max_depth: int, robots: Optional[RobotsPolicy] = None):
+        self.max_depth = max_depth
+        self.robots = robots
+        self.seen: Set[str] = set()
+        self.disallowed = 0
+        self.unchanged = 0
+        self._queue: asyncio.PriorityQueue = asyncio.PriorityQueue()
+        self._order = itertools.count()
+
+    def __len__(self) -> int:
+        return self._queue.qsize()
+
+    def claim(self, url: str) -> bool:
+        """Mark a URL seen without queueing it; False if it already was"""
+        if url in self.seen:
+            return False
+        self.seen.add(url)
+        return True
+
+    def add(self, url: str, depth: int, priority: float = DEFAULT_PRIORITY, lastmod: Optional[float] = None) -> bool:
+        if depth > self.max_depth or url in self.seen:
+            return False
+        if self.robots is not None and not self.robots.can_fetch(url):
+            self.disallowed += 1
+            self.seen.add(url)
+            return False
+        self.seen.add(url)
+        self._put(url, depth, priority, lastmod, 0)
+        return True
+
+    def add_many(self, entries: Iterable[SitemapEntry], depth: int, skip: Optional[Dict[str, float]] = None) -> int:
+        """Queue sitemap entries; `skip` maps URL -> last crawl time, and pages whose
+        lastmod is not newer are marked seen instead of queued"""
+        added = 0
+        for entry in entries:
+            crawled_at = (skip or {}).get(entry.url)
+            if crawled_at is not None and entry.lastmod is not None and entry.lastmod <= crawled_at:
+                self.unchanged += self.claim(entry.url)
+                continue
+            added += self.add(entry.url, depth, entry.priority, entry.lastmod)
+        return added
+
+    def retry(self, entry: Tuple) -> None:
+        depth, neg_priority, neg_lastmod, _, url, attempt = entry
+        self._put(url, depth, -neg_priority, -neg_lastmod or None, attempt + 1)
+
+    def _put(self, url: str, depth: int, priority: float, lastmod: Optional[float], attempt: int) -> None:
+        self._queue.put_nowait((depth, -priority, -(lastmod or 0.0), next(self._order), url, attempt))
+
+    async def get(self) -> Tuple:
+        """Next entry: (depth, -priority, -lastmod, order, url, attempt)"""
+        return await self._queue.get()
+
+    def task_done(self) -> None:
+        self._queue.task_done()
+
+    async def join(self) -> None:
+        await self._queue.join()
@@ -0,0 +1,134 @@
+"""Per-URL crawl state of web sources, one ``crawl_page_states`` row per (source, canonical URL).
+
+A re-crawl reads the rows of its source for conditional requests and
+sitemap change detection, and writes each page's row as the page is
+settled instead of rewriting one JSON document at the end. Concurrent
+crawls of the same source then only touch the rows of the pages they
+fetched, and an interrupted crawl keeps the state of every page it got to.
+"""
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from app.models import CrawlPageState, KnowledgeSource
+from app.services.crawl_frontier import canonicalize_url
+from typing import Dict, Iterable, Optional
+import json
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+STATE_FIELDS = ("content_hash", "etag", "last_modified", "last_crawled_at")
+# Rows per INSERT statement; keeps bound parameters below SQLite's limit
+_UPSERT_BATCH = 100
+
+
+def _migrate_metadata_cache(db: Session, source: KnowledgeSource) -> None:
+    """Move a legacy ``page_cache`` out of the source's JSON metadata into rows"""
+    if not source.source_metadata:
+        return
+    try:
+        metadata = json.loads(source.source_metadata)
+    except ValueError:
+        return
+    if not isinstance(metadata, dict) or "page_cache" not in metadata:
+        return
+
+    legacy = metadata.pop("page_cache") or {}
+    states = {canonicalize_url(url): state for url, state in legacy.items() if isinstance(state, dict)}
+    save_page_states(db, source.id, states, commit=False)
+    source.source_metadata = json.dumps(metadata)
+    db.commit()
+    logger.info(f"Moved {len(states)} page states of source {source.id} out of its metadata")
+
+
+def load_page_states(db: Session, source: KnowledgeSource) -> Dict[str, Dict]:
+    """url -> state of every page of a web source, as `WebCrawler(page_cache=...)` takes it"""
+    _migrate_metadata_cache(db, source)
+    rows = db.query(
+        CrawlPageState.url,
+        CrawlPageState.content_hash,
+        CrawlPageState.etag,
+        CrawlPageState.last_modified,
+        CrawlPageState.last_crawled_at,
+    ).filter(CrawlPageState.source_id == source.id).all()
+    return {row.url: {field: getattr(row, field) for field in STATE_FIELDS} for row in rows}
+
+
+def _row(source_id: int, url: str, state: Dict) -> Dict:
+    row = {"source_id": source_id, "url": url}
+    row.update({field: state.get(field) for field in STATE_FIELDS})
+    return row
+
+
+def save_page_states(db: Session, source_id: int, states: Dict[str, Dict], commit: bool = True) -> None:
+    """Insert or update the rows of `states` (url -> state); other pages are left alone"""
+    rows = [_row(source_id, url, state) for url, state in states.items()]
+    dialect = db.get_bind().dialect.name
+    for start in range(0, len(rows), _UPSERT_BATCH):
+        batch = rows[start:start + _UPSERT_BATCH]
+        if dialect in ("sqlite", "postgresql"):
+            insert = sqlite.insert if dialect == "sqlite" else postgresql.insert
+            statement = insert(CrawlPageState).values(batch)
+            update = {field: statement.excluded[field] for field in STATE_FIELDS}
+            update["updated_at"] = func.now()
+            db.execute(statement.on_conflict_do_update(index_elements=["source_id", "url"], set_=update))
+        else:
+            existing = {
+                row.url: row
+                for row in db.query(CrawlPageState).filter(
+                    CrawlPageState.source_id == source_id,
+                    CrawlPageState.url.in_([item["url"] for item in batch]),
+                )
+            }
+            for item in batch:
+                row = existing.get(item["url"])
+                if row is None:
+                    db.add(CrawlPageState(**item))
+                else:
+                    for field in STATE_FIELDS:
+                        setattr(row, field, item[field])
+    if commit:
+        db.commit()
+
+
+def delete_page_states(db: Session, source_id: int, urls: Optional[Iterable[str]] = None) -> None:
+    """Drop a source's rows, or only those of `urls`; the caller commits"""
+    query = db.query(CrawlPageState).filter(CrawlPageState.source_id == source_id)
+    if urls is not None:
+        query = query.filter(CrawlPageState.url.in_(list(urls)))
+    query.delete(synchronize_session=False)
+
+
+class CrawlStateWriter:
+    """Collects page states reported during a crawl and upserts them in batches.
+
+    `add` is called from the crawler for every settled page; rows are written
+    every `batch_size` pages or `flush_interval` seconds, and `flush` writes
+    the rest when the crawl ends (or is cancelled).
+    """
+    def __init__(self, db: Session, source_id: int, batch_size: int = 200, flush_interval: float = 5.0):
+        self.db = db
+        self.source_id = source_id
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.written = 0
+        self._pending: Dict[str, Dict] = {}
+        self._last_flush = time.monotonic()
+
+    def add(self, url: str, state: Dict) -> None:
+        self._pending[url] = state
+        if len(self._pending) >= self.batch_size or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def add_many(self, states: Dict[str, Dict]) -> None:
+        self._pending.update(states)
+        self.flush()
+
+    def flush(self) -> None:
+        self._last_flush = time.monotonic()
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        save_page_states(self.db, self.source_id, pending)
+        self.written += len(pending)
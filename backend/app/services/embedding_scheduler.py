@@ -0,0 +1,202 @@
+"""Micro-batching scheduler in front of a local embedding model.
+
+Chat queries arrive one text at a time from many threads, while ingestion
+submits thousands of chunks at once. The scheduler owns the model on a
+single thread and serves two lanes:
+
+* interactive (chat, suggested questions): waiting requests are coalesced
+  into one ``encode`` call, holding the first request at most
+  ``max_wait_ms`` for others to join;
+* bulk (ingestion): split into ``bulk_chunk_size`` pieces and run only when
+  no interactive request is waiting, so a large crawl delays a chat query
+  by at most one chunk.
+"""
+from collections import deque
+from concurrent.futures import Future
+from typing import Deque, Dict, List
+import logging
+import threading
+import time
+from app.config import settings
+from chromadb.api.types import EmbeddingFunction
+
+logger = logging.getLogger(__name__)
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+LANES = (INTERACTIVE, BULK)
+
+# Upper bounds of the batch-size histogram buckets
+_BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+
+class _Request:
+    def __init__(self, texts: List[str], lane: str):
+        self.texts = texts
+        self.lane = lane
+        self.future: Future = Future()
+        self.enqueued_at = time.monotonic()
+
+
+class _LaneStats:
+    def __init__(self):
+        self.requests = 0
+        self.texts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.max_queue_depth = 0
+
+
+class EmbeddingScheduler(EmbeddingFunction):
+    """Chroma-compatible embedding function that schedules calls onto one model thread.
+
+    ``__call__`` uses the interactive lane and ``embed_documents`` the bulk
+    lane, matching how `CachedEmbeddingFunction` routes queries and chunks.
+    """
+    def __init__(
+        self,
+        backend: EmbeddingFunction,
+        max_batch: int = None,
+        max_wait_ms: float = None,
+        bulk_chunk_size: int = None,
+    ):
+        self.backend = backend
+        self.model_name = getattr(backend, "model_name", type(backend).__name__)
+        self.max_batch = max(1, max_batch if max_batch is not None else settings.EMBEDDING_BATCH_MAX_SIZE)
+        self.max_wait = max(0.0, (max_wait_ms if max_wait_ms is not None else settings.EMBEDDING_BATCH_MAX_WAIT_MS) / 1000.0)
+        self.bulk_chunk_size = max(1, bulk_chunk_size if bulk_chunk_size is not None else settings.EMBEDDING_BULK_CHUNK_SIZE)
+        self._queues: Dict[str, Deque[_Request]] = {lane: deque() for lane in LANES}
+        self._cond = threading.Condition()
+        self._thread = None
+        self._closed = False
+        self._lane_stats = {lane: _LaneStats() for lane in LANES}
+        self._batch_histogram = [0] * (len(_BATCH_BUCKETS) + 1)
+        self.batches = 0
+        self.batched_texts = 0
+        self.encode_seconds = 0.0
+
+    def __call__(self, input: List[str]) -> List[List[float]]:
+        return self.embed(input, INTERACTIVE)
+
+    def embed_documents(self, input: List[str]) -> List[List[float]]:
+        return self.embed(input, BULK)
+
+    def embed(self, texts: List[str], lane: str = INTERACTIVE) -> List[List[float]]:
+        """Queue texts on a lane and block until their vectors are ready"""
+        if lane not in self._queues:
+            raise ValueError(f"Unknown embedding lane '{lane}'")
+        texts = list(texts)
+        if not texts:
+            return []
+        size = self.bulk_chunk_size if lane == BULK else len(texts)
+        requests = [_Request(texts[start:start + size], lane) for start in range(0, len(texts), size)]
+
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Embedding scheduler is closed")
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="embedding-scheduler", daemon=True)
+                self._thread.start()
+            queue = self._queues[lane]
+            queue.extend(requests)
+            stats = self._lane_stats[lane]
+            stats.max_queue_depth = max(stats.max_queue_depth, len(queue))
+            self._cond.notify()
+
+        vectors: List[List[float]] = []
+        for request in requests:
+            vectors.extend(request.future.result())
+        return vectors
+
+    def _next_batch(self) -> List[_Request]:
+        """Pop the next batch to encode; called with the condition held"""
+        interactive = self._queues[INTERACTIVE]
+        if interactive:
+            # Give concurrent queries a few milliseconds to join this batch
+            deadline = interactive[0].enqueued_at + self.max_wait
+            while sum(len(r.texts) for r in interactive) < self.max_batch and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            batch = [interactive.popleft()]
+            total = len(batch[0].texts)
+            while interactive and total + len(interactive[0].texts) <= self.max_batch:
+                total += len(interactive[0].texts)
+                batch.append(interactive.popleft())
+            return batch
+        return [self._queues[BULK].popleft()]
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not any(self._queues.values()) and not self._closed:
+                    self._cond.wait()
+                if not any(self._queues.values()):
+                    return
+                batch = self._next_batch()
+
+            started = time.monotonic()
+            texts = [text for request in batch for text in request.texts]
+            try:
+                vectors = self.backend(texts)
+            except Exception as e:
+                logger.error(f"Embedding batch of {len(texts)} texts failed: {e}")
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+            elapsed = time.monotonic() - started
+
+            offset = 0
+            for request in batch:
+                request.future.set_result(vectors[offset:offset + len(request.texts)])
+                offset += len(request.texts)
+            self._record(batch, len(texts), started, elapsed)
+
+    def _record(self, batch: List[_Request], text_count: int, started: float, elapsed: float) -> None:
+        with self._cond:
+            self.batches += 1
+            self.batched_texts += text_count
+            self.encode_seconds += elapsed
+            bucket = next((i for i, bound in enumerate(_BATCH_BUCKETS) if text_count <= bound), len(_BATCH_BUCKETS))
+            self._batch_histogram[bucket] += 1
+            for request in batch:
+                stats = self._lane_stats[request.lane]
+                wait = started - request.enqueued_at
+                stats.requests += 1
+                stats.texts += len(request.texts)
+                stats.wait_seconds += wait
+                stats.max_wait_seconds = max(stats.max_wait_seconds, wait)
+
+    def close(self) -> None:
+        """Finish queued work and stop the model thread"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+
+    def stats(self) -> Dict:
+        with self._cond:
+            labels = [f"<={bound}" for bound in _BATCH_BUCKETS] + [f">{_BATCH_BUCKETS[-1]}"]
+            return {
+                "model": self.model_name,
+                "max_batch": self.max_batch,
+                "max_wait_ms": self.max_wait * 1000.0,
+                "bulk_chunk_size": self.bulk_chunk_size,
+                "batches": self.batches,
+                "avg_batch_size": (self.batched_texts / self.batches) if self.batches else 0.0,
+                "batch_size_histogram": dict(zip(labels, self._batch_histogram)),
+                "encode_seconds": self.encode_seconds,
+                "lanes": {
+                    lane: {
+                        "queue_depth": len(self._queues[lane]),
+                        "max_queue_depth": stats.max_queue_depth,
+                        "requests": stats.requests,
+                        "texts": stats.texts,
+                        "avg_wait_ms": (stats.wait_seconds / stats.requests * 1000.0) if stats.requests else 0.0,
+                        "max_wait_ms": stats.max_wait_seconds * 1000.0,
+                    }
+                    for lane, stats in self._lane_stats.items()
+                },
+            }
@@ -0,0 +1,225 @@
+"""Shared local embedding service.
+
+One process loads the local embedding model and serves batch encode
+requests over a Unix socket, so uvicorn workers no longer each hold a model
+copy. Start it before the API workers:
+
+    python -m app.services.embedding_server [--socket /run/chatbot/embed.sock]
+
+and set ``EMBEDDING_SERVER_SOCKET`` to the same path; `get_embedding_function`
+then returns a `RemoteEmbeddingFunction` that talks to it.
+
+Wire format: every message is a 4-byte big-endian header length, a JSON
+header, and an optional binary payload whose size is ``payload_bytes`` in
+the header. Embeddings travel as raw float32 rows.
+"""
+from app.config import settings
+from app.services.embedding_scheduler import BULK, INTERACTIVE, EmbeddingScheduler
+from chromadb.api.types import EmbeddingFunction
+from typing import Dict, List, Optional, Tuple
+import argparse
+import json
+import logging
+import os
+import socket
+import socketserver
+import struct
+import threading
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_HEADER = struct.Struct("!I")
+
+
+def _recv_exact(sock: socket.socket, size: int) -> bytes:
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 1 << 20))
+        if not chunk:
+            raise ConnectionError("Embedding server connection closed")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def send_message(sock: socket.socket, header: Dict, payload: bytes = b"") -> None:
+    header = dict(header, payload_bytes=len(payload))
+    encoded = json.dumps(header).encode("utf-8")
+    sock.sendall(_HEADER.pack(len(encoded)) + encoded + payload)
+
+
+def recv_message(sock: socket.socket) -> Tuple[Dict, bytes]:
+    (length,) = _HEADER.unpack(_recv_exact(sock, _HEADER.size))
+    header = json.loads(_recv_exact(sock, length).decode("utf-8"))
+    payload = _recv_exact(sock, header.get("payload_bytes", 0)) if header.get("payload_bytes") else b""
+    return header, payload
+
+
+class _UnixServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+    # Every uvicorn worker thread may connect at once on startup
+    request_queue_size = 256
+
+
+class EmbeddingServer:
+    """Serve one embedding model to every worker process.
+
+    Connection threads hand requests to an `EmbeddingScheduler`, which
+    coalesces queries from all workers into micro-batches and runs
+    ingestion chunks only when no query is waiting.
+    """
+    def __init__(self, socket_path: str, backend: EmbeddingFunction):
+        self.socket_path = socket_path
+        self.scheduler = EmbeddingScheduler(backend)
+        self.model_name = self.scheduler.model_name
+        self._server = None
+
+    def encode(self, texts: List[str], lane: str = INTERACTIVE) -> np.ndarray:
+        vectors = self.scheduler.embed(texts, lane)
+        return np.asarray(vectors, dtype=np.float32) if len(vectors) else np.empty((0, 0), dtype=np.float32)
+
+    def stats(self) -> Dict:
+        return self.scheduler.stats()
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(socketserver.BaseRequestHandler):
+            def handle(self):
+                # Connections are persistent: serve requests until the client closes
+                while True:
+                    try:
+                        header, _ = recv_message(self.request)
+                    except (ConnectionError, OSError):
+                        return
+                    try:
+                        op = header.get("op")
+                        if op == "embed":
+                            vectors = server.encode(list(header.get("texts") or []), header.get("lane", INTERACTIVE))
+                            payload = np.ascontiguousarray(vectors, dtype=np.float32).tobytes()
+                            send_message(self.request, {
+                                "ok": True,
+                                "count": int(vectors.shape[0]),
+                                "dim": int(vectors.shape[1]) if vectors.ndim == 2 else 0,
+                            }, payload)
+                        elif op == "stats":
+                            send_message(self.request, {"ok": True, **server.stats()})
+                        else:
+                            send_message(self.request, {"ok": False, "error": f"Unknown op '{op}'"})
+                    except (ConnectionError, OSError):
+                        return
+                    except Exception as e:
+                        send_message(self.request, {"ok": False, "error": str(e)})
+
+        return Handler
+
+    def serve_forever(self) -> None:
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+        os.makedirs(os.path.dirname(self.socket_path) or ".", exist_ok=True)
+
+        self._server = _UnixServer(self.socket_path, self._handler_class())
+        os.chmod(self.socket_path, 0o660)
+        logger.info(f"Embedding server ({self.model_name}) listening on {self.socket_path}")
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            self.scheduler.close()
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+
+    def shutdown(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+
+
+class RemoteEmbeddingFunction(EmbeddingFunction):
+    """Chroma-compatible embedding function backed by the shared embedding server.
+
+    Each thread keeps its own persistent connection; a broken connection is
+    re-opened once before the error is raised.
+    """
+    def __init__(self, socket_path: str, model_name: Optional[str] = None, timeout: Optional[float] = None):
+        self.socket_path = socket_path
+        self.timeout = timeout if timeout is not None else settings.EMBEDDING_SERVER_TIMEOUT_SECONDS
+        self._local = threading.local()
+        self.model_name = model_name or self._server_model_name()
+
+    def _server_model_name(self) -> str:
+        """Name the server's model caches and stores vectors under (runtime and quantization included)"""
+        try:
+            response, _ = self._request({"op": "stats"})
+            if response.get("model"):
+                return response["model"]
+        except (ConnectionError, RuntimeError) as e:
+            logger.warning(f"Could not read the embedding server's model name: {e}")
+        if (settings.LOCAL_EMBEDDING_RUNTIME or "torch").lower() == "onnx":
+            from app.services.embeddings import onnx_model_key
+            return onnx_model_key(settings.LOCAL_EMBEDDING_MODEL, settings.ONNX_EMBEDDING_QUANTIZED)
+        return settings.LOCAL_EMBEDDING_MODEL
+
+    def _connection(self) -> socket.socket:
+        sock = getattr(self._local, "sock", None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.socket_path)
+            self._local.sock = sock
+        return sock
+
+    def _close(self) -> None:
+        sock = getattr(self._local, "sock", None)
+        self._local.sock = None
+        if sock is not None:
+            try:
+                sock.close()
+            except OSError:
+                pass
+
+    def _request(self, header: Dict) -> Tuple[Dict, bytes]:
+        for attempt in range(2):
+            try:
+                sock = self._connection()
+                send_message(sock, header)
+                response, payload = recv_message(sock)
+                break
+            except (ConnectionError, OSError) as e:
+                self._close()
+                if attempt:
+                    raise ConnectionError(f"Embedding server at {self.socket_path} unavailable: {e}") from e
+        if not response.get("ok"):
+            raise RuntimeError(f"Embedding server error: {response.get('error')}")
+        return response, payload
+
+    def _embed(self, texts: List[str], lane: str) -> List[List[float]]:
+        if not texts:
+            return []
+        response, payload = self._request({"op": "embed", "texts": list(texts), "lane": lane})
+        vectors = np.frombuffer(payload, dtype=np.float32).reshape(response["count"], response["dim"])
+        return vectors.tolist()
+
+    def __call__(self, input: List[str]) -> List[List[float]]:
+        return self._embed(input, INTERACTIVE)
+
+    def embed_documents(self, input: List[str]) -> List[List[float]]:
+        """Embed ingestion chunks on the server's low-priority bulk lane"""
+        return self._embed(input, BULK)
+
+    def stats(self) -> Dict:
+        response, _ = self._request({"op": "stats"})
+        response.pop("ok", None)
+        response.pop("payload_bytes", None)
+        return response
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Serve the local embedding model to all API workers")
+    parser.add_argument("--socket", default=settings.EMBEDDING_SERVER_SOCKET or "./data/embedding.sock")
+    args = parser.parse_args()
+
+    from app.services.embeddings import create_local_embedding_function
+
+    EmbeddingServer(args.socket, create_local_embedding_function()).serve_forever()
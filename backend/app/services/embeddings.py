@@ -1,6 +1,13 @@
-from typing import List
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+import json
 import logging
+import os
+import threading
+import time
+import numpy as np
 from app.config import settings
+from app.services.embedding_scheduler import EmbeddingScheduler
 from chromadb.api.types import EmbeddingFunction
 
 logger = logging.getLogger(__name__)
@@ -15,13 +22,89 @@ class LocalEmbeddingFunction(EmbeddingFunction):
             logger.error(f"sentence-transformers not available: {e}")
             raise
         
-        self.model = SentenceTransformer(settings.LOCAL_EMBEDDING_MODEL)
+        self.model_name = settings.LOCAL_EMBEDDING_MODEL
+        self.model = SentenceTransformer(self.model_name)
     
     def __call__(self, input: List[str]) -> List[List[float]]:
         vectors = self.model.encode(input, normalize_embeddings=True)
         return [v.tolist() for v in vectors]
 
 
+def onnx_model_key(model_name: str, quantized: bool) -> str:
+    """Model name ONNX vectors are cached and stored under; int8 weights give
+    different vectors than the torch model of the same name"""
+    return f"{model_name}:onnx-int8" if quantized else f"{model_name}:onnx"
+
+
+class OnnxEmbeddingFunction(EmbeddingFunction):
+    """Chroma-compatible embedding function running an exported model on ONNX Runtime.
+
+    Expects a directory written by ``python -m app.services.onnx_export``:
+    ``model.onnx`` (and ``model_quantized.onnx`` when int8 weights were
+    exported), the fast ``tokenizer.json`` and ``embedding_config.json``
+    with the pooling settings, so vectors match `LocalEmbeddingFunction`.
+    """
+    def __init__(self, model_dir: Optional[str] = None, quantized: Optional[bool] = None, threads: Optional[int] = None):
+        try:
+            import onnxruntime as ort
+            from tokenizers import Tokenizer
+        except ImportError as e:
+            logger.error(f"onnxruntime/tokenizers not available: {e}")
+            raise
+
+        model_dir = model_dir or settings.ONNX_EMBEDDING_MODEL_DIR
+        quantized = settings.ONNX_EMBEDDING_QUANTIZED if quantized is None else quantized
+        threads = settings.ONNX_EMBEDDING_THREADS if threads is None else threads
+        with open(os.path.join(model_dir, "embedding_config.json")) as f:
+            config = json.load(f)
+
+        self.pooling = config.get("pooling", "mean")
+        self.batch_size = config.get("batch_size", 32)
+        model_file = os.path.join(model_dir, "model_quantized.onnx")
+        if not quantized or not os.path.exists(model_file):
+            model_file = os.path.join(model_dir, "model.onnx")
+            quantized = False
+        self.model_file = model_file
+        self.model_name = onnx_model_key(config["model_name"], quantized)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(model_file, options, providers=["CPUExecutionProvider"])
+        self.input_names = {item.name for item in self.session.get_inputs()}
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=config["max_seq_length"])
+        self.tokenizer.enable_padding(pad_id=config["pad_token_id"], pad_token=config["pad_token"])
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        feeds = {
+            "input_ids": np.asarray([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": np.asarray([e.attention_mask for e in encodings], dtype=np.int64),
+            "token_type_ids": np.asarray([e.type_ids for e in encodings], dtype=np.int64),
+        }
+        hidden = self.session.run(None, {name: value for name, value in feeds.items() if name in self.input_names})[0]
+        if self.pooling == "cls":
+            pooled = hidden[:, 0]
+        else:
+            mask = feeds["attention_mask"][:, :, None].astype(hidden.dtype)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+        return pooled / np.clip(norms, 1e-12, None)
+
+    def __call__(self, input: List[str]) -> List[List[float]]:
+        # Batch texts of similar length together so little compute is spent on padding
+        order = sorted(range(len(input)), key=lambda idx: len(input[idx]))
+        vectors: List[Optional[List[float]]] = [None] * len(input)
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            for idx, vector in zip(batch, self._encode_batch([input[idx] for idx in batch])):
+                vectors[idx] = vector.tolist()
+        return vectors
+
+
 class OpenAIEmbeddingFunction(EmbeddingFunction):
     """Chroma-compatible embedding function using OpenAI"""
     def __init__(self):
@@ -43,15 +126,116 @@ class OpenAIEmbeddingFunction(EmbeddingFunction):
             raise
 
 
-def get_embedding_function() -> EmbeddingFunction:
-    """Return a Chroma-compatible embedding function.
-    
-    Prefers local sentence-transformers when `USE_LOCAL_EMBEDDINGS` is True;
-    otherwise uses OpenAI embeddings with the configured model.
+class EmbeddingCache:
+    """Thread-safe LRU cache of embedding vectors with a per-entry TTL.
+
+    Keys are ``(model_name, normalized_text)`` so switching embedding models
+    never serves vectors from the wrong space.
     """
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max(0, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, List[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        return " ".join((text or "").split())
+
+    def get(self, model_name: str, text: str) -> Optional[List[float]]:
+        key = (model_name, self.normalize(text))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, vector = entry
+                if self.ttl_seconds <= 0 or expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return vector
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, model_name: str, text: str, vector: List[float]) -> None:
+        if self.max_entries <= 0:
+            return
+        key = (model_name, self.normalize(text))
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, vector)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits / lookups) if lookups else 0.0,
+            }
+
+
+# Shared across every embedding function instance in the process
+embedding_cache = EmbeddingCache(
+    max_entries=settings.EMBEDDING_CACHE_SIZE,
+    ttl_seconds=settings.EMBEDDING_CACHE_TTL_SECONDS,
+)
+
+
+class CachedEmbeddingFunction(EmbeddingFunction):
+    """Chroma-compatible wrapper that serves repeated query texts from `embedding_cache`"""
+    def __init__(self, backend: EmbeddingFunction, cache: EmbeddingCache = embedding_cache):
+        self.backend = backend
+        self.cache = cache
+        self.model_name = getattr(backend, "model_name", type(backend).__name__)
+
+    def __call__(self, input: List[str]) -> List[List[float]]:
+        vectors: List[Optional[List[float]]] = [self.cache.get(self.model_name, text) for text in input]
+        missing = [idx for idx, vector in enumerate(vectors) if vector is None]
+        if missing:
+            computed = self.backend([input[idx] for idx in missing])
+            for idx, vector in zip(missing, computed):
+                vectors[idx] = vector
+                self.cache.put(self.model_name, input[idx], vector)
+        return vectors
+
+    def embed_documents(self, input: List[str]) -> List[List[float]]:
+        """Embed ingestion chunks without touching the cache, so bulk loads don't evict hot queries."""
+        embed_documents = getattr(self.backend, "embed_documents", self.backend)
+        return embed_documents(input)
+
+
+def create_local_embedding_function() -> EmbeddingFunction:
+    """Load the local model on the runtime named by `LOCAL_EMBEDDING_RUNTIME` ("torch" or "onnx")"""
+    runtime = (settings.LOCAL_EMBEDDING_RUNTIME or "torch").lower()
+    if runtime == "onnx":
+        try:
+            return OnnxEmbeddingFunction()
+        except Exception as e:
+            logger.warning(f"ONNX embedding model unavailable ({e}); falling back to sentence-transformers.")
+    elif runtime != "torch":
+        raise ValueError(f"Unknown LOCAL_EMBEDDING_RUNTIME '{runtime}' (expected 'torch' or 'onnx')")
+    return LocalEmbeddingFunction()
+
+
+def _get_backend_embedding_function() -> EmbeddingFunction:
     if settings.USE_LOCAL_EMBEDDINGS:
+        if settings.EMBEDDING_SERVER_SOCKET:
+            # The model lives in the shared embedding server; this worker only holds a socket
+            from app.services.embedding_server import RemoteEmbeddingFunction
+            return RemoteEmbeddingFunction(settings.EMBEDDING_SERVER_SOCKET)
         try:
-            return LocalEmbeddingFunction()
+            return EmbeddingScheduler(create_local_embedding_function())
         except Exception:
             logger.warning("Local embeddings unavailable; falling back to OpenAI.")
             return OpenAIEmbeddingFunction()
@@ -59,6 +243,45 @@ def get_embedding_function() -> EmbeddingFunction:
         return OpenAIEmbeddingFunction()
 
 
+_embedding_function: Optional[EmbeddingFunction] = None
+_embedding_function_lock = threading.Lock()
+
+
+def get_embedding_function() -> EmbeddingFunction:
+    """Return the process-wide Chroma-compatible embedding function.
+    
+    Prefers local sentence-transformers when `USE_LOCAL_EMBEDDINGS` is True,
+    behind an `EmbeddingScheduler` (in this process, or in the shared
+    embedding server when `EMBEDDING_SERVER_SOCKET` is set); otherwise uses
+    OpenAI embeddings with the configured model. The
+    backend is wrapped in a `CachedEmbeddingFunction` so repeated query texts
+    are not re-embedded, and is built once per process.
+    """
+    global _embedding_function
+    if _embedding_function is None:
+        with _embedding_function_lock:
+            if _embedding_function is None:
+                _embedding_function = CachedEmbeddingFunction(_get_backend_embedding_function())
+    return _embedding_function
+
+
+def get_embedding_cache_stats() -> Dict:
+    """Return hit/miss counters for the shared query-embedding cache"""
+    return embedding_cache.stats()
+
+
+def get_embedding_scheduler_stats() -> Dict:
+    """Return queue-depth and batch-size metrics of the local embedding scheduler"""
+    backend = get_embedding_function().backend
+    if not hasattr(backend, "stats"):
+        return {"enabled": False}
+    try:
+        return {"enabled": True, **backend.stats()}
+    except Exception as e:
+        logger.warning(f"Could not read embedding scheduler stats: {e}")
+        return {"enabled": True, "error": str(e)}
+
+
 def generate_embeddings(texts: List[str]) -> List[List[float]]:
     """Generate embeddings for a list of texts (for backward compatibility)"""
     embedder = get_embedding_function()
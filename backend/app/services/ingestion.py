@@ -1,16 +1,23 @@
 from sqlalchemy.orm import Session
 from app.models import KnowledgeSource, SourceType, User
+from app.services.crawl_frontier import canonicalize_url
+from app.services.crawl_state import CrawlStateWriter, delete_page_states, load_page_states, save_page_states
 from app.services.web_crawler import WebCrawler
-from app.services.rag import chroma_client
-from app.utils.parsers import parse_pdf, parse_docx, parse_xlsx, chunk_text
+from app.services.rag import ChunkRecord, chroma_client
+from app.services.answer_cache import answer_cache
+from app.services.suggestion_cache import suggestion_cache
+from app.services.context_selection import count_tokens
+from app.utils.parsers import iter_parsed_documents, iter_pdf_pages, iter_xlsx_segments, parse_docx, iter_chunks
 from app.config import settings
 import logging
 import os
 import json
 from datetime import datetime
-from typing import List, Dict, Tuple
-from urllib.parse import urlparse
+from typing import Iterable, Iterator, List, Dict, Tuple
 import hashlib
+import itertools
+import shutil
+import uuid
 
 logger = logging.getLogger(__name__)
 
@@ -23,27 +30,58 @@ def _get_org_id(user_id: int, db: Session) -> int:
     return user.organization_id
 
 
+class _NoProgress:
+    """Stand-in for `JobProgress` when ingestion runs outside the job queue"""
+    def set_stage(self, stage: str) -> None:
+        pass
+
+    def set_source(self, source_id: int) -> None:
+        pass
+
+    def update(self, **counters) -> None:
+        pass
+
+    def add(self, **counters) -> None:
+        pass
+
+
+_NO_PROGRESS = _NoProgress()
+
+
+def _pdf_page_texts(file_content: bytes, progress) -> Iterator[str]:
+    """Page texts of a PDF in order, parsed in the PDF process pool when it is large"""
+    for page_number, text in iter_pdf_pages(
+        file_content,
+        workers=settings.PDF_PARSE_WORKERS,
+        pages_per_task=settings.PDF_PAGES_PER_TASK,
+        parallel_min_pages=settings.PDF_PARALLEL_MIN_PAGES,
+    ):
+        progress.update(pages_parsed=page_number)
+        yield text
+
+
 def _stable_url_hash(url: str) -> str:
     return hashlib.sha256(url.encode('utf-8')).hexdigest()[:16]
 
 
-def _normalize_url(url: str) -> str:
-    parsed = urlparse(url)
-    scheme = parsed.scheme.lower()
-    netloc = parsed.netloc.lower()
-    if (scheme == "http" and netloc.endswith(":80")) or (scheme == "https" and netloc.endswith(":443")):
-        netloc = netloc.split(":")[0]
-    path = parsed.path or ""
-    if path != "/" and path.endswith("/"):
-        path = path[:-1]
-    normalized = f"{scheme}://{netloc}{path}"
-    if parsed.query:
-        normalized = f"{normalized}?{parsed.query}"
-    return normalized
+def _legacy_page_urls(source: KnowledgeSource, urls: List[str], page_states: Dict[str, Dict], organization_id: int, widget_id: str) -> List[str]:
+    """Stored page urls of a source (chunks or crawl states) that are not
+    canonical but canonicalize to one of `urls`"""
+    if not urls:
+        return []
+    crawled = set(urls)
+    stored = chroma_client.get_source_urls(source.id, organization_id, widget_id)
+    stored.update(page_states)
+    return sorted(url for url in stored if url not in crawled and canonicalize_url(url) in crawled)
 
 
-def ingest_web_content(url: str, max_pages: int, max_depth: int, user_id: int, widget_id: str, db: Session) -> Tuple[KnowledgeSource, int, int]:
-    """Crawl website and ingest content into knowledge base. Returns (source, pages_crawled)."""
+def ingest_web_content(url: str, max_pages: int, max_depth: int, user_id: int, widget_id: str, db: Session, progress=None) -> Tuple[KnowledgeSource, int, int]:
+    """Crawl website and ingest content into knowledge base. Returns (source, pages_crawled).
+
+    `progress` (a `JobProgress`) receives per-stage counters and may raise
+    `JobCancelled` between pages and write batches.
+    """
+    progress = progress or _NO_PROGRESS
     try:
         organization_id = _get_org_id(user_id, db)
 
@@ -55,38 +93,41 @@ def ingest_web_content(url: str, max_pages: int, max_depth: int, user_id: int, w
             KnowledgeSource.status == "active"
         ).first()
 
-        page_cache: Dict[str, Dict] = {}
-        if existing_source and existing_source.source_metadata:
-            try:
-                metadata_obj = json.loads(existing_source.source_metadata)
-                raw_cache = metadata_obj.get("page_cache", {}) or {}
-                page_cache = {_normalize_url(k): v for k, v in raw_cache.items()}
-            except Exception:
-                page_cache = {}
+        page_cache: Dict[str, Dict] = load_page_states(db, existing_source) if existing_source else {}
 
-        # Crawl website (incremental)
-        if max_pages >= 100:
-            max_workers = 10
-            crawl_delay = 0.1
-        elif max_pages >= 50:
-            max_workers = 8
-            crawl_delay = 0.15
-        elif max_pages >= 20:
-            max_workers = 6
-            crawl_delay = 0.2
-        else:
-            max_workers = 4
-            crawl_delay = 0.3
+        # Unchanged pages are settled as soon as they are fetched; a changed
+        # page's state is stored only after its chunks are, so an interrupted
+        # job re-ingests it on the next run
+        state_writer = CrawlStateWriter(db, existing_source.id) if existing_source else None
+        changed_states: Dict[str, Dict] = {}
 
+        def on_page_state(page_url: str, state: Dict, changed: bool) -> None:
+            if changed:
+                changed_states[page_url] = state
+            elif state_writer:
+                state_writer.add(page_url, state)
+
+        # Crawl website (incremental)
+        progress.set_stage("crawling")
         crawler = WebCrawler(
             url,
             max_pages,
             max_depth,
             page_cache=page_cache,
-            max_workers=max_workers,
-            crawl_delay=crawl_delay,
+            max_concurrency=settings.CRAWLER_MAX_CONCURRENCY,
+            initial_concurrency=settings.CRAWLER_INITIAL_CONCURRENCY,
+            crawl_delay=settings.CRAWLER_MIN_REQUEST_INTERVAL_SECONDS,
+            request_timeout=settings.CRAWLER_REQUEST_TIMEOUT_SECONDS,
+            respect_robots=settings.CRAWLER_RESPECT_ROBOTS,
+            use_sitemaps=settings.CRAWLER_USE_SITEMAPS,
+            progress_callback=lambda scanned, changed: progress.update(pages_scanned=scanned, pages_changed=changed),
+            on_page_state=on_page_state,
         )
-        pages = crawler.crawl()
+        try:
+            pages = crawler.crawl()
+        finally:
+            if state_writer:
+                state_writer.flush()
         
         # If no pages changed, still update metadata and return
         if pages is None:
@@ -108,51 +149,66 @@ def ingest_web_content(url: str, max_pages: int, max_depth: int, user_id: int, w
             db.add(source)
             db.commit()
             db.refresh(source)
+        progress.set_source(source.id)
+        progress.set_stage("embedding")
         
-        # Process and store each changed page
-        documents = []
-        metadatas = []
-        ids = []
-        
-        for idx, page in enumerate(pages):
-            # Chunk the content
-            chunks = chunk_text(page['content'])
-
-            # Remove old chunks for this URL (if any)
-            if page.get('url'):
-                chroma_client.delete_by_source_id_and_url(source.id, page['url'])
-            
-            for chunk_idx, chunk in enumerate(chunks):
+        # Chunk and store each changed page; chunks stream into the vector
+        # writer in fixed-size batches
+        changed_urls = [page['url'] for page in pages if page.get('url')]
+        chunk_count = 0
+
+        def page_records() -> Iterator[ChunkRecord]:
+            nonlocal chunk_count
+            for page in pages:
                 url_hash = _stable_url_hash(page['url'])
-                doc_id = f"org_{organization_id}_source_{source.id}_url_{url_hash}_chunk_{chunk_idx}"
-                documents.append(chunk)
-                metadatas.append({
-                    "organization_id": str(organization_id),
-                    "user_id": str(user_id),
-                    "widget_id": str(widget_id),
-                    "source_id": str(source.id),
-                    "source_type": "WEB",
-                    "url": page['url'],
-                    "title": page['title'],
-                    "chunk_index": chunk_idx,
-                    "content_hash": page.get("content_hash"),
-                    "created_at": datetime.now().isoformat()
-                })
-                ids.append(doc_id)
-        
-        # Add to ChromaDB
-        if documents:
-            chroma_client.add_documents(documents, metadatas, ids)
-        
+                for chunk_idx, chunk in enumerate(iter_chunks([page['content']])):
+                    chunk_count += 1
+                    doc_id = f"org_{organization_id}_source_{source.id}_url_{url_hash}_chunk_{chunk_idx}"
+                    yield chunk, {
+                        "organization_id": str(organization_id),
+                        "user_id": str(user_id),
+                        "widget_id": str(widget_id),
+                        "source_id": str(source.id),
+                        "source_type": "WEB",
+                        "url": page['url'],
+                        "title": page['title'],
+                        "chunk_index": chunk_idx,
+                        "token_count": count_tokens(chunk),
+                        "content_hash": page.get("content_hash"),
+                        "created_at": datetime.now().isoformat()
+                    }, doc_id
+
+        written = lambda count, reused: progress.add(chunks_written=count, embeddings_reused=reused)
+
+        # Chunks and states stored before URLs were canonicalized keep the
+        # raw url (unsorted query, tracking parameters); replace those copies
+        # of the re-crawled pages too
+        legacy_urls = _legacy_page_urls(source, changed_urls, page_cache, organization_id, widget_id) if existing_source else []
+
+        # Upsert the changed pages over their old chunks (ids are stable per
+        # url and position) and drop chunks the pages no longer produce
+        if changed_urls:
+            chroma_client.replace_source_pages(
+                source.id, changed_urls + legacy_urls, page_records(),
+                organization_id=organization_id, widget_id=widget_id, on_batch=written,
+            )
+
+        if pages:
+            answer_cache.invalidate(organization_id, widget_id)
+
+        if legacy_urls:
+            delete_page_states(db, source.id, legacy_urls)
+        save_page_states(db, source.id, changed_states, commit=False)
         source.source_metadata = json.dumps({
             "pages_crawled": len(pages),
             "pages_scanned": crawler.pages_scanned,
-            "page_cache": crawler.updated_cache
+            "pages_skipped": crawler.pages_skipped,
         })
         db.commit()
         db.refresh(source)
+        suggestion_cache.invalidate(organization_id, widget_id)
 
-        logger.info(f"Ingested {len(documents)} chunks from {len(pages)} pages for user {user_id} (org {organization_id})")
+        logger.info(f"Ingested {chunk_count} chunks from {len(pages)} pages for user {user_id} (org {organization_id})")
         return source, len(pages), crawler.pages_scanned
         
     except Exception as e:
@@ -160,75 +216,94 @@ def ingest_web_content(url: str, max_pages: int, max_depth: int, user_id: int, w
         raise
 
 
-def ingest_document(file_content: bytes, filename: str, source_type: SourceType, user_id: int, widget_id: str, db: Session) -> KnowledgeSource:
+def _save_upload(filename: str, file_content: bytes = None, source_path: str = None) -> str:
+    """Keep a copy of an uploaded file in the uploads directory; returns its path.
+
+    The stored name gets a unique prefix: uploads (and ZIP members from
+    different folders) often share a file name, and each source owns its copy.
+    """
+    upload_dir = os.path.join(os.getcwd(), settings.UPLOAD_DIR)
+    os.makedirs(upload_dir, exist_ok=True)
+    file_path = os.path.join(upload_dir, f"{uuid.uuid4().hex}_{os.path.basename(filename)}")
+    if source_path:
+        shutil.copyfile(source_path, file_path)
+    else:
+        with open(file_path, 'wb') as f:
+            f.write(file_content)
+    return file_path
+
+
+def _document_source(filename: str, file_path: str, source_type: SourceType, user_id: int, organization_id: int, widget_id: str) -> KnowledgeSource:
+    return KnowledgeSource(
+        user_id=user_id,
+        organization_id=organization_id,
+        widget_id=widget_id,
+        source_type=source_type,
+        name=filename,
+        file_path=file_path,
+        source_metadata=json.dumps({"original_filename": filename}),
+        status="active"
+    )
+
+
+def _document_records(chunks: Iterable[str], source: KnowledgeSource, organization_id: int, user_id: int, widget_id: str) -> Iterator[ChunkRecord]:
+    """(document, metadata, id) records for a document source's chunks, produced lazily"""
+    for idx, chunk in enumerate(chunks):
+        doc_id = f"org_{organization_id}_user_{user_id}_source_{source.id}_chunk_{idx}"
+        yield chunk, {
+            "organization_id": str(organization_id),
+            "user_id": str(user_id),
+            "widget_id": str(widget_id),
+            "source_id": str(source.id),
+            "source_type": source.source_type.value,
+            "filename": source.name,
+            "chunk_index": idx,
+            "token_count": count_tokens(chunk),
+            "created_at": datetime.now().isoformat()
+        }, doc_id
+
+
+def ingest_document(file_content: bytes, filename: str, source_type: SourceType, user_id: int, widget_id: str, db: Session, progress=None) -> KnowledgeSource:
     """Parse and ingest document into knowledge base"""
+    progress = progress or _NO_PROGRESS
     try:
         organization_id = _get_org_id(user_id, db)
+        progress.set_stage("parsing")
 
-        # Parse document based on type
+        # Parse and chunk lazily: PDF pages and spreadsheet sheets reach the
+        # chunker as they are extracted, and chunks reach the writer in batches
         if source_type == SourceType.PDF:
-            text = parse_pdf(file_content)
+            chunks = iter_chunks(_pdf_page_texts(file_content, progress))
         elif source_type == SourceType.DOCX:
-            text = parse_docx(file_content)
+            chunks = iter_chunks([parse_docx(file_content)])
         elif source_type == SourceType.XLSX:
-            text = parse_xlsx(file_content)
+            chunks = iter_chunks(iter_xlsx_segments(file_content))
         else:
             raise Exception(f"Unsupported file type: {source_type}")
         
-        if not text:
+        # Only create the source once the document is known to have text
+        first_chunk = next(chunks, None)
+        if first_chunk is None:
             raise Exception("No text content extracted from document")
         
         # Save file to uploads directory
-        upload_dir = os.path.join(os.getcwd(), settings.UPLOAD_DIR)
-        os.makedirs(upload_dir, exist_ok=True)
-        file_path = os.path.join(upload_dir, filename)
-        
-        with open(file_path, 'wb') as f:
-            f.write(file_content)
+        file_path = _save_upload(filename, file_content=file_content)
         
         # Create knowledge source
-        source = KnowledgeSource(
-            user_id=user_id,
-            organization_id=organization_id,
-            widget_id=widget_id,
-            source_type=source_type,
-            name=filename,
-            file_path=file_path,
-            source_metadata=json.dumps({"original_filename": filename}),
-            status="active"
-        )
+        source = _document_source(filename, file_path, source_type, user_id, organization_id, widget_id)
         db.add(source)
         db.commit()
         db.refresh(source)
-        
-        # Chunk the text
-        chunks = chunk_text(text)
-        
-        # Prepare for ChromaDB
-        documents = []
-        metadatas = []
-        ids = []
-        
-        for idx, chunk in enumerate(chunks):
-            doc_id = f"org_{organization_id}_user_{user_id}_source_{source.id}_chunk_{idx}"
-            documents.append(chunk)
-            metadatas.append({
-                "organization_id": str(organization_id),
-                "user_id": str(user_id),
-                "widget_id": str(widget_id),
-                "source_id": str(source.id),
-                "source_type": source_type.value,
-                "filename": filename,
-                "chunk_index": idx,
-                "created_at": datetime.now().isoformat()
-            })
-            ids.append(doc_id)
+        progress.set_source(source.id)
+        progress.set_stage("embedding")
         
         # Add to ChromaDB
-        if documents:
-            chroma_client.add_documents(documents, metadatas, ids)
+        records = _document_records(itertools.chain([first_chunk], chunks), source, organization_id, user_id, widget_id)
+        chunk_count = chroma_client.write_records(records, on_batch=lambda count, reused: progress.add(chunks_written=count, embeddings_reused=reused))
+        answer_cache.invalidate(organization_id, widget_id)
+        suggestion_cache.invalidate(organization_id, widget_id)
         
-        logger.info(f"Ingested {len(chunks)} chunks from document {filename} for user {user_id} (org {organization_id})")
+        logger.info(f"Ingested {chunk_count} chunks from document {filename} for user {user_id} (org {organization_id})")
         return source
         
     except Exception as e:
@@ -236,8 +311,64 @@ def ingest_document(file_content: bytes, filename: str, source_type: SourceType,
         raise
 
 
-def ingest_text_content(text: str, title: str, user_id: int, widget_id: str, db: Session) -> KnowledgeSource:
+def ingest_documents_bulk(files: List[Dict], user_id: int, widget_id: str, db: Session, progress=None) -> List[Dict]:
+    """Ingest many uploaded files at once; returns one result dict per file.
+
+    `files` holds ``{"filename", "source_type", "path"}`` entries for files
+    already on disk. They are parsed concurrently in the parse process pool,
+    and each file's source is created and its chunks fed into the shared
+    vector-store write batches as soon as its parse finishes, so only the
+    parses in flight are held in memory. A file that fails to parse is
+    reported in its result and does not stop the others.
+    """
+    progress = progress or _NO_PROGRESS
+    try:
+        organization_id = _get_org_id(user_id, db)
+        results = [
+            {"filename": f["filename"], "status": "failed", "source_id": None, "chunks": 0, "error": None}
+            for f in files
+        ]
+        sources: List[KnowledgeSource] = []
+
+        def bulk_records() -> Iterator[ChunkRecord]:
+            documents_to_parse = [(f["path"], SourceType(f["source_type"]).value.lower()) for f in files]
+            for index, chunks, error in iter_parsed_documents(documents_to_parse, workers=settings.PDF_PARSE_WORKERS):
+                progress.add(files_parsed=1)
+                if error or not chunks:
+                    results[index]["error"] = error or "No text content extracted from document"
+                    logger.warning(f"Bulk upload: could not parse {files[index]['filename']}: {results[index]['error']}")
+                    continue
+
+                f = files[index]
+                file_path = _save_upload(f["filename"], source_path=f["path"])
+                source = _document_source(f["filename"], file_path, SourceType(f["source_type"]), user_id, organization_id, widget_id)
+                db.add(source)
+                db.commit()
+                db.refresh(source)
+                if not sources:
+                    progress.set_stage("embedding")
+                sources.append(source)
+                progress.set_source(source.id)
+                results[index].update(status="succeeded", source_id=source.id, chunks=len(chunks))
+                yield from _document_records(chunks, source, organization_id, user_id, widget_id)
+
+        progress.set_stage("parsing")
+        chunk_count = chroma_client.write_records(bulk_records(), on_batch=lambda count, reused: progress.add(chunks_written=count, embeddings_reused=reused))
+        if sources:
+            answer_cache.invalidate(organization_id, widget_id)
+            suggestion_cache.invalidate(organization_id, widget_id)
+
+        logger.info(f"Bulk ingested {len(sources)}/{len(files)} files ({chunk_count} chunks) for user {user_id} (org {organization_id})")
+        return results
+
+    except Exception as e:
+        logger.error(f"Error ingesting documents in bulk: {str(e)}")
+        raise
+
+
+def ingest_text_content(text: str, title: str, user_id: int, widget_id: str, db: Session, progress=None) -> KnowledgeSource:
     """Ingest raw text content into knowledge base."""
+    progress = progress or _NO_PROGRESS
     try:
         organization_id = _get_org_id(user_id, db)
         if not text or not text.strip():
@@ -255,31 +386,29 @@ def ingest_text_content(text: str, title: str, user_id: int, widget_id: str, db:
         db.add(source)
         db.commit()
         db.refresh(source)
+        progress.set_source(source.id)
+        progress.set_stage("embedding")
+
+        def text_records() -> Iterator[ChunkRecord]:
+            for idx, chunk in enumerate(iter_chunks([text])):
+                doc_id = f"org_{organization_id}_user_{user_id}_source_{source.id}_chunk_{idx}"
+                yield chunk, {
+                    "organization_id": str(organization_id),
+                    "user_id": str(user_id),
+                    "widget_id": str(widget_id),
+                    "source_id": str(source.id),
+                    "source_type": SourceType.TEXT.value,
+                    "title": title,
+                    "chunk_index": idx,
+                    "token_count": count_tokens(chunk),
+                    "created_at": datetime.now().isoformat()
+                }, doc_id
+
+        chunk_count = chroma_client.write_records(text_records(), on_batch=lambda count, reused: progress.add(chunks_written=count, embeddings_reused=reused))
+        answer_cache.invalidate(organization_id, widget_id)
+        suggestion_cache.invalidate(organization_id, widget_id)
 
-        chunks = chunk_text(text)
-        documents = []
-        metadatas = []
-        ids = []
-
-        for idx, chunk in enumerate(chunks):
-            doc_id = f"org_{organization_id}_user_{user_id}_source_{source.id}_chunk_{idx}"
-            documents.append(chunk)
-            metadatas.append({
-                "organization_id": str(organization_id),
-                "user_id": str(user_id),
-                "widget_id": str(widget_id),
-                "source_id": str(source.id),
-                "source_type": SourceType.TEXT.value,
-                "title": title,
-                "chunk_index": idx,
-                "created_at": datetime.now().isoformat()
-            })
-            ids.append(doc_id)
-
-        if documents:
-            chroma_client.add_documents(documents, metadatas, ids)
-
-        logger.info(f"Ingested {len(chunks)} chunks from text source {title} for user {user_id} (org {organization_id})")
+        logger.info(f"Ingested {chunk_count} chunks from text source {title} for user {user_id} (org {organization_id})")
         return source
     except Exception as e:
         logger.error(f"Error ingesting text content: {str(e)}")
@@ -294,15 +423,19 @@ def delete_knowledge_source(source_id: int, db: Session):
             raise Exception(f"Knowledge source {source_id} not found")
         
         # Delete from ChromaDB
-        chroma_client.delete_by_source_id(source_id)
+        chroma_client.delete_by_source_id(source_id, organization_id=source.organization_id, widget_id=source.widget_id)
+        answer_cache.invalidate(source.organization_id, source.widget_id)
         
         # Delete file if it exists
         if source.file_path and os.path.exists(source.file_path):
             os.remove(source.file_path)
         
         # Delete from database
+        organization_id, widget_id = source.organization_id, source.widget_id
+        delete_page_states(db, source_id)
         db.delete(source)
         db.commit()
+        suggestion_cache.invalidate(organization_id, widget_id)
         
         logger.info(f"Deleted knowledge source {source_id}")
         
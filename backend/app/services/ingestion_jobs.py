@@ -0,0 +1,519 @@
+"""Durable queue for crawls, document uploads and text ingestion.
+
+The knowledge endpoints validate limits, insert an ``ingestion_jobs`` row and
+return straight away; `IngestionWorkerPool` threads claim queued rows and run
+the ingestion pipeline outside the request. Because the queue lives in the
+application database, jobs survive restarts and every process polling the
+same database shares one queue:
+
+- fair share: a worker always takes the oldest job of the organization with
+  the fewest running jobs, and no organization runs more than
+  `INGESTION_MAX_JOBS_PER_ORG` jobs at once, so a long crawl cannot hold
+  every worker while other tenants' uploads wait;
+- progress: `JobProgress` writes the current stage and its counters to the
+  row (throttled) and raises `JobCancelled` at the next checkpoint once a
+  cancel is requested;
+- recovery: running jobs send heartbeats; jobs whose worker died are requeued
+  up to `INGESTION_MAX_ATTEMPTS` times, then marked failed.
+
+Run the pool in the API processes (``INGESTION_WORKERS`` > 0) or set it to 0
+there and run dedicated workers with ``python -m app.services.ingestion_jobs``.
+"""
+from datetime import datetime, timedelta
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.database import SessionLocal
+from app.models import IngestionJob, SourceType
+from app.schemas import BulkUploadResponse, DocumentUploadResponse, KnowledgeSourceResponse, WebCrawlResponse
+from app.services.ingestion import (
+    delete_knowledge_source,
+    ingest_document,
+    ingest_documents_bulk,
+    ingest_text_content,
+    ingest_web_content,
+)
+from app.services.limits_service import increment_usage
+from typing import BinaryIO, Dict, List, Optional, Union
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ("queued", "running")
+TERMINAL_STATUSES = ("succeeded", "failed", "cancelled")
+_STAGE_BLOCK_BYTES = 1024 * 1024
+
+
+class JobCancelled(Exception):
+    """Raised at a progress checkpoint once the job's cancellation was requested"""
+
+
+class JobProgress:
+    """Stage and counters of a running job, mirrored to its row.
+
+    Writes are throttled to one per `flush_interval` seconds (stage changes
+    always write); each write also reads ``cancel_requested``.
+    """
+    def __init__(self, job_id: int, flush_interval: float = 1.0):
+        self.job_id = job_id
+        self.flush_interval = flush_interval
+        self.stage: Optional[str] = None
+        self.counters: Dict[str, int] = {}
+        self.source_ids: List[int] = []
+        self._last_flush = 0.0
+
+    def set_stage(self, stage: str) -> None:
+        self.stage = stage
+        self.flush(force=True)
+
+    def set_source(self, source_id: int) -> None:
+        self.source_ids.append(source_id)
+
+    def update(self, **counters) -> None:
+        self.counters.update(counters)
+        self.flush()
+
+    def add(self, **counters) -> None:
+        for name, value in counters.items():
+            self.counters[name] = self.counters.get(name, 0) + value
+        self.flush()
+
+    def flush(self, force: bool = False) -> None:
+        now = time.monotonic()
+        if not force and now - self._last_flush < self.flush_interval:
+            return
+        self._last_flush = now
+        db = SessionLocal()
+        try:
+            job = db.get(IngestionJob, self.job_id)
+            if job is None:
+                return
+            job.stage = self.stage
+            job.progress = json.dumps(self.counters)
+            job.heartbeat_at = datetime.utcnow()
+            cancel_requested = job.cancel_requested
+            db.commit()
+        finally:
+            db.close()
+        if cancel_requested:
+            raise JobCancelled()
+
+
+def _staging_dir() -> str:
+    return os.path.join(os.getcwd(), settings.UPLOAD_DIR, "jobs")
+
+
+def stage_upload(file_content: Union[bytes, BinaryIO], filename: str, max_bytes: Optional[int] = None) -> Optional[str]:
+    """Write an uploaded file where a worker can read it; returns the path.
+
+    `file_content` may also be a binary stream, which is copied in blocks
+    without holding the file in memory. A stream longer than `max_bytes` is
+    discarded and None returned.
+    """
+    staging_dir = _staging_dir()
+    os.makedirs(staging_dir, exist_ok=True)
+    path = os.path.join(staging_dir, f"{uuid.uuid4().hex}{os.path.splitext(filename)[1]}")
+    with open(path, "wb") as f:
+        if isinstance(file_content, bytes):
+            f.write(file_content)
+            return path
+        written = 0
+        while True:
+            block = file_content.read(_STAGE_BLOCK_BYTES)
+            if not block:
+                break
+            written += len(block)
+            if max_bytes is not None and written > max_bytes:
+                break
+            f.write(block)
+    if max_bytes is not None and written > max_bytes:
+        os.remove(path)
+        return None
+    return path
+
+
+def _remove_staged_file(payload: Dict) -> None:
+    paths = [payload.get("staged_path")] + [f.get("staged_path") for f in payload.get("files", [])]
+    for path in paths:
+        if path and os.path.exists(path):
+            os.remove(path)
+
+
+def enqueue_job(db: Session, job_type: str, organization_id: int, user_id: int, widget_id: str, payload: Dict) -> IngestionJob:
+    job = IngestionJob(
+        organization_id=organization_id,
+        user_id=user_id,
+        widget_id=widget_id,
+        job_type=job_type,
+        status="queued",
+        payload=json.dumps(payload),
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    ingestion_workers.notify()
+    return job
+
+
+def pending_job_totals(db: Session, organization_id: int) -> Dict[str, int]:
+    """Usage the organization's queued and running jobs will add once they finish"""
+    jobs = db.query(IngestionJob.job_type, IngestionJob.payload).filter(
+        IngestionJob.organization_id == organization_id,
+        IngestionJob.status.in_(ACTIVE_STATUSES),
+    ).all()
+    totals = {"documents": 0, "crawl_pages": 0}
+    for job_type, payload in jobs:
+        if job_type == "crawl":
+            totals["crawl_pages"] += int(json.loads(payload).get("max_pages", 0))
+        elif job_type == "bulk":
+            totals["documents"] += len(json.loads(payload).get("files", []))
+        else:
+            totals["documents"] += 1
+    return totals
+
+
+def cancel_job(db: Session, job: IngestionJob) -> IngestionJob:
+    """Cancel a queued job now, or ask the worker running it to stop"""
+    if job.status in TERMINAL_STATUSES:
+        return job
+    cancelled = db.query(IngestionJob).filter(
+        IngestionJob.id == job.id,
+        IngestionJob.status == "queued",
+    ).update(
+        {"status": "cancelled", "cancel_requested": True, "finished_at": datetime.utcnow()},
+        synchronize_session=False,
+    )
+    if not cancelled:
+        job.cancel_requested = True
+    db.commit()
+    db.refresh(job)
+    if cancelled:
+        _remove_staged_file(json.loads(job.payload))
+    return job
+
+
+def _run_crawl(job: IngestionJob, payload: Dict, db: Session, progress: JobProgress) -> Dict:
+    source, pages_crawled, pages_scanned = ingest_web_content(
+        payload["url"],
+        payload["max_pages"],
+        payload["max_depth"],
+        job.user_id,
+        job.widget_id,
+        db,
+        progress=progress,
+    )
+    increment_usage(db, job.organization_id, crawl_pages_count=pages_crawled)
+    unchanged = pages_crawled == 0
+    message = "No changes detected. Page already embedded." if unchanged else f"Crawled {pages_crawled} updated pages."
+    return WebCrawlResponse(
+        source=KnowledgeSourceResponse.model_validate(source),
+        pages_crawled=pages_crawled,
+        pages_scanned=pages_scanned,
+        unchanged=unchanged,
+        message=message,
+    ).model_dump(mode="json")
+
+
+def _run_document(job: IngestionJob, payload: Dict, db: Session, progress: JobProgress) -> Dict:
+    with open(payload["staged_path"], "rb") as f:
+        content = f.read()
+    source = ingest_document(
+        content, payload["filename"], SourceType(payload["source_type"]), job.user_id, job.widget_id, db, progress=progress
+    )
+    increment_usage(db, job.organization_id, documents_count=1)
+    return DocumentUploadResponse(
+        id=source.id,
+        name=source.name,
+        source_type=source.source_type.value,
+        status=source.status,
+        widget_id=source.widget_id or job.widget_id,
+    ).model_dump(mode="json")
+
+
+def _run_text(job: IngestionJob, payload: Dict, db: Session, progress: JobProgress) -> Dict:
+    source = ingest_text_content(payload["content"], payload["title"], job.user_id, job.widget_id, db, progress=progress)
+    increment_usage(db, job.organization_id, documents_count=1)
+    return DocumentUploadResponse(
+        id=source.id,
+        name=source.name,
+        source_type=source.source_type.value,
+        status=source.status,
+        widget_id=source.widget_id or job.widget_id,
+    ).model_dump(mode="json")
+
+
+def _run_bulk(job: IngestionJob, payload: Dict, db: Session, progress: JobProgress) -> Dict:
+    files = [
+        {"filename": f["filename"], "source_type": f["source_type"], "path": f["staged_path"]}
+        for f in payload["files"]
+    ]
+    results = ingest_documents_bulk(files, job.user_id, job.widget_id, db, progress=progress)
+    ingested = sum(1 for result in results if result["status"] == "succeeded")
+    if ingested:
+        increment_usage(db, job.organization_id, documents_count=ingested)
+    skipped = [{"filename": f["filename"], "status": "skipped", "error": f["error"]} for f in payload.get("skipped", [])]
+    return BulkUploadResponse(documents_ingested=ingested, files=results + skipped).model_dump(mode="json")
+
+
+_RUNNERS = {
+    "crawl": _run_crawl,
+    "document": _run_document,
+    "bulk": _run_bulk,
+    "text": _run_text,
+}
+
+
+class IngestionWorkerPool:
+    """Worker threads that claim and run queued ingestion jobs"""
+    def __init__(
+        self,
+        workers: int,
+        max_jobs_per_org: int,
+        poll_seconds: float,
+        heartbeat_seconds: float,
+        stale_seconds: float,
+        max_attempts: int,
+    ):
+        self.workers = workers
+        self.max_jobs_per_org = max(1, max_jobs_per_org)
+        self.poll_seconds = poll_seconds
+        self.heartbeat_seconds = heartbeat_seconds
+        self.stale_seconds = stale_seconds
+        self.max_attempts = max_attempts
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._threads: List[threading.Thread] = []
+        self._active: set = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+
+    def start(self) -> None:
+        if self.workers <= 0 or self._threads:
+            return
+        self._stop.clear()
+        self.requeue_stale()
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._worker_loop, name=f"ingestion-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        heartbeat = threading.Thread(target=self._heartbeat_loop, name="ingestion-heartbeat", daemon=True)
+        heartbeat.start()
+        self._threads.append(heartbeat)
+        logger.info(f"Ingestion worker pool started with {self.workers} workers")
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Stop claiming jobs; jobs still running are requeued by the next heartbeat check"""
+        self._stop.set()
+        self._wake.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def notify(self) -> None:
+        """A job was enqueued by this process: wake an idle worker now"""
+        self._wake.set()
+
+    def _claim_next(self) -> Optional[int]:
+        db = SessionLocal()
+        try:
+            running = dict(
+                db.query(IngestionJob.organization_id, func.count(IngestionJob.id))
+                .filter(IngestionJob.status == "running")
+                .group_by(IngestionJob.organization_id)
+                .all()
+            )
+            oldest_queued = (
+                db.query(IngestionJob.organization_id, func.min(IngestionJob.id))
+                .filter(IngestionJob.status == "queued")
+                .group_by(IngestionJob.organization_id)
+                .all()
+            )
+            # Least-served organization first, then the oldest job
+            candidates = sorted(
+                (running.get(organization_id, 0), job_id)
+                for organization_id, job_id in oldest_queued
+                if running.get(organization_id, 0) < self.max_jobs_per_org
+            )
+            now = datetime.utcnow()
+            for _, job_id in candidates:
+                claimed = db.query(IngestionJob).filter(
+                    IngestionJob.id == job_id,
+                    IngestionJob.status == "queued",
+                ).update(
+                    {
+                        "status": "running",
+                        "worker_id": self.worker_id,
+                        "attempts": IngestionJob.attempts + 1,
+                        "started_at": now,
+                        "heartbeat_at": now,
+                    },
+                    synchronize_session=False,
+                )
+                db.commit()
+                if claimed:
+                    return job_id
+            return None
+        finally:
+            db.close()
+
+    def _worker_loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                job_id = self._claim_next()
+            except Exception as e:
+                logger.error(f"Claiming ingestion job failed: {e}")
+                job_id = None
+            if job_id is None:
+                self._wake.wait(self.poll_seconds)
+                self._wake.clear()
+                continue
+            with self._lock:
+                self._active.add(job_id)
+            try:
+                self.run_job(job_id)
+            finally:
+                with self._lock:
+                    self._active.discard(job_id)
+
+    def run_job(self, job_id: int) -> None:
+        db = SessionLocal()
+        progress = JobProgress(job_id)
+        result, error = None, None
+        try:
+            job = db.get(IngestionJob, job_id)
+            payload = json.loads(job.payload)
+            try:
+                if job.cancel_requested:
+                    raise JobCancelled()
+                result = _RUNNERS[job.job_type](job, payload, db, progress)
+                status = "succeeded"
+            except JobCancelled:
+                db.rollback()
+                status = "cancelled"
+                # A crawl keeps what it already wrote; half-ingested documents are dropped
+                if job.job_type != "crawl":
+                    for source_id in progress.source_ids:
+                        delete_knowledge_source(source_id, db)
+            except Exception as e:
+                db.rollback()
+                logger.error(f"Ingestion job {job_id} ({job.job_type}) failed: {e}")
+                status, error = "failed", str(e)
+
+            job = db.get(IngestionJob, job_id)
+            job.status = status
+            job.stage = progress.stage
+            job.progress = json.dumps(progress.counters)
+            job.result = json.dumps(result) if result is not None else None
+            job.error = error
+            job.finished_at = datetime.utcnow()
+            db.commit()
+            _remove_staged_file(payload)
+            logger.info(f"Ingestion job {job_id} {status}")
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Finishing ingestion job {job_id} failed: {e}")
+        finally:
+            db.close()
+
+    def _heartbeat_loop(self) -> None:
+        while not self._stop.wait(self.heartbeat_seconds):
+            with self._lock:
+                active = list(self._active)
+            db = SessionLocal()
+            try:
+                if active:
+                    db.query(IngestionJob).filter(
+                        IngestionJob.id.in_(active),
+                        IngestionJob.status == "running",
+                    ).update({"heartbeat_at": datetime.utcnow()}, synchronize_session=False)
+                    db.commit()
+            except Exception as e:
+                db.rollback()
+                logger.error(f"Ingestion heartbeat failed: {e}")
+            finally:
+                db.close()
+            self.requeue_stale()
+
+    def requeue_stale(self) -> int:
+        """Requeue running jobs whose worker stopped sending heartbeats"""
+        cutoff = datetime.utcnow() - timedelta(seconds=self.stale_seconds)
+        db = SessionLocal()
+        try:
+            stale = db.query(IngestionJob).filter(
+                IngestionJob.status == "running",
+                IngestionJob.heartbeat_at < cutoff,
+            ).all()
+            for job in stale:
+                if job.cancel_requested or job.attempts >= self.max_attempts:
+                    job.status = "cancelled" if job.cancel_requested else "failed"
+                    job.error = None if job.cancel_requested else f"Worker stopped responding after {job.attempts} attempts"
+                    job.finished_at = datetime.utcnow()
+                    _remove_staged_file(json.loads(job.payload))
+                else:
+                    job.status = "queued"
+                    job.worker_id = None
+                logger.warning(f"Ingestion job {job.id} lost its worker; now {job.status}")
+            db.commit()
+            return len(stale)
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Requeueing stale ingestion jobs failed: {e}")
+            return 0
+        finally:
+            db.close()
+
+    def stats(self) -> Dict:
+        db = SessionLocal()
+        try:
+            counts = dict(
+                db.query(IngestionJob.status, func.count(IngestionJob.id))
+                .filter(IngestionJob.status.in_(ACTIVE_STATUSES))
+                .group_by(IngestionJob.status)
+                .all()
+            )
+        finally:
+            db.close()
+        with self._lock:
+            active = len(self._active)
+        return {
+            "workers": self.workers,
+            "active_in_process": active,
+            "queued": counts.get("queued", 0),
+            "running": counts.get("running", 0),
+        }
+
+
+# Singleton instance
+ingestion_workers = IngestionWorkerPool(
+    workers=settings.INGESTION_WORKERS,
+    max_jobs_per_org=settings.INGESTION_MAX_JOBS_PER_ORG,
+    poll_seconds=settings.INGESTION_POLL_SECONDS,
+    heartbeat_seconds=settings.INGESTION_HEARTBEAT_SECONDS,
+    stale_seconds=settings.INGESTION_JOB_STALE_SECONDS,
+    max_attempts=settings.INGESTION_MAX_ATTEMPTS,
+)
+
+
+if __name__ == "__main__":
+    import argparse
+    from app.database import init_db
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Run a dedicated ingestion worker process")
+    parser.add_argument("--workers", type=int, default=max(1, settings.INGESTION_WORKERS))
+    args = parser.parse_args()
+
+    init_db()
+    ingestion_workers.workers = args.workers
+    ingestion_workers.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        ingestion_workers.stop()
@@ -0,0 +1,193 @@
+from app.config import settings
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional
+import hashlib
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+_MAX_QUERY_TERMS = 24
+
+
+def tenant_token(organization_id, widget_id) -> str:
+    """Single alphanumeric FTS token identifying an (organization, widget) corpus"""
+    widget_hash = hashlib.sha1(str(widget_id).encode("utf-8")).hexdigest()[:16]
+    return f"t{organization_id}x{widget_hash}"
+
+
+class LexicalIndex:
+    """Per-widget BM25 keyword index backed by SQLite FTS5.
+
+    Every chunk written to the vector store is mirrored here so exact-term
+    questions (SKUs, order numbers, product names, phone numbers) can be
+    matched lexically. Rows carry a tenant token, and every query is ANDed
+    with it, so FTS only ranks the widget's own chunks.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._write_lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS chunk_fts USING fts5("
+                "tenant, content, metadata UNINDEXED, tokenize='unicode61 remove_diacritics 2')"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunk_map ("
+                "chunk_id TEXT PRIMARY KEY, fts_rowid INTEGER NOT NULL, "
+                "tenant TEXT NOT NULL, source_id TEXT, url TEXT)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ix_chunk_map_source ON chunk_map (tenant, source_id)")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            yield conn
+            conn.commit()
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _delete_rows(conn: sqlite3.Connection, rows: List[tuple]) -> int:
+        for chunk_id, fts_rowid in rows:
+            conn.execute("DELETE FROM chunk_fts WHERE rowid = ?", (fts_rowid,))
+            conn.execute("DELETE FROM chunk_map WHERE chunk_id = ?", (chunk_id,))
+        return len(rows)
+
+    def add(self, ids: List[str], documents: List[str], metadatas: List[Dict]) -> None:
+        """Insert or replace chunks; ids match the vector store ids"""
+        with self._write_lock, self._connect() as conn:
+            for chunk_id, document, metadata in zip(ids, documents, metadatas):
+                existing = conn.execute(
+                    "SELECT chunk_id, fts_rowid FROM chunk_map WHERE chunk_id = ?", (chunk_id,)
+                ).fetchall()
+                self._delete_rows(conn, existing)
+
+                tenant = tenant_token(metadata.get("organization_id"), metadata.get("widget_id"))
+                cursor = conn.execute(
+                    "INSERT INTO chunk_fts (tenant, content, metadata) VALUES (?, ?, ?)",
+                    (tenant, document or "", json.dumps({"id": chunk_id, **metadata})),
+                )
+                conn.execute(
+                    "INSERT INTO chunk_map (chunk_id, fts_rowid, tenant, source_id, url) VALUES (?, ?, ?, ?, ?)",
+                    (chunk_id, cursor.lastrowid, tenant, str(metadata.get("source_id")), metadata.get("url")),
+                )
+
+    def delete(self, organization_id, widget_id, source_id, url: Optional[str] = None) -> int:
+        """Remove a source's chunks (optionally only those for one URL); returns rows deleted"""
+        tenant = tenant_token(organization_id, widget_id)
+        sql = "SELECT chunk_id, fts_rowid FROM chunk_map WHERE tenant = ? AND source_id = ?"
+        params = [tenant, str(source_id)]
+        if url is not None:
+            sql += " AND url = ?"
+            params.append(url)
+        with self._write_lock, self._connect() as conn:
+            return self._delete_rows(conn, conn.execute(sql, params).fetchall())
+
+    def delete_ids(self, ids: List[str]) -> int:
+        """Remove chunks by id; returns rows deleted"""
+        if not ids:
+            return 0
+        with self._write_lock, self._connect() as conn:
+            rows = []
+            for start in range(0, len(ids), 500):
+                batch = list(ids[start:start + 500])
+                rows.extend(conn.execute(
+                    f"SELECT chunk_id, fts_rowid FROM chunk_map WHERE chunk_id IN ({','.join('?' * len(batch))})", batch
+                ).fetchall())
+            return self._delete_rows(conn, rows)
+
+    def count(self, organization_id, widget_id) -> int:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT COUNT(*) FROM chunk_map WHERE tenant = ?",
+                (tenant_token(organization_id, widget_id),),
+            ).fetchone()
+        return row[0] if row else 0
+
+    @staticmethod
+    def _match_expression(tenant: str, query_text: str) -> Optional[str]:
+        terms = []
+        for token in _TOKEN_RE.findall((query_text or "").lower()):
+            if token not in terms:
+                terms.append(token)
+        if not terms:
+            return None
+        quoted = " OR ".join(f'"{term}"' for term in terms[:_MAX_QUERY_TERMS])
+        return f"tenant:{tenant} AND ({quoted})"
+
+    def query(self, query_text: str, organization_id, widget_id, n_results: int = 10) -> Dict:
+        """BM25 search within one widget; results use Chroma's single-query layout.
+
+        `distances` holds None for every hit because BM25 scores are not
+        comparable with cosine distances; callers rank by position instead.
+        """
+        results = {"ids": [[]], "documents": [[]], "metadatas": [[]], "distances": [[]]}
+        expression = self._match_expression(tenant_token(organization_id, widget_id), query_text)
+        if not expression:
+            return results
+        try:
+            with self._connect() as conn:
+                rows = conn.execute(
+                    "SELECT content, metadata FROM chunk_fts WHERE chunk_fts MATCH ? "
+                    "ORDER BY bm25(chunk_fts, 0.0, 1.0) LIMIT ?",
+                    (expression, n_results),
+                ).fetchall()
+        except sqlite3.Error as e:
+            logger.warning(f"Lexical query failed: {str(e)}")
+            return results
+
+        for content, metadata_json in rows:
+            metadata = json.loads(metadata_json)
+            results["ids"][0].append(metadata.pop("id"))
+            results["documents"][0].append(content)
+            results["metadatas"][0].append(metadata)
+            results["distances"][0].append(None)
+        return results
+
+
+def reciprocal_rank_fusion(result_lists: List[Dict], n_results: int, k: int = 60) -> Dict:
+    """Merge single-query Chroma-style results with reciprocal-rank fusion.
+
+    Each hit scores sum(1 / (k + rank)) over the lists it appears in. Vector
+    distances and embeddings are carried through so the caller's distance
+    threshold and MMR stage still apply to vector hits.
+    """
+    fields = ("documents", "metadatas", "distances", "embeddings")
+    scores: Dict[str, float] = {}
+    hits: Dict[str, Dict] = {}
+    for results in result_lists:
+        ids = (results.get("ids") or [[]])[0] or []
+        columns = {}
+        for field in fields:
+            rows = results.get(field)
+            columns[field] = rows[0] if rows is not None and len(rows) and rows[0] is not None else []
+        for rank, doc_id in enumerate(ids):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank + 1)
+            hit = {field: (columns[field][rank] if rank < len(columns[field]) else None) for field in fields}
+            previous = hits.get(doc_id)
+            if previous is None:
+                hits[doc_id] = hit
+            else:
+                # Prefer the vector hit's distance/embedding over the keyword hit's None
+                for field in ("distances", "embeddings"):
+                    if previous[field] is None:
+                        previous[field] = hit[field]
+
+    ranked = sorted(scores, key=scores.get, reverse=True)[:n_results]
+    fused = {"ids": [ranked]}
+    for field in fields:
+        fused[field] = [[hits[doc_id][field] for doc_id in ranked]]
+    return fused
+
+
+# Singleton instance
+lexical_index = LexicalIndex(os.path.join(os.getcwd(), settings.LEXICAL_INDEX_PATH))
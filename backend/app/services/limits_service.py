@@ -18,6 +18,7 @@ DEFAULT_LIMITS = {
     "max_document_size_mb": None,
     "monthly_token_limit": None,
     "max_query_words": None,
+    "max_prompt_tokens": None,
     "lead_generation_enabled": None,
     "voice_chat_enabled": None,
     "multilingual_text_enabled": None,
@@ -66,6 +67,7 @@ def _build_effective_limits(plan: Plan, limits: OrganizationLimits) -> dict:
         "max_document_size_mb": limits.max_document_size_mb if limits.max_document_size_mb is not None else plan.max_document_size_mb,
         "monthly_token_limit": limits.monthly_token_limit if limits.monthly_token_limit is not None else plan.monthly_token_limit,
         "max_query_words": limits.max_query_words if limits.max_query_words is not None else plan.max_query_words,
+        "max_prompt_tokens": limits.max_prompt_tokens if limits.max_prompt_tokens is not None else plan.max_prompt_tokens,
         "lead_generation_enabled": limits.lead_generation_enabled if limits.lead_generation_enabled is not None else plan.lead_generation_enabled,
         "voice_chat_enabled": limits.voice_chat_enabled if limits.voice_chat_enabled is not None else plan.voice_chat_enabled,
         "multilingual_text_enabled": limits.multilingual_text_enabled if limits.multilingual_text_enabled is not None else plan.multilingual_text_enabled,
@@ -161,6 +163,20 @@ def get_effective_limits(db: Session, organization_id: int) -> dict:
     return effective
 
 
+def get_prompt_token_budget(limits: dict, usage: Optional[OrganizationSubscriptionUsage], completion_tokens: int) -> Optional[int]:
+    """Prompt tokens a chat request may spend: the plan's per-request budget,
+    capped by what is left of the monthly token limit after reserving room
+    for the completion. None means unlimited.
+    """
+    budget = limits.get("max_prompt_tokens")
+    token_limit = limits.get("monthly_token_limit")
+    if token_limit:
+        tokens_used = (usage.tokens_used or 0) if usage else 0
+        remaining = token_limit - tokens_used - completion_tokens
+        budget = remaining if budget is None else min(budget, remaining)
+    return budget
+
+
 def get_or_create_usage(db: Session, organization_id: int) -> OrganizationUsage:
     year, month = get_current_year_month()
     usage = db.query(OrganizationUsage).filter(
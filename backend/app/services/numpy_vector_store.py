@@ -0,0 +1,659 @@
+from app.config import settings
+from app.services.vector_store import VectorStoreBackend, TENANT_COLLECTION_PREFIX, tenant_collection_name
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+import json
+import logging
+import math
+import os
+import sqlite3
+import threading
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_DTYPE = np.float32
+_ITEM_BYTES = np.dtype(_DTYPE).itemsize
+# Reclaim tombstoned rows once they make up this share of the vector file
+_COMPACT_DEAD_RATIO = 0.25
+_COMPACT_MIN_DEAD = 1024
+_QUANTIZED_DTYPES = {"float16": np.float16, "int8": np.int8}
+_KMEANS_ITERATIONS = 10
+_KMEANS_SAMPLE_PER_LIST = 64
+_ASSIGN_BATCH_ROWS = 65536
+# Small blocks keep the float32 upcast of quantized codes cache-resident
+_SCAN_BATCH_ROWS = 4096
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1.0, norms)
+
+
+def _where_sql(where: Optional[Dict]) -> Tuple[str, List]:
+    """Translate a Chroma-style metadata filter ($and of equality / $in tests) to SQL"""
+    if not where:
+        return "", []
+    if "$and" in where:
+        clauses, params = [], []
+        for condition in where["$and"]:
+            sql, condition_params = _where_sql(condition)
+            clauses.append(sql)
+            params.extend(condition_params)
+        return "(" + " AND ".join(clauses) + ")", params
+
+    clauses, params = [], []
+    for key, value in where.items():
+        if isinstance(value, dict) and set(value) == {"$in"}:
+            values = list(value["$in"])
+            if not values:
+                clauses.append("0")
+                continue
+            clauses.append(f"json_extract(metadata, ?) IN ({', '.join('?' * len(values))})")
+            params.extend([f'$."{key}"', *values])
+            continue
+        if isinstance(value, dict):
+            if set(value) != {"$eq"}:
+                raise ValueError(f"Unsupported where operator for '{key}': {list(value)}")
+            value = value["$eq"]
+        clauses.append("json_extract(metadata, ?) = ?")
+        params.extend([f'$."{key}"', value])
+    return "(" + " AND ".join(clauses) + ")", params
+
+
+def quantize(vectors: np.ndarray, mode: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """Encode unit vectors for the scan index; returns (codes, per-row scales or None).
+
+    ``float16`` halves the matrix; ``int8`` stores each row as
+    ``round(v / scale)`` with ``scale = max|v| / 127`` and quarters it.
+    """
+    if mode == "float16":
+        return vectors.astype(np.float16), None
+    if mode == "int8":
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales = np.where(scales == 0, 1.0, scales).astype(_DTYPE)
+        return np.round(vectors / scales[:, None]).astype(np.int8), scales
+    raise ValueError(f"Unknown quantization '{mode}' (expected 'none', 'float16' or 'int8')")
+
+
+def approximate_scores(codes: np.ndarray, scales: Optional[np.ndarray], queries: np.ndarray) -> np.ndarray:
+    """(rows x queries) inner products computed from quantized codes, block by block"""
+    out = np.empty((len(codes), len(queries)), dtype=_DTYPE)
+    for start in range(0, len(codes), _SCAN_BATCH_ROWS):
+        block = np.asarray(codes[start:start + _SCAN_BATCH_ROWS], dtype=_DTYPE)
+        out[start:start + len(block)] = block @ queries.T
+    if scales is not None:
+        out *= np.asarray(scales)[:, None]
+    return out
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+def _kmeans(sample: np.ndarray, n_lists: int, seed: int = 0) -> np.ndarray:
+    """Spherical k-means over unit vectors; returns unit-norm centroids"""
+    rng = np.random.default_rng(seed)
+    centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)].copy()
+    for _ in range(_KMEANS_ITERATIONS):
+        labels = np.argmax(sample @ centroids.T, axis=1)
+        for idx in range(n_lists):
+            members = sample[labels == idx]
+            if len(members):
+                centroids[idx] = members.sum(axis=0)
+            else:
+                centroids[idx] = sample[rng.integers(len(sample))]
+        centroids = _normalize_rows(centroids)
+    return centroids.astype(_DTYPE)
+
+
+class NumpyCollection:
+    """One tenant's chunks: a memory-mapped float32 matrix plus SQLite metadata.
+
+    Row ``i`` of the vector file is the unit-normalized embedding of the chunk
+    stored with ``row = i`` in ``chunks.db``, so a query is one matrix-vector
+    product and an argpartition. Deleted or replaced chunks leave tombstoned
+    rows that compaction rewrites into a new file generation. Once the tenant
+    holds `ivf_min_rows` rows an IVF index (k-means centroids plus a row→list
+    assignment) is built and queries only scan the `nprobe` closest lists.
+
+    With `quantization` set to ``float16`` or ``int8`` a second, smaller copy
+    of the matrix is kept and scanned instead; the float32 file stays the
+    source of truth and is only read to re-score the best
+    ``n_results * rescore_factor`` candidates, so just the quantized copy
+    needs to stay resident.
+
+    Writes run inside a ``BEGIN IMMEDIATE`` transaction and bump a version
+    counter, so several worker processes can share a tenant directory: each
+    reloads its in-memory state when it sees a newer version.
+    """
+    def __init__(
+        self,
+        path: str,
+        organization_id,
+        widget_id,
+        embedding_function,
+        ivf_min_rows: int,
+        nprobe: int,
+        quantization: str = "none",
+        rescore_factor: int = 4,
+    ):
+        if quantization not in ("none", *_QUANTIZED_DTYPES):
+            raise ValueError(f"Unknown quantization '{quantization}' (expected 'none', 'float16' or 'int8')")
+        self.path = path
+        self.name = os.path.basename(path)
+        self.metadata = {"organization_id": str(organization_id), "widget_id": str(widget_id)}
+        self.embedding_function = embedding_function
+        self.ivf_min_rows = ivf_min_rows
+        self.nprobe = max(1, nprobe)
+        self.quantization = quantization
+        self.rescore_factor = rescore_factor
+        self._lock = threading.RLock()
+        self.version = None
+        os.makedirs(path, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value TEXT)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunks ("
+                "row INTEGER PRIMARY KEY, id TEXT NOT NULL UNIQUE, document TEXT, metadata TEXT NOT NULL)"
+            )
+            conn.executemany(
+                "INSERT OR IGNORE INTO info (key, value) VALUES (?, ?)",
+                [("organization_id", str(organization_id)), ("widget_id", str(widget_id)),
+                 ("dim", "0"), ("rows", "0"), ("generation", "0"), ("version", "0")],
+            )
+        self._refresh()
+
+    @contextmanager
+    def _connect(self, write: bool = False) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(os.path.join(self.path, "chunks.db"), timeout=30)
+        try:
+            if write:
+                conn.execute("BEGIN IMMEDIATE")
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    def _vector_path(self, generation: int) -> str:
+        return os.path.join(self.path, f"vectors.{generation}.f32")
+
+    def _codes_path(self, generation: int) -> str:
+        return os.path.join(self.path, f"codes.{generation}.{self.quantization}")
+
+    def _scales_path(self, generation: int) -> str:
+        return os.path.join(self.path, f"scales.{generation}.f32")
+
+    def _refresh(self, conn: Optional[sqlite3.Connection] = None) -> None:
+        """Reload in-memory state if another writer changed the collection"""
+        if conn is None:
+            with self._connect() as own_conn:
+                return self._refresh(own_conn)
+        version = conn.execute("SELECT value FROM info WHERE key = 'version'").fetchone()[0]
+        if version == self.version:
+            return
+        info = dict(conn.execute("SELECT key, value FROM info").fetchall())
+        live_rows = [row for (row,) in conn.execute("SELECT row FROM chunks")]
+        self.version = version
+        self.dim = int(info["dim"])
+        self.rows = int(info["rows"])
+        self.generation = int(info["generation"])
+
+        self._live = np.zeros(self.rows, dtype=bool)
+        if live_rows:
+            self._live[np.asarray(live_rows, dtype=np.int64)] = True
+        self._matrix = None
+        self._codes = self._scales = None
+        self._centroids = None
+        self._assignments = None
+        ivf_path = os.path.join(self.path, "ivf.npz")
+        if os.path.exists(ivf_path):
+            ivf = np.load(ivf_path)
+            if int(ivf["generation"]) == self.generation and len(ivf["assignments"]) == self.rows:
+                self._centroids = ivf["centroids"]
+                self._assignments = ivf["assignments"]
+
+    def _bump_version(self, conn: sqlite3.Connection) -> None:
+        self.version = str(int(self.version) + 1)
+        conn.executemany(
+            "UPDATE info SET value = ? WHERE key = ?",
+            [(str(self.dim), "dim"), (str(self.rows), "rows"),
+             (str(self.generation), "generation"), (self.version, "version")],
+        )
+
+    def _vectors(self) -> Optional[np.ndarray]:
+        if self._matrix is None and self.rows:
+            self._matrix = np.memmap(
+                self._vector_path(self.generation), dtype=_DTYPE, mode="r", shape=(self.rows, self.dim)
+            )
+        return self._matrix
+
+    # ------------------------------------------------------------------
+    # Quantized scan index
+    # ------------------------------------------------------------------
+    def _quantized_ready(self) -> bool:
+        if self.quantization == "none" or not self.rows:
+            return True
+        itemsize = np.dtype(_QUANTIZED_DTYPES[self.quantization]).itemsize
+        codes_path = self._codes_path(self.generation)
+        if not os.path.exists(codes_path) or os.path.getsize(codes_path) < self.rows * self.dim * itemsize:
+            return False
+        if self.quantization == "int8":
+            scales_path = self._scales_path(self.generation)
+            return os.path.exists(scales_path) and os.path.getsize(scales_path) >= self.rows * _ITEM_BYTES
+        return True
+
+    def _write_quantized(self, vectors: np.ndarray, generation: int, first_row: int) -> None:
+        """Write codes (and scales) for `vectors` starting at `first_row`, dropping anything after it"""
+        codes, scales = quantize(vectors, self.quantization)
+        with open(self._codes_path(generation), "ab") as f:
+            f.truncate(first_row * self.dim * codes.itemsize)
+            f.write(codes.tobytes())
+        if scales is not None:
+            with open(self._scales_path(generation), "ab") as f:
+                f.truncate(first_row * _ITEM_BYTES)
+                f.write(scales.tobytes())
+
+    def _build_quantized(self) -> None:
+        """(Re)encode every row of the current generation; caller holds the write transaction"""
+        vectors = self._vectors()
+        for start in range(0, self.rows, _ASSIGN_BATCH_ROWS):
+            self._write_quantized(np.asarray(vectors[start:start + _ASSIGN_BATCH_ROWS]), self.generation, start)
+        self._codes = self._scales = None
+        logger.info(f"Built {self.quantization} index for {self.name} ({self.rows} rows)")
+
+    def _ensure_quantized(self) -> None:
+        with self._lock:
+            self._refresh()
+            if self._quantized_ready():
+                return
+            with self._connect(write=True) as conn:
+                self._refresh(conn)
+                if not self._quantized_ready():
+                    self._build_quantized()
+
+    def _quantized(self) -> Tuple[Optional[np.ndarray], Optional[np.ndarray]]:
+        if self.quantization == "none" or not self.rows:
+            return None, None
+        if self._codes is None:
+            self._codes = np.memmap(
+                self._codes_path(self.generation), dtype=_QUANTIZED_DTYPES[self.quantization],
+                mode="r", shape=(self.rows, self.dim),
+            )
+            if self.quantization == "int8":
+                self._scales = np.memmap(self._scales_path(self.generation), dtype=_DTYPE, mode="r", shape=(self.rows,))
+        return self._codes, self._scales
+
+    # ------------------------------------------------------------------
+    # IVF
+    # ------------------------------------------------------------------
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        out = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), _ASSIGN_BATCH_ROWS):
+            block = np.asarray(vectors[start:start + _ASSIGN_BATCH_ROWS])
+            out[start:start + len(block)] = np.argmax(block @ self._centroids.T, axis=1)
+        return out
+
+    def _save_ivf(self) -> None:
+        ivf_path = os.path.join(self.path, "ivf.npz")
+        if self._centroids is None:
+            if os.path.exists(ivf_path):
+                os.remove(ivf_path)
+            return
+        tmp_path = os.path.join(self.path, "ivf.tmp.npz")
+        np.savez(tmp_path, centroids=self._centroids, assignments=self._assignments, generation=self.generation)
+        os.replace(tmp_path, ivf_path)
+
+    def _update_ivf(self, new_vectors: np.ndarray) -> None:
+        live_count = int(self._live.sum())
+        if not self.ivf_min_rows or live_count < self.ivf_min_rows:
+            if self._centroids is not None:
+                self._centroids = self._assignments = None
+                self._save_ivf()
+            return
+        if self._centroids is not None and len(self._assignments) + len(new_vectors) == self.rows:
+            self._assignments = np.concatenate([self._assignments, self._assign(new_vectors)])
+        else:
+            vectors = self._vectors()
+            n_lists = int(min(4096, max(16, math.sqrt(live_count))))
+            live_rows = np.flatnonzero(self._live)
+            rng = np.random.default_rng(0)
+            sample_size = min(len(live_rows), n_lists * _KMEANS_SAMPLE_PER_LIST)
+            sample = np.asarray(vectors[np.sort(rng.choice(live_rows, size=sample_size, replace=False))])
+            self._centroids = _kmeans(sample, n_lists)
+            self._assignments = self._assign(vectors)
+            logger.info(f"Built IVF index for {self.name}: {n_lists} lists over {live_count} rows")
+        self._save_ivf()
+
+    # ------------------------------------------------------------------
+    # Writes
+    # ------------------------------------------------------------------
+    def _embed(self, documents: Sequence[str]) -> List[List[float]]:
+        embed_documents = getattr(self.embedding_function, "embed_documents", self.embedding_function)
+        return embed_documents(list(documents))
+
+    @staticmethod
+    def _rows_for_ids(conn: sqlite3.Connection, ids: List[str]) -> List[int]:
+        rows = []
+        for start in range(0, len(ids), 500):
+            batch = ids[start:start + 500]
+            rows.extend(row for (row,) in conn.execute(
+                f"SELECT row FROM chunks WHERE id IN ({','.join('?' * len(batch))})", batch
+            ))
+        return rows
+
+    def upsert(self, ids: List[str], embeddings=None, metadatas: Optional[List[Dict]] = None, documents: Optional[List[str]] = None) -> None:
+        """Insert chunks, replacing any existing chunk with the same id"""
+        if not ids:
+            return
+        if embeddings is None:
+            embeddings = self._embed(documents or [])
+        vectors = _normalize_rows(np.asarray(embeddings, dtype=_DTYPE))
+        documents = documents or [None] * len(ids)
+        metadatas = metadatas or [{} for _ in ids]
+
+        with self._lock, self._connect(write=True) as conn:
+            self._refresh(conn)
+            if self.dim and vectors.shape[1] != self.dim:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match collection dimension {self.dim}")
+
+            if not self._quantized_ready():
+                self._build_quantized()
+
+            replaced = self._rows_for_ids(conn, ids)
+            conn.executemany("DELETE FROM chunks WHERE row = ?", [(row,) for row in replaced])
+            conn.executemany(
+                "INSERT INTO chunks (row, id, document, metadata) VALUES (?, ?, ?, ?)",
+                [
+                    (self.rows + offset, chunk_id, document, json.dumps(metadata or {}))
+                    for offset, (chunk_id, document, metadata) in enumerate(zip(ids, documents, metadatas))
+                ],
+            )
+            # The append only counts once the row count commits; drop bytes
+            # left behind by an earlier writer that failed before committing
+            vector_path = self._vector_path(self.generation)
+            with open(vector_path, "ab") as f:
+                f.truncate(self.rows * self.dim * _ITEM_BYTES)
+                f.write(vectors.tobytes())
+            self.dim = vectors.shape[1]
+            if self.quantization != "none":
+                self._write_quantized(vectors, self.generation, self.rows)
+
+            self.rows += len(ids)
+            self._bump_version(conn)
+            self._live = np.concatenate([self._live, np.ones(len(ids), dtype=bool)])
+            if replaced:
+                self._live[np.asarray(replaced, dtype=np.int64)] = False
+            self._matrix = None
+            self._codes = self._scales = None
+
+        with self._lock:
+            self._update_ivf(vectors)
+            self._maybe_compact()
+
+    add = upsert
+
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[Dict] = None) -> None:
+        with self._lock, self._connect(write=True) as conn:
+            self._refresh(conn)
+            rows = [row for (row,) in self._select(conn, ids=ids, where=where, columns="row")]
+            if not rows:
+                return
+            conn.executemany("DELETE FROM chunks WHERE row = ?", [(row,) for row in rows])
+            self._bump_version(conn)
+            self._live[np.asarray(rows, dtype=np.int64)] = False
+
+        with self._lock:
+            self._maybe_compact()
+
+    def _generation_files(self, generation: int) -> List[str]:
+        return [
+            os.path.join(self.path, name) for name in os.listdir(self.path)
+            if name.split(".")[0] in ("vectors", "codes", "scales") and name.split(".")[1] == str(generation)
+        ]
+
+    def _maybe_compact(self) -> None:
+        dead = self.rows - int(self._live.sum())
+        if dead < _COMPACT_MIN_DEAD or dead < self.rows * _COMPACT_DEAD_RATIO:
+            return
+        with self._connect(write=True) as conn:
+            self._refresh(conn)
+            live_rows = np.flatnonzero(self._live)
+            old_files = self._generation_files(self.generation)
+            # Leftovers from an interrupted compaction
+            for name in os.listdir(self.path):
+                path = os.path.join(self.path, name)
+                if name.split(".")[0] in ("vectors", "codes", "scales") and path not in old_files:
+                    os.remove(path)
+
+            new_generation = self.generation + 1
+            sources = [(self._vectors(), self._vector_path(new_generation))]
+            if self.quantization != "none" and self._quantized_ready():
+                codes, scales = self._quantized()
+                sources.append((codes, self._codes_path(new_generation)))
+                if scales is not None:
+                    sources.append((scales, self._scales_path(new_generation)))
+            for matrix, new_path in sources:
+                with open(new_path, "wb") as f:
+                    for start in range(0, len(live_rows), _ASSIGN_BATCH_ROWS):
+                        f.write(np.asarray(matrix[live_rows[start:start + _ASSIGN_BATCH_ROWS]]).tobytes())
+
+            # Rows only move down and are renumbered in ascending order, so no
+            # update collides with a row that has not been moved yet
+            conn.executemany(
+                "UPDATE chunks SET row = ? WHERE row = ?",
+                [(new_row, int(old_row)) for new_row, old_row in enumerate(live_rows) if new_row != old_row],
+            )
+            previous_rows = self.rows
+            self.generation = new_generation
+            self.rows = len(live_rows)
+            self._bump_version(conn)
+
+        self._live = np.ones(self.rows, dtype=bool)
+        self._matrix = None
+        self._codes = self._scales = None
+        if self._assignments is not None:
+            self._assignments = self._assignments[live_rows]
+            self._save_ivf()
+        # Open memmaps of the old generation stay valid until they are dropped
+        for path in old_files:
+            os.remove(path)
+        logger.info(f"Compacted {self.name}: {previous_rows} -> {self.rows} rows")
+
+    # ------------------------------------------------------------------
+    # Reads
+    # ------------------------------------------------------------------
+    def count(self) -> int:
+        with self._lock:
+            self._refresh()
+            return int(self._live.sum())
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes that stay resident for queries: the scanned matrix plus IVF arrays"""
+        if self.quantization == "none":
+            size = self.rows * self.dim * _ITEM_BYTES
+        else:
+            size = self.rows * self.dim * np.dtype(_QUANTIZED_DTYPES[self.quantization]).itemsize
+            if self.quantization == "int8":
+                size += self.rows * _ITEM_BYTES
+        if self._assignments is not None:
+            size += self._assignments.nbytes + self._centroids.nbytes
+        return size
+
+    @staticmethod
+    def _select(conn: sqlite3.Connection, ids=None, where=None, columns: str = "row, id, document, metadata", limit=None, offset=None) -> List[tuple]:
+        clauses, params = [], []
+        if ids is not None:
+            if not ids:
+                return []
+            clauses.append(f"id IN ({','.join('?' * len(ids))})")
+            params.extend(ids)
+        where_sql, where_params = _where_sql(where)
+        if where_sql:
+            clauses.append(where_sql)
+            params.extend(where_params)
+        sql = f"SELECT {columns} FROM chunks"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY row"
+        if limit is not None:
+            sql += " LIMIT ? OFFSET ?"
+            params.extend([limit, offset or 0])
+        return conn.execute(sql, params).fetchall()
+
+    def get(self, ids: Optional[List[str]] = None, where: Optional[Dict] = None, include: Optional[List[str]] = None, limit: Optional[int] = None, offset: Optional[int] = None) -> Dict:
+        include = ["documents", "metadatas"] if include is None else include
+        with self._lock, self._connect() as conn:
+            self._refresh(conn)
+            rows = self._select(conn, ids=ids, where=where, limit=limit, offset=offset)
+            vectors = self._vectors()
+        results = {"ids": [chunk_id for _, chunk_id, _, _ in rows]}
+        if "documents" in include:
+            results["documents"] = [document for _, _, document, _ in rows]
+        if "metadatas" in include:
+            results["metadatas"] = [json.loads(metadata) for _, _, _, metadata in rows]
+        if "embeddings" in include:
+            results["embeddings"] = [vectors[row].tolist() for row, _, _, _ in rows]
+        return results
+
+    def query(self, query_embeddings=None, n_results: int = 10, include: Optional[List[str]] = None, where: Optional[Dict] = None, query_texts=None) -> Dict:
+        include = ["documents", "metadatas", "distances"] if include is None else include
+        if query_embeddings is None:
+            query_embeddings = self.embedding_function(list(query_texts or []))
+        queries = _normalize_rows(np.asarray(query_embeddings, dtype=_DTYPE).reshape(len(query_embeddings), -1))
+        results = {key: [] for key in ["ids"] + list(include)}
+
+        if self.quantization != "none":
+            self._ensure_quantized()
+        with self._lock, self._connect() as conn:
+            self._refresh(conn)
+            vectors = self._vectors()
+            codes, scales = self._quantized()
+            mask = self._live.copy()
+            centroids, assignments = self._centroids, self._assignments
+            if where:
+                allowed = np.zeros(len(mask), dtype=bool)
+                matched = [row for (row,) in self._select(conn, where=where, columns="row")]
+                if matched:
+                    allowed[np.asarray(matched, dtype=np.int64)] = True
+                mask &= allowed
+
+        k = min(n_results, int(mask.sum()))
+        # Quantized scans keep a wider shortlist that is re-scored in float32
+        shortlist = k * max(1, self.rescore_factor) if codes is not None else k
+
+        def rank(rows: np.ndarray, approx: np.ndarray, query: np.ndarray) -> Tuple[List[int], List[float]]:
+            top = _top_k(approx, min(shortlist, len(rows)))
+            rows = rows[top]
+            if codes is None or self.rescore_factor <= 0:
+                scores = approx[top]
+            else:
+                order = np.argsort(rows)
+                exact = np.empty(len(rows), dtype=_DTYPE)
+                exact[order] = np.asarray(vectors[rows[order]]) @ query
+                scores = exact
+            best = _top_k(scores, min(k, len(rows)))
+            return rows[best].tolist(), (1.0 - scores[best]).tolist()
+
+        hits_per_query = []
+        if vectors is None or not k:
+            hits_per_query = [([], []) for _ in queries]
+        elif centroids is None:
+            # Flat scan: one pass over the (possibly quantized) matrix scores every query
+            all_scores = approximate_scores(codes, scales, queries) if codes is not None else np.asarray(vectors @ queries.T)
+            live_rows = np.flatnonzero(mask)
+            for column, query in zip(all_scores.T, queries):
+                hits_per_query.append(rank(live_rows, column[live_rows], query))
+        else:
+            nprobe = min(self.nprobe, len(centroids))
+            for query in queries:
+                probe = np.argpartition(-(centroids @ query), nprobe - 1)[:nprobe]
+                rows = np.flatnonzero(mask & np.isin(assignments, probe))
+                if not len(rows):
+                    hits_per_query.append(([], []))
+                    continue
+                if codes is not None:
+                    approx = approximate_scores(codes[rows], scales[rows] if scales is not None else None, query[None, :])[:, 0]
+                else:
+                    approx = np.asarray(vectors[rows]) @ query
+                hits_per_query.append(rank(rows, approx, query))
+
+        wanted_rows = sorted({row for rows, _ in hits_per_query for row in rows})
+        by_row = {}
+        if wanted_rows:
+            with self._connect() as conn:
+                for start in range(0, len(wanted_rows), 500):
+                    batch = wanted_rows[start:start + 500]
+                    for row in conn.execute(
+                        f"SELECT row, id, document, metadata FROM chunks WHERE row IN ({','.join('?' * len(batch))})",
+                        batch,
+                    ):
+                        by_row[row[0]] = row
+
+        for rows, distances in hits_per_query:
+            # A concurrent delete may have removed a hit since the scan
+            kept = [(row, distance) for row, distance in zip(rows, distances) if row in by_row]
+            results["ids"].append([by_row[row][1] for row, _ in kept])
+            if "documents" in include:
+                results["documents"].append([by_row[row][2] for row, _ in kept])
+            if "metadatas" in include:
+                results["metadatas"].append([json.loads(by_row[row][3]) for row, _ in kept])
+            if "distances" in include:
+                results["distances"].append([float(distance) for _, distance in kept])
+            if "embeddings" in include:
+                results["embeddings"].append([vectors[row].tolist() for row, _ in kept])
+        return results
+
+
+class NumpyVectorStore(VectorStoreBackend):
+    """In-process vector store: one `NumpyCollection` directory per tenant"""
+    name = "numpy"
+
+    def __init__(
+        self,
+        base_dir: str,
+        ivf_min_rows: Optional[int] = None,
+        nprobe: Optional[int] = None,
+        quantization: Optional[str] = None,
+        rescore_factor: Optional[int] = None,
+    ):
+        self.base_dir = base_dir
+        self.ivf_min_rows = settings.NUMPY_STORE_IVF_MIN_ROWS if ivf_min_rows is None else ivf_min_rows
+        self.nprobe = settings.NUMPY_STORE_IVF_NPROBE if nprobe is None else nprobe
+        self.quantization = (quantization or settings.NUMPY_STORE_QUANTIZATION or "none").lower()
+        self.rescore_factor = settings.NUMPY_STORE_RESCORE_FACTOR if rescore_factor is None else rescore_factor
+        os.makedirs(base_dir, exist_ok=True)
+
+    def open_collection(self, organization_id, widget_id, embedding_function, create: bool = True):
+        path = os.path.join(self.base_dir, tenant_collection_name(organization_id, widget_id))
+        if not create and not os.path.exists(os.path.join(path, "chunks.db")):
+            return None
+        return NumpyCollection(
+            path, organization_id, widget_id, embedding_function,
+            self.ivf_min_rows, self.nprobe, self.quantization, self.rescore_factor,
+        )
+
+    def list_tenants(self) -> List[Tuple[str, str]]:
+        tenants = []
+        for name in sorted(os.listdir(self.base_dir)):
+            db_path = os.path.join(self.base_dir, name, "chunks.db")
+            if not name.startswith(TENANT_COLLECTION_PREFIX) or not os.path.exists(db_path):
+                continue
+            conn = sqlite3.connect(db_path, timeout=30)
+            try:
+                info = dict(conn.execute(
+                    "SELECT key, value FROM info WHERE key IN ('organization_id', 'widget_id')"
+                ).fetchall())
+            finally:
+                conn.close()
+            tenants.append((info.get("organization_id"), info.get("widget_id")))
+        return tenants
+
+    def estimate_bytes(self, collection) -> int:
+        return collection.nbytes
@@ -0,0 +1,92 @@
+"""Export the local sentence-transformers model for `OnnxEmbeddingFunction`.
+
+Writes ``model.onnx`` (the transformer up to its last hidden state),
+optionally ``model_quantized.onnx`` with dynamic int8 weights, the fast
+tokenizer and an ``embedding_config.json`` describing pooling and sequence
+length, so the ONNX backend produces vectors in the same space as
+`LocalEmbeddingFunction`:
+
+    python -m app.services.onnx_export --output-dir ./data/onnx/all-MiniLM-L6-v2
+
+Needs torch, sentence-transformers and onnxruntime; run it once per model
+on any machine and copy the directory to the CPU nodes.
+"""
+import argparse
+import json
+import logging
+import os
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+_INPUT_NAMES = ("input_ids", "attention_mask", "token_type_ids")
+
+
+def export_model(model_name: str, output_dir: str, quantize: bool = True, opset: int = 14) -> dict:
+    """Export `model_name` to `output_dir`; returns the written embedding config"""
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    model = SentenceTransformer(model_name, device="cpu")
+    transformer = model[0].auto_model.eval()
+    tokenizer = model[0].tokenizer
+    pooling_module = model[1] if len(model) > 1 else None
+    pooling = "cls" if getattr(pooling_module, "pooling_mode_cls_token", False) else "mean"
+
+    os.makedirs(output_dir, exist_ok=True)
+    tokenizer.save_pretrained(output_dir)
+    if not os.path.exists(os.path.join(output_dir, "tokenizer.json")):
+        raise RuntimeError(f"{model_name} has no fast tokenizer; ONNX backend needs tokenizer.json")
+
+    sample = tokenizer(["Export sample sentence."], return_tensors="pt")
+    input_names = [name for name in _INPUT_NAMES if name in sample]
+
+    class _LastHiddenState(torch.nn.Module):
+        def __init__(self, inner):
+            super().__init__()
+            self.inner = inner
+
+        def forward(self, *inputs):
+            return self.inner(**dict(zip(input_names, inputs))).last_hidden_state
+
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+    model_path = os.path.join(output_dir, "model.onnx")
+    with torch.no_grad():
+        torch.onnx.export(
+            _LastHiddenState(transformer),
+            tuple(sample[name] for name in input_names),
+            model_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=opset,
+        )
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(model_path, os.path.join(output_dir, "model_quantized.onnx"), weight_type=QuantType.QInt8)
+
+    config = {
+        "model_name": model_name,
+        "max_seq_length": model.max_seq_length,
+        "pooling": pooling,
+        "pad_token": tokenizer.pad_token,
+        "pad_token_id": tokenizer.pad_token_id,
+        "dimension": model.get_sentence_embedding_dimension(),
+    }
+    with open(os.path.join(output_dir, "embedding_config.json"), "w") as f:
+        json.dump(config, f, indent=2)
+    logger.info(f"Exported {model_name} to {output_dir} (quantized={quantize})")
+    return config
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Export the local embedding model to ONNX")
+    parser.add_argument("--model", default=settings.LOCAL_EMBEDDING_MODEL)
+    parser.add_argument("--output-dir", default=settings.ONNX_EMBEDDING_MODEL_DIR)
+    parser.add_argument("--no-quantize", action="store_true", help="skip the int8 model")
+    parser.add_argument("--opset", type=int, default=14)
+    args = parser.parse_args()
+    export_model(args.model, args.output_dir, quantize=not args.no_quantize, opset=args.opset)
@@ -1,146 +1,427 @@
-import chromadb
-from chromadb.config import Settings as ChromaSettings
 from app.config import settings
+from app.services.chunk_embedding_store import chunk_embedding_store
 from app.services.embeddings import get_embedding_function
-from typing import List, Dict
+from app.services.lexical_index import lexical_index
+from app.services.vector_store import LEGACY_COLLECTION_NAME, create_vector_store
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator, List, Dict, Optional, Set, Tuple
 import logging
-import os
+import threading
 
 logger = logging.getLogger(__name__)
 
+TenantKey = Tuple[str, str]
+# (document, metadata, id) of one chunk
+ChunkRecord = Tuple[str, Dict, str]
+
+# Vector writes run here so embedding the next batch overlaps the current write
+_write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="vector-write")
+
 
 class ChromaDBClient:
+    """Vector store with one collection per (organization, widget).
+
+    Storage is delegated to the backend chosen by `VECTOR_STORE_BACKEND`
+    (Chroma or the in-process NumPy store, see `vector_store`). Collections
+    are opened lazily on first use and kept in an LRU of handles whose
+    estimated index size is bounded by `CHROMA_MEMORY_BUDGET_MB`.
+    """
     _instance = None
-    
+
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super(ChromaDBClient, cls).__new__(cls)
             cls._instance._initialized = False
         return cls._instance
-    
+
     def __init__(self):
         if self._initialized:
             return
-        
-        # Ensure directory exists
-        persist_dir = os.path.join(os.getcwd(), settings.CHROMA_PERSIST_DIR)
-        os.makedirs(persist_dir, exist_ok=True)
-        
-        self.client = chromadb.PersistentClient(
-            path=persist_dir,
-            settings=ChromaSettings(anonymized_telemetry=False)
-        )
-        
+
+        self.backend = create_vector_store()
+
         # Prepare embedding function (OpenAI or local)
         self.embedding_function = get_embedding_function()
 
-        # Get or create collection
-        self.collection = self.client.get_or_create_collection(
-            name="knowledge_base",
-            metadata={"hnsw:space": "cosine"},
-            embedding_function=self.embedding_function
-        )
-        
-        logger.info("✅ ChromaDB client initialized")
+        self.memory_budget_bytes = settings.CHROMA_MEMORY_BUDGET_MB * 1024 * 1024
+        self._collections: "OrderedDict[TenantKey, Tuple[object, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._lexical_checked = set()
+
+        if self.backend.legacy_document_count():
+            logger.warning(
+                "Shared '%s' collection still holds documents; run "
+                "`python -m app.services.rag_migration` to move them into per-tenant collections.",
+                LEGACY_COLLECTION_NAME,
+            )
+
+        logger.info(f"✅ Vector store initialized ({self.backend.name} backend)")
         self._initialized = True
-    
-    def add_documents(self, documents: List[str], metadatas: List[Dict], ids: List[str]):
-        """Add documents to ChromaDB; embeddings computed via embedding_function"""
-        try:
-            self.collection.add(
-                documents=documents,
-                metadatas=metadatas,
-                ids=ids
+
+    def _evict_over_budget(self) -> None:
+        if not self.memory_budget_bytes:
+            return
+        used = sum(size for _, size in self._collections.values())
+        # Always keep the most recently used collection
+        while used > self.memory_budget_bytes and len(self._collections) > 1:
+            key, (_, size) = self._collections.popitem(last=False)
+            used -= size
+            logger.info(f"Evicted vector collection for org {key[0]} widget {key[1]} ({size} bytes est.)")
+
+    def get_collection(self, organization_id, widget_id, create: bool = True):
+        """Return the tenant's collection, loading it on first use; None if it doesn't exist and create is False"""
+        key: TenantKey = (str(organization_id), str(widget_id))
+        with self._lock:
+            cached = self._collections.get(key)
+            if cached is not None:
+                self._collections.move_to_end(key)
+                return cached[0]
+
+        collection = self.backend.open_collection(organization_id, widget_id, self.embedding_function, create=create)
+        if collection is None:
+            return None
+
+        size = self.backend.estimate_bytes(collection)
+        with self._lock:
+            self._collections[key] = (collection, size)
+            self._collections.move_to_end(key)
+            self._evict_over_budget()
+        return collection
+
+    def _touch_size(self, organization_id, widget_id, collection) -> None:
+        key: TenantKey = (str(organization_id), str(widget_id))
+        with self._lock:
+            if key in self._collections:
+                self._collections[key] = (collection, self.backend.estimate_bytes(collection))
+                self._evict_over_budget()
+
+    def _tenant_collections(self, organization_id=None, widget_id=None) -> List[object]:
+        """Collections matching an optional organization/widget scope"""
+        if organization_id is not None and widget_id is not None:
+            collection = self.get_collection(organization_id, widget_id, create=False)
+            return [collection] if collection is not None else []
+
+        matches = []
+        for tenant_org, tenant_widget in self.backend.list_tenants():
+            if organization_id is not None and tenant_org != str(organization_id):
+                continue
+            if widget_id is not None and tenant_widget != str(widget_id):
+                continue
+            matches.append(self.get_collection(tenant_org, tenant_widget))
+        return matches
+
+    def _build_where(self, organization_id: int = None, user_id: int = None, widget_id: str = None) -> Optional[Dict]:
+        """Build a Chroma where clause for the tenant scoping filters."""
+        conditions = []
+        if organization_id is not None:
+            conditions.append({"organization_id": str(organization_id)})
+        if user_id is not None:
+            conditions.append({"user_id": str(user_id)})
+        if widget_id is not None:
+            conditions.append({"widget_id": str(widget_id)})
+
+        # ChromaDB requires $and operator when multiple conditions
+        if len(conditions) > 1:
+            return {"$and": conditions}
+        if len(conditions) == 1:
+            return conditions[0]
+        return None
+
+    def _embed_chunks(self, documents: List[str], embed_documents: Callable) -> Tuple[List[List[float]], int]:
+        """Vectors for ingestion chunks, reusing stored ones; returns (vectors, reused count)"""
+        if not settings.CHUNK_EMBEDDING_STORE_ENABLED:
+            return embed_documents(documents), 0
+        model_name = getattr(self.embedding_function, "model_name", type(self.embedding_function).__name__)
+        vectors = chunk_embedding_store.get_many(model_name, documents)
+        missing = [idx for idx, vector in enumerate(vectors) if vector is None]
+        if missing:
+            # Embed each distinct new text once, even if it repeats within the batch
+            texts = list(dict.fromkeys(documents[idx] for idx in missing))
+            computed = dict(zip(texts, embed_documents(texts)))
+            chunk_embedding_store.put_many(model_name, texts, [computed[text] for text in texts])
+            for idx in missing:
+                vectors[idx] = computed[documents[idx]]
+        return vectors, len(documents) - len(missing)
+
+    def _write_documents(self, records: Iterable[ChunkRecord], upsert: bool, on_batch: Optional[Callable[[int, int], None]] = None) -> int:
+        """Embed and write a stream of (document, metadata, id) records; returns the number written.
+
+        Records are buffered per tenant and written in `VECTOR_WRITE_BATCH_SIZE`
+        batches as the stream is consumed, so memory is bounded by the batch
+        size rather than the size of the source. The next batch is embedded
+        while the previous one is written, with at most one write in flight.
+        Chunks already in `chunk_embedding_store` are not embedded again.
+        `on_batch` gets the size of each written batch and how many of its
+        vectors were reused; an exception from it (or from the record
+        stream) stops the write.
+        """
+        batch_size = max(1, settings.VECTOR_WRITE_BATCH_SIZE)
+        embed_documents = getattr(self.embedding_function, "embed_documents", self.embedding_function)
+        buffers: Dict[TenantKey, List[ChunkRecord]] = {}
+        touched = set()
+        pending = None
+        total = 0
+
+        def mirror(batch: List[ChunkRecord]) -> None:
+            # Keep the keyword index in step with what reached the store
+            lexical_index.add([r[2] for r in batch], [r[0] for r in batch], [r[1] for r in batch])
+
+        def finish_pending() -> None:
+            nonlocal pending, total
+            (future, batch, reused), pending = pending, None
+            future.result()
+            mirror(batch)
+            total += len(batch)
+            if on_batch:
+                on_batch(len(batch), reused)
+
+        def submit(key: TenantKey, batch: List[ChunkRecord]) -> None:
+            nonlocal pending
+            collection = self.get_collection(*key)
+            touched.add(key)
+            batch_documents = [r[0] for r in batch]
+            embeddings, reused = self._embed_chunks(batch_documents, embed_documents)
+            if pending is not None:
+                finish_pending()
+            write = collection.upsert if upsert else collection.add
+            future = _write_executor.submit(
+                write,
+                documents=batch_documents,
+                embeddings=embeddings,
+                metadatas=[r[1] for r in batch],
+                ids=[r[2] for r in batch],
             )
-            logger.info(f"Added {len(documents)} documents to ChromaDB")
+            pending = (future, batch, reused)
+
+        try:
+            for record in records:
+                key = (str(record[1].get("organization_id")), str(record[1].get("widget_id")))
+                buffer = buffers.setdefault(key, [])
+                buffer.append(record)
+                if len(buffer) >= batch_size:
+                    submit(key, buffers.pop(key))
+            for key in list(buffers):
+                submit(key, buffers.pop(key))
+            if pending is not None:
+                finish_pending()
+        finally:
+            # Also on failure: never leave a write running behind the caller
+            if pending is not None:
+                future, batch, _ = pending
+                if future.exception() is None:
+                    mirror(batch)
+            for organization_id, widget_id in touched:
+                self._touch_size(organization_id, widget_id, self.get_collection(organization_id, widget_id))
+        return total
+
+    def write_records(self, records: Iterable[ChunkRecord], upsert: bool = False, on_batch: Optional[Callable[[int, int], None]] = None) -> int:
+        """Write a (possibly lazy) stream of (document, metadata, id) records; returns the number written"""
+        try:
+            written = self._write_documents(records, upsert=upsert, on_batch=on_batch)
+            logger.info(f"{'Upserted' if upsert else 'Added'} {written} documents to ChromaDB")
+            return written
         except Exception as e:
-            logger.error(f"Error adding documents to ChromaDB: {str(e)}")
+            logger.error(f"Error writing documents to ChromaDB: {str(e)}")
             raise
-    
-    def query(self, query_text: str, n_results: int = 5, user_id: int = None, organization_id: int = None, widget_id: str = None) -> Dict:
+
+    def add_documents(self, documents: List[str], metadatas: List[Dict], ids: List[str], on_batch: Optional[Callable[[int, int], None]] = None):
+        """Add documents to their tenant collections; embeddings computed via embedding_function"""
+        self.write_records(zip(documents, metadatas, ids), on_batch=on_batch)
+
+    def upsert_documents(self, documents: List[str], metadatas: List[Dict], ids: List[str], on_batch: Optional[Callable[[int, int], None]] = None):
+        """Write documents, overwriting chunks whose id already exists in place"""
+        self.write_records(zip(documents, metadatas, ids), upsert=True, on_batch=on_batch)
+
+    def get_ids(self, organization_id, widget_id, where: Dict) -> List[str]:
+        """Ids of the tenant's chunks matching a metadata filter, without documents or vectors"""
+        collection = self.get_collection(organization_id, widget_id, create=False)
+        if collection is None:
+            return []
+        return list(collection.get(where=where, include=[]).get("ids") or [])
+
+    def get_source_urls(self, source_id: int, organization_id, widget_id) -> Set[str]:
+        """Distinct page urls stored for a web source, read from chunk metadata only"""
+        collection = self.get_collection(organization_id, widget_id, create=False)
+        if collection is None:
+            return set()
+        metadatas = collection.get(where={"source_id": str(source_id)}, include=["metadatas"]).get("metadatas") or []
+        return {metadata["url"] for metadata in metadatas if metadata and metadata.get("url")}
+
+    def replace_source_pages(
+        self,
+        source_id: int,
+        urls: List[str],
+        records: Iterable[ChunkRecord],
+        organization_id: int,
+        widget_id: str,
+        on_batch: Optional[Callable[[int, int], None]] = None,
+    ) -> int:
+        """Swap in the new chunks of re-crawled pages; returns the number of stale chunks removed.
+
+        Chunk ids are stable per (source, url, position), so the new
+        (document, metadata, id) records are upserted over the old ones and
+        only ids a page no longer produces are deleted: one id-only fetch,
+        the bounded upsert batches and one delete, however many pages changed.
+        """
+        if not urls:
+            return 0
+        try:
+            where = {"$and": [{"source_id": str(source_id)}, {"url": {"$in": list(urls)}}]}
+            existing = self.get_ids(organization_id, widget_id, where)
+            written_ids = set()
+
+            def tracked() -> Iterator[ChunkRecord]:
+                for record in records:
+                    written_ids.add(record[2])
+                    yield record
+
+            self.write_records(tracked(), upsert=True, on_batch=on_batch)
+
+            stale = sorted(set(existing) - written_ids)
+            if stale:
+                collection = self.get_collection(organization_id, widget_id)
+                collection.delete(ids=stale)
+                lexical_index.delete_ids(stale)
+                self._touch_size(organization_id, widget_id, collection)
+            logger.info(f"Replaced {len(urls)} pages of source {source_id}: {len(written_ids)} chunks written, {len(stale)} stale removed")
+            return len(stale)
+        except Exception as e:
+            logger.error(f"Error replacing pages of source {source_id}: {str(e)}")
+            raise
+
+    def query(self, query_text: str, n_results: int = 5, user_id: int = None, organization_id: int = None, widget_id: str = None, include_embeddings: bool = False) -> Dict:
         """Query ChromaDB for relevant documents, optionally filtered by organization, widget, and user."""
+        return self.query_batch(
+            [query_text],
+            n_results=n_results,
+            user_id=user_id,
+            organization_id=organization_id,
+            widget_id=widget_id,
+            include_embeddings=include_embeddings,
+        )
+
+    def query_batch(self, query_texts: List[str], n_results: int = 5, user_id: int = None, organization_id: int = None, widget_id: str = None, include_embeddings: bool = False) -> Dict:
+        """Query several texts in a single round trip.
+
+        All texts are embedded in one batch and searched with one collection
+        query. Results keep Chroma's per-query layout, so ``results["documents"][i]``
+        holds the hits for ``query_texts[i]``. Scoped queries only search the
+        tenant's own collection.
+        """
+        include = ["documents", "metadatas", "distances"]
+        if include_embeddings:
+            include.append("embeddings")
+        empty = {key: [[] for _ in query_texts] for key in ["ids"] + include}
         try:
-            query_params = {
-                "query_texts": [query_text],
-                "n_results": n_results
-            }
-
-            # Build where clause with proper ChromaDB syntax
-            conditions = []
-            if organization_id is not None:
-                conditions.append({"organization_id": str(organization_id)})
-            if user_id is not None:
-                conditions.append({"user_id": str(user_id)})
-            if widget_id is not None:
-                conditions.append({"widget_id": str(widget_id)})
-
-            # ChromaDB requires $and operator when multiple conditions
-            if len(conditions) > 1:
-                query_params["where"] = {"$and": conditions}
-            elif len(conditions) == 1:
-                query_params["where"] = conditions[0]
-
-            results = self.collection.query(**query_params)
-            return results
+            collections = self._tenant_collections(organization_id, widget_id)
+            if not collections:
+                return empty
+
+            query_embeddings = self.embedding_function(list(query_texts))
+            where_clause = self._build_where(user_id=user_id)
+
+            merged = empty
+            for collection in collections:
+                count = collection.count()
+                if not count:
+                    continue
+                query_params = {
+                    "query_embeddings": query_embeddings,
+                    "n_results": min(n_results, count),
+                    "include": include
+                }
+                if where_clause:
+                    query_params["where"] = where_clause
+                results = collection.query(**query_params)
+                if len(collections) == 1:
+                    return results
+                merged = self._merge_results(merged, results, n_results)
+            return merged
         except Exception as e:
             logger.error(f"Error querying ChromaDB: {str(e)}")
             raise
-    
-    def delete_by_source_id(self, source_id: int):
+
+    def keyword_query(self, query_text: str, n_results: int = 10, organization_id: int = None, widget_id: str = None) -> Dict:
+        """BM25 keyword search over the tenant's chunks (see `LexicalIndex`)."""
+        self._ensure_lexical_index(organization_id, widget_id)
+        return lexical_index.query(query_text, organization_id, widget_id, n_results=n_results)
+
+    def _ensure_lexical_index(self, organization_id, widget_id) -> None:
+        """Backfill the keyword index once for tenants ingested before it existed"""
+        key: TenantKey = (str(organization_id), str(widget_id))
+        if key in self._lexical_checked:
+            return
+        collection = self.get_collection(organization_id, widget_id, create=False)
+        if collection is not None and collection.count() and not lexical_index.count(organization_id, widget_id):
+            existing = collection.get(include=["documents", "metadatas"])
+            lexical_index.add(existing["ids"], existing["documents"], existing["metadatas"])
+            logger.info(f"Backfilled keyword index with {len(existing['ids'])} chunks for org {organization_id} widget {widget_id}")
+        self._lexical_checked.add(key)
+
+    @staticmethod
+    def _merge_results(merged: Dict, results: Dict, n_results: int) -> Dict:
+        """Merge per-query hits from several collections, keeping the closest n_results"""
+        keys = list(merged.keys())
+        distance_pos = keys.index("distances")
+        out = {key: [] for key in keys}
+        for q_idx in range(len(merged["ids"])):
+            rows = list(zip(*(list(merged[key][q_idx]) + list(results[key][q_idx]) for key in keys)))
+            rows.sort(key=lambda row: row[distance_pos] if row[distance_pos] is not None else float("inf"))
+            rows = rows[:n_results]
+            for pos, key in enumerate(keys):
+                out[key].append([row[pos] for row in rows])
+        return out
+
+    def get_embeddings(self, ids: List[str], organization_id: int, widget_id: str) -> Dict[str, List[float]]:
+        """Fetch stored vectors for the given chunk ids in one tenant collection"""
+        collection = self.get_collection(organization_id, widget_id, create=False)
+        if collection is None or not ids:
+            return {}
+        results = collection.get(ids=list(ids), include=["embeddings"])
+        return dict(zip(results.get("ids") or [], results.get("embeddings") or []))
+
+    def delete_by_source_id(self, source_id: int, organization_id: int = None, widget_id: str = None):
         """Delete all documents for a specific source"""
         try:
-            # Get all documents with this source_id
-            results = self.collection.get(
-                where={"source_id": str(source_id)}
-            )
-            
-            if results and results['ids']:
-                self.collection.delete(ids=results['ids'])
-                logger.info(f"Deleted {len(results['ids'])} documents for source {source_id}")
+            for collection in self._tenant_collections(organization_id, widget_id):
+                # Filtered delete: a single call, no id fetch
+                collection.delete(where={"source_id": str(source_id)})
+                meta = collection.metadata or {}
+                deleted = lexical_index.delete(meta.get("organization_id"), meta.get("widget_id"), source_id)
+                logger.info(f"Deleted documents for source {source_id} ({deleted} chunks)")
         except Exception as e:
             logger.error(f"Error deleting documents from ChromaDB: {str(e)}")
             raise
 
-    def delete_by_source_id_and_url(self, source_id: int, url: str):
+    def delete_by_source_id_and_url(self, source_id: int, url: str, organization_id: int = None, widget_id: str = None):
         """Delete documents for a specific source and URL"""
         try:
-            results = self.collection.get(
-                where={"$and": [{"source_id": str(source_id)}, {"url": url}]}
-            )
-            if results and results['ids']:
-                self.collection.delete(ids=results['ids'])
-                logger.info(f"Deleted {len(results['ids'])} documents for source {source_id} url {url}")
+            for collection in self._tenant_collections(organization_id, widget_id):
+                collection.delete(where={"$and": [{"source_id": str(source_id)}, {"url": url}]})
+                meta = collection.metadata or {}
+                deleted = lexical_index.delete(meta.get("organization_id"), meta.get("widget_id"), source_id, url=url)
+                logger.info(f"Deleted documents for source {source_id} url {url} ({deleted} chunks)")
         except Exception as e:
             logger.error(f"Error deleting documents for source/url from ChromaDB: {str(e)}")
             raise
-    
+
     def get_documents(self, organization_id: int = None, user_id: int = None, widget_id: str = None) -> Dict:
         """Get documents filtered by organization, widget, and/or user."""
         try:
-            # Build where clause with proper ChromaDB syntax
-            conditions = []
-            if organization_id is not None:
-                conditions.append({"organization_id": str(organization_id)})
-            if user_id is not None:
-                conditions.append({"user_id": str(user_id)})
-            if widget_id is not None:
-                conditions.append({"widget_id": widget_id})  # widget_id is already a string
-
-            # ChromaDB requires $and operator when multiple conditions
-            where_clause = None
-            if len(conditions) > 1:
-                where_clause = {"$and": conditions}
-            elif len(conditions) == 1:
-                where_clause = conditions[0]
-
-            logger.info(f"Querying ChromaDB with where_clause: {where_clause}")
-            
-            if where_clause:
-                results = self.collection.get(where=where_clause)
-            else:
-                # If no filters, get all documents
-                results = self.collection.get()
-            
+            where_clause = self._build_where(user_id=user_id)
+
+            logger.info(f"Querying ChromaDB for org {organization_id} widget {widget_id} with where_clause: {where_clause}")
+
+            results = {"ids": [], "metadatas": [], "documents": []}
+            for collection in self._tenant_collections(organization_id, widget_id):
+                if where_clause:
+                    batch = collection.get(where=where_clause)
+                else:
+                    batch = collection.get()
+                for key in results:
+                    results[key].extend(batch.get(key) or [])
+
             logger.info(f"ChromaDB query returned {len(results.get('ids', []))} documents")
             return results
         except Exception as e:
@@ -148,6 +429,20 @@ class ChromaDBClient:
             # Return empty results on error instead of raising
             return {"ids": [], "metadatas": [], "documents": []}
 
+    def stats(self) -> Dict:
+        """Loaded collections and their estimated memory footprint"""
+        with self._lock:
+            loaded = [
+                {"organization_id": key[0], "widget_id": key[1], "estimated_bytes": size}
+                for key, (_, size) in self._collections.items()
+            ]
+        return {
+            "backend": self.backend.name,
+            "memory_budget_bytes": self.memory_budget_bytes,
+            "estimated_bytes": sum(item["estimated_bytes"] for item in loaded),
+            "loaded_collections": loaded,
+        }
+
 
 # Singleton instance
-chroma_client = ChromaDBClient()
\ No newline at end of file
+chroma_client = ChromaDBClient()
@@ -0,0 +1,85 @@
+"""Move documents from the legacy shared `knowledge_base` collection into
+per-(organization, widget) collections.
+
+Usage (from the backend directory):
+    python -m app.services.rag_migration [--batch-size 500] [--keep-legacy]
+
+The migration copies stored embeddings as-is, so nothing is re-embedded, and
+uses upserts so it can safely be re-run after an interruption.
+"""
+from app.services.rag import chroma_client, LEGACY_COLLECTION_NAME
+from app.services.vector_store import open_chroma_client
+from app.services.lexical_index import lexical_index
+from typing import Dict, List, Tuple
+import argparse
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def migrate_shared_collection(batch_size: int = 500, keep_legacy: bool = False) -> Dict[str, int]:
+    """Copy every legacy document into its tenant collection. Returns counters."""
+    stats = {"migrated": 0, "skipped": 0, "collections": 0}
+    # The legacy collection always lives in Chroma, whichever backend is active
+    legacy_client = open_chroma_client()
+    try:
+        legacy = legacy_client.get_collection(name=LEGACY_COLLECTION_NAME)
+    except Exception:
+        logger.info("No legacy collection found; nothing to migrate")
+        return stats
+
+    total = legacy.count()
+    touched = set()
+    offset = 0
+    while offset < total:
+        batch = legacy.get(
+            limit=batch_size,
+            offset=offset,
+            include=["documents", "metadatas", "embeddings"],
+        )
+        offset += batch_size
+        if not batch or not batch.get("ids"):
+            break
+
+        groups: Dict[Tuple[str, str], Dict[str, List]] = {}
+        for idx, doc_id in enumerate(batch["ids"]):
+            metadata = batch["metadatas"][idx] or {}
+            organization_id = metadata.get("organization_id")
+            widget_id = metadata.get("widget_id")
+            if not organization_id or not widget_id or widget_id == "None":
+                stats["skipped"] += 1
+                continue
+            group = groups.setdefault(
+                (organization_id, widget_id),
+                {"ids": [], "documents": [], "metadatas": [], "embeddings": []},
+            )
+            group["ids"].append(doc_id)
+            group["documents"].append(batch["documents"][idx])
+            group["metadatas"].append(metadata)
+            group["embeddings"].append(batch["embeddings"][idx])
+
+        for (organization_id, widget_id), group in groups.items():
+            collection = chroma_client.get_collection(organization_id, widget_id)
+            collection.upsert(**group)
+            lexical_index.add(group["ids"], group["documents"], group["metadatas"])
+            touched.add((organization_id, widget_id))
+            stats["migrated"] += len(group["ids"])
+
+        logger.info(f"Migrated {stats['migrated']}/{total} documents")
+
+    stats["collections"] = len(touched)
+    if not keep_legacy and stats["skipped"] == 0:
+        legacy_client.delete_collection(name=LEGACY_COLLECTION_NAME)
+        logger.info(f"Deleted legacy '{LEGACY_COLLECTION_NAME}' collection")
+    elif stats["skipped"]:
+        logger.warning(f"Kept legacy collection: {stats['skipped']} documents had no organization/widget metadata")
+    return stats
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    parser = argparse.ArgumentParser(description="Split the shared Chroma collection into per-tenant collections")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--keep-legacy", action="store_true", help="Do not delete the shared collection afterwards")
+    args = parser.parse_args()
+    print(migrate_shared_collection(batch_size=args.batch_size, keep_legacy=args.keep_legacy))
@@ -0,0 +1,179 @@
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.config import settings
+from app.database import SessionLocal
+from app.models import WidgetConfig, WidgetSuggestions
+from app.services.answer_cache import knowledge_version
+from app.services.chat_service import get_suggested_questions
+from typing import Dict, List, Optional
+import hashlib
+import json
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class CachedSuggestions:
+    """A widget's suggestion list as served to the widget"""
+    def __init__(self, organization_id: int, questions: List[str], etag: str):
+        self.organization_id = organization_id
+        self.questions = questions
+        self.etag = etag
+        self.loaded_at = time.monotonic()
+
+
+class SuggestionCache:
+    """Per-widget suggested questions, precomputed and served from memory.
+
+    Lists are computed once with `get_suggested_questions`, stored in
+    ``widget_suggestions`` (shared by all workers) and kept in a process-local
+    dict, so opening a widget costs one dictionary lookup. Ingestion calls
+    `invalidate` when a widget's sources change, which recomputes the list on
+    a background thread while the previous one keeps being served. Entries are
+    re-read from the database every `refresh_seconds`, which also picks up
+    lists recomputed by other workers and source changes made elsewhere.
+    """
+    def __init__(self, refresh_seconds: float):
+        self.refresh_seconds = refresh_seconds
+        self._entries: Dict[str, CachedSuggestions] = {}
+        # widget_id -> True when another recompute was requested while one was running
+        self._pending: Dict[str, bool] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="suggestions")
+        self.hits = 0
+        self.misses = 0
+        self.recomputes = 0
+
+    @staticmethod
+    def _etag(questions: List[str]) -> str:
+        return hashlib.sha1(json.dumps(questions).encode("utf-8")).hexdigest()[:16]
+
+    def get(self, widget_id: str) -> Optional[CachedSuggestions]:
+        """Fast path: the in-memory list, or None if it must be loaded"""
+        with self._lock:
+            entry = self._entries.get(widget_id)
+            if entry is not None and time.monotonic() - entry.loaded_at < self.refresh_seconds:
+                self.hits += 1
+                return entry
+            self.misses += 1
+            return None
+
+    def _remember(self, widget_id: str, entry: CachedSuggestions) -> None:
+        with self._lock:
+            self._entries[widget_id] = entry
+
+    def load(self, widget_id: str, db: Session) -> Optional[CachedSuggestions]:
+        """Read the stored list, computing it now if the widget has none; None for unknown widgets"""
+        row = db.query(WidgetSuggestions).filter(WidgetSuggestions.widget_id == widget_id).first()
+        if row is None:
+            widget_config = db.query(WidgetConfig).filter(WidgetConfig.widget_id == widget_id).first()
+            if widget_config is None:
+                return None
+            return self.recompute(widget_config.organization_id, widget_id, db)
+
+        entry = CachedSuggestions(row.organization_id, json.loads(row.questions), row.etag)
+        self._remember(widget_id, entry)
+        if knowledge_version(db, row.organization_id, widget_id) != row.knowledge_version:
+            self.schedule_recompute(row.organization_id, widget_id)
+        return entry
+
+    def recompute(self, organization_id: int, widget_id: str, db: Session) -> CachedSuggestions:
+        """Compute and store a widget's list"""
+        # Read the version first so a change made while computing triggers another pass
+        version = knowledge_version(db, organization_id, widget_id)
+        questions = get_suggested_questions(widget_id, organization_id, db)
+        etag = self._etag(questions)
+
+        self._store(db, {
+            "widget_id": widget_id,
+            "organization_id": organization_id,
+            "questions": json.dumps(questions),
+            "knowledge_version": version,
+            "etag": etag,
+        })
+
+        entry = CachedSuggestions(organization_id, questions, etag)
+        self._remember(widget_id, entry)
+        with self._lock:
+            self.recomputes += 1
+        return entry
+
+    @staticmethod
+    def _store(db: Session, values: Dict) -> None:
+        """Insert or update a widget's row in one statement; first opens of a new
+        widget and background recomputes may store the same widget concurrently"""
+        dialect = db.get_bind().dialect.name
+        if dialect in ("sqlite", "postgresql"):
+            insert = sqlite.insert if dialect == "sqlite" else postgresql.insert
+            statement = insert(WidgetSuggestions).values(**values)
+            update = {field: statement.excluded[field] for field in values if field != "widget_id"}
+            update["updated_at"] = func.now()
+            db.execute(statement.on_conflict_do_update(index_elements=["widget_id"], set_=update))
+            db.commit()
+            return
+
+        for attempt in range(2):
+            row = db.query(WidgetSuggestions).filter(WidgetSuggestions.widget_id == values["widget_id"]).first()
+            if row is None:
+                row = WidgetSuggestions(widget_id=values["widget_id"])
+                db.add(row)
+            for field, value in values.items():
+                setattr(row, field, value)
+            try:
+                db.commit()
+                return
+            except IntegrityError:
+                # Another worker inserted the row first; update it instead
+                db.rollback()
+                if attempt:
+                    raise
+
+    def schedule_recompute(self, organization_id: int, widget_id: str) -> None:
+        with self._lock:
+            if widget_id in self._pending:
+                self._pending[widget_id] = True
+                return
+            self._pending[widget_id] = False
+        self._executor.submit(self._recompute_job, organization_id, widget_id)
+
+    def _recompute_job(self, organization_id: int, widget_id: str) -> None:
+        while True:
+            db = SessionLocal()
+            try:
+                self.recompute(organization_id, widget_id, db)
+            except Exception as e:
+                db.rollback()
+                logger.error(f"Recomputing suggested questions for widget {widget_id} failed: {e}")
+            finally:
+                db.close()
+            with self._lock:
+                if not self._pending.get(widget_id):
+                    self._pending.pop(widget_id, None)
+                    return
+                self._pending[widget_id] = False
+
+    def invalidate(self, organization_id: int, widget_id: str) -> None:
+        """A widget's knowledge sources changed: recompute its list in the background"""
+        if widget_id:
+            self.schedule_recompute(organization_id, str(widget_id))
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "widgets": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": (self.hits / lookups) if lookups else 0.0,
+                "recomputes": self.recomputes,
+                "pending": len(self._pending),
+            }
+
+
+# Singleton instance
+suggestion_cache = SuggestionCache(refresh_seconds=settings.SUGGESTED_QUESTIONS_REFRESH_SECONDS)
@@ -0,0 +1,128 @@
+from app.config import settings
+from typing import List, Optional, Tuple
+import hashlib
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+LEGACY_COLLECTION_NAME = "knowledge_base"
+TENANT_COLLECTION_PREFIX = "kb_"
+
+
+def tenant_collection_name(organization_id, widget_id) -> str:
+    """Deterministic collection name for one (organization, widget) corpus.
+
+    Widget ids are hashed because Chroma restricts collection names to short
+    alphanumeric strings; the NumPy store reuses the name as its directory.
+    """
+    widget_hash = hashlib.sha1(str(widget_id).encode("utf-8")).hexdigest()[:16]
+    return f"{TENANT_COLLECTION_PREFIX}org{organization_id}_w{widget_hash}"
+
+
+def _chroma_settings():
+    from chromadb.config import Settings as ChromaSettings
+
+    options = {"anonymized_telemetry": False}
+    # Chroma >= 0.4.22 unloads the HNSW segments of least recently used
+    # collections under a memory limit; dropping our collection handles alone
+    # leaves every loaded index resident.
+    fields = getattr(ChromaSettings, "__fields__", {}) or {}
+    if settings.CHROMA_MEMORY_BUDGET_MB:
+        if "chroma_segment_cache_policy" in fields:
+            options["chroma_segment_cache_policy"] = "LRU"
+            options["chroma_memory_limit_bytes"] = settings.CHROMA_MEMORY_BUDGET_MB * 1024 * 1024
+        else:
+            logger.warning(
+                "CHROMA_MEMORY_BUDGET_MB is set but the installed chromadb has no segment cache "
+                "(needs >= 0.4.22); tenant indexes will stay loaded once opened."
+            )
+    return ChromaSettings(**options)
+
+
+def open_chroma_client(persist_dir: Optional[str] = None):
+    """Chroma PersistentClient over `persist_dir` (default CHROMA_PERSIST_DIR)"""
+    import chromadb
+
+    persist_dir = persist_dir or os.path.join(os.getcwd(), settings.CHROMA_PERSIST_DIR)
+    os.makedirs(persist_dir, exist_ok=True)
+    return chromadb.PersistentClient(path=persist_dir, settings=_chroma_settings())
+
+
+class VectorStoreBackend:
+    """Storage behind `ChromaDBClient`: one collection per (organization, widget).
+
+    Collections returned by a backend follow the subset of Chroma's
+    ``Collection`` API the client relies on: ``metadata``, ``count()``,
+    ``add()``/``upsert()`` with precomputed embeddings, ``query()`` with
+    ``query_embeddings``, ``get()`` and ``delete(ids=...)``. Results use
+    Chroma's dict layout and cosine distances.
+    """
+    name = "base"
+
+    def open_collection(self, organization_id, widget_id, embedding_function, create: bool = True):
+        """Return the tenant's collection; None if it doesn't exist and create is False"""
+        raise NotImplementedError
+
+    def list_tenants(self) -> List[Tuple[str, str]]:
+        """(organization_id, widget_id) of every stored collection"""
+        raise NotImplementedError
+
+    def estimate_bytes(self, collection) -> int:
+        """Approximate resident size of an open collection's index"""
+        return collection.count() * settings.CHROMA_BYTES_PER_CHUNK_ESTIMATE
+
+    def legacy_document_count(self) -> int:
+        """Documents still in the pre-tenant shared collection"""
+        return 0
+
+
+class ChromaVectorStore(VectorStoreBackend):
+    """Chroma PersistentClient with an HNSW index per tenant collection"""
+    name = "chroma"
+
+    def __init__(self, persist_dir: Optional[str] = None):
+        self.client = open_chroma_client(persist_dir)
+
+    def open_collection(self, organization_id, widget_id, embedding_function, create: bool = True):
+        name = tenant_collection_name(organization_id, widget_id)
+        if create:
+            return self.client.get_or_create_collection(
+                name=name,
+                metadata={
+                    "hnsw:space": "cosine",
+                    "organization_id": str(organization_id),
+                    "widget_id": str(widget_id),
+                },
+                embedding_function=embedding_function
+            )
+        try:
+            return self.client.get_collection(name=name, embedding_function=embedding_function)
+        except Exception:
+            return None
+
+    def list_tenants(self) -> List[Tuple[str, str]]:
+        tenants = []
+        for collection in self.client.list_collections():
+            if not collection.name.startswith(TENANT_COLLECTION_PREFIX):
+                continue
+            meta = collection.metadata or {}
+            tenants.append((meta.get("organization_id"), meta.get("widget_id")))
+        return tenants
+
+    def legacy_document_count(self) -> int:
+        try:
+            return self.client.get_collection(name=LEGACY_COLLECTION_NAME).count()
+        except Exception:
+            return 0
+
+
+def create_vector_store(backend: Optional[str] = None) -> VectorStoreBackend:
+    """Instantiate the backend named by `VECTOR_STORE_BACKEND` ("chroma" or "numpy")"""
+    backend = (backend or settings.VECTOR_STORE_BACKEND or "chroma").lower()
+    if backend == "chroma":
+        return ChromaVectorStore()
+    if backend == "numpy":
+        from app.services.numpy_vector_store import NumpyVectorStore
+        return NumpyVectorStore(os.path.join(os.getcwd(), settings.NUMPY_STORE_DIR))
+    raise ValueError(f"Unknown VECTOR_STORE_BACKEND '{backend}' (expected 'chroma' or 'numpy')")
@@ -1,207 +1,549 @@
-import requests
-from bs4 import BeautifulSoup
+import httpx
+from app.services.crawl_frontier import (
+    MAX_SITEMAP_FILES,
+    MAX_SITEMAP_URLS,
+    CrawlFrontier,
+    RobotsPolicy,
+    SitemapEntry,
+    canonicalize_url,
+    parse_sitemap,
+)
+from email.utils import parsedate_to_datetime
 from urllib.parse import urljoin, urlparse
-from typing import List, Dict, Set, Optional
+from lxml import etree
+from typing import Callable, List, Dict, Set, Optional
+import asyncio
+import hashlib
 import logging
-import time
+import re
 import threading
-from concurrent.futures import ThreadPoolExecutor, as_completed
-import hashlib
+import time
 
 logger = logging.getLogger(__name__)
 
+USER_AGENT = 'Mozilla/5.0 (compatible; Chatbot/1.0)'
+# Product token matched against robots.txt User-agent lines
+ROBOTS_AGENT = 'Chatbot'
+# Upper bound on a robots.txt Crawl-delay, which would otherwise stretch a crawl to hours
+_MAX_CRAWL_DELAY_SECONDS = 10.0
+
+# Responses that mean "slow down"; the URL is retried up to _MAX_RETRIES times
+_BACKOFF_STATUSES = {429, 503}
+_MAX_RETRIES = 2
+_MAX_RETRY_AFTER_SECONDS = 120.0
+
+
+# Subtrees whose text is never page content
+_SKIP_TAGS = {"head", "script", "style", "noscript", "template", "svg", "math", "iframe", "canvas", "select", "button"}
+# Site chrome: dropped outright (nav, aside) or outside <main>/<article> (header, footer)
+_CHROME_TAGS = {"nav", "aside"}
+_PAGE_CHROME_TAGS = {"header", "footer"}
+_CHROME_ROLES = {"navigation", "banner", "contentinfo", "complementary", "search", "alertdialog"}
+_CHROME_CLASS_RE = re.compile(
+    r"cookie|consent|gdpr|onetrust|cookiebot|cc-window|cc-banner|newsletter|breadcrumb|skip-link|share-buttons|social-share"
+)
+# Elements that separate words when their text is joined
+_BLOCK_TAGS = {
+    "p", "div", "section", "article", "main", "header", "footer", "li", "ul", "ol", "dl", "dt", "dd",
+    "table", "thead", "tbody", "tr", "td", "th", "caption", "h1", "h2", "h3", "h4", "h5", "h6",
+    "br", "hr", "blockquote", "pre", "figure", "figcaption", "address", "details", "summary", "label",
+}
+_DIGITS_RE = re.compile(r"\d+")
+_parsers = threading.local()
+
+
+def _html_parser() -> etree.HTMLParser:
+    # lxml parsers must not be shared between threads
+    parser = getattr(_parsers, "html", None)
+    if parser is None:
+        parser = etree.HTMLParser(encoding="utf-8", remove_comments=True, remove_pis=True)
+        _parsers.html = parser
+    return parser
+
+
+def _is_chrome(tag: str, element, in_content: bool) -> bool:
+    if tag in _CHROME_TAGS or (tag in _PAGE_CHROME_TAGS and not in_content):
+        return True
+    if element.get("hidden") is not None or element.get("aria-hidden") == "true":
+        return True
+    if (element.get("role") or "").lower() in _CHROME_ROLES:
+        return True
+    marker = f"{element.get('id') or ''} {element.get('class') or ''}".lower()
+    return bool(marker.strip()) and _CHROME_CLASS_RE.search(marker) is not None
+
+
+def hash_content(text: str) -> str:
+    """Change-detection hash: case, digits (dates, counters) and whitespace are ignored"""
+    normalized = " ".join(_DIGITS_RE.sub("", text.lower()).split())
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+def extract_page(html: str) -> Dict:
+    """Title, main-content text, content hash, raw link hrefs, canonical href and <base> of an HTML page.
+
+    One lxml parse and one walk over the tree. Text comes from `<main>` (or
+    role=main) when the page has one, otherwise from the whole body; either
+    way navigation, asides, site header/footer, cookie/consent banners,
+    hidden elements, scripts and styles are left out. Links are collected
+    from the whole page, chrome included, so the crawl still follows menus.
+    """
+    title = None
+    canonical = None
+    base = None
+    links: List[str] = []
+    parts: List[str] = []
+    main_parts: List[str] = []
+
+    root = etree.fromstring(html.encode('utf-8'), _html_parser()) if html and html.strip() else None
+    if root is None:
+        return {'title': "No Title", 'text': "", 'content_hash': hash_content(""), 'links': [], 'canonical': None, 'base': None}
+
+    # Per open element: (skipped, content, main)
+    stack: List[tuple] = []
+    skip_depth = content_depth = main_depth = 0
+    for event, element in etree.iterwalk(root, events=("start", "end")):
+        tag = element.tag
+        if not isinstance(tag, str):
+            continue
+        tag = tag.lower()
+        if event == "start":
+            if tag == "a":
+                href = element.get("href")
+                if href:
+                    links.append(href)
+            elif tag == "title" and title is None:
+                title = " ".join("".join(element.itertext()).split())
+            elif tag == "link" and canonical is None and "canonical" in (element.get("rel") or "").lower().split():
+                canonical = element.get("href")
+            elif tag == "base" and base is None:
+                base = element.get("href")
+
+            skipped = not skip_depth and (tag in _SKIP_TAGS or _is_chrome(tag, element, content_depth > 0))
+            is_content = tag in ("main", "article") or (element.get("role") or "").lower() == "main"
+            is_main = tag == "main" or (element.get("role") or "").lower() == "main"
+            stack.append((skipped, is_content, is_main))
+            skip_depth += skipped
+            content_depth += is_content
+            main_depth += is_main
+            if not skip_depth:
+                if tag in _BLOCK_TAGS:
+                    parts.append(" ")
+                    if main_depth:
+                        main_parts.append(" ")
+                if element.text:
+                    parts.append(element.text)
+                    if main_depth:
+                        main_parts.append(element.text)
+        else:
+            skipped, is_content, is_main = stack.pop()
+            skip_depth -= skipped
+            content_depth -= is_content
+            main_depth -= is_main
+            # The tail belongs to the parent, so it is kept or skipped with it
+            if not skip_depth:
+                tail = (" " if tag in _BLOCK_TAGS else "") + (element.tail or "")
+                if tail:
+                    parts.append(tail)
+                    if main_depth:
+                        main_parts.append(tail)
+
+    main_text = " ".join("".join(main_parts).split())
+    text = main_text or " ".join("".join(parts).split())
+    return {
+        'title': title or "No Title",
+        'text': text,
+        'content_hash': hash_content(text),
+        'links': links,
+        'canonical': canonical,
+        'base': base,
+    }
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date)"""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        seconds = float(value)
+    except ValueError:
+        try:
+            seconds = parsedate_to_datetime(value).timestamp() - time.time()
+        except (TypeError, ValueError):
+            return None
+    return min(max(seconds, 0.0), _MAX_RETRY_AFTER_SECONDS)
+
+
+class HostLimiter:
+    """AIMD concurrency window for one host.
+
+    The window grows by one request per window's worth of fast successful
+    responses (additive increase) and is halved on 429/503, timeouts and
+    connection errors, or cut by a quarter when responses get much slower
+    than the fastest seen (multiplicative decrease). At most one decrease is
+    applied per response time, so a burst of failures from requests already
+    in flight counts once. `Retry-After` pauses new requests to the host.
+    """
+    def __init__(self, initial: int, maximum: int, min_interval: float = 0.0):
+        self.maximum = max(1, maximum)
+        self.limit = float(min(max(1, initial), self.maximum))
+        self.min_interval = max(0.0, min_interval)
+        self.in_flight = 0
+        self.blocked_until = 0.0
+        self._next_start = 0.0
+        self._latency_floor: Optional[float] = None
+        self._last_decrease = 0.0
+        self._cond = asyncio.Condition()
+
+    async def acquire(self) -> None:
+        loop = asyncio.get_running_loop()
+        async with self._cond:
+            while True:
+                now = loop.time()
+                wait = max(self.blocked_until, self._next_start) - now
+                if wait <= 0 and self.in_flight < int(self.limit):
+                    break
+                if wait > 0:
+                    try:
+                        await asyncio.wait_for(self._cond.wait(), wait)
+                    except asyncio.TimeoutError:
+                        pass
+                else:
+                    await self._cond.wait()
+            self.in_flight += 1
+            self._next_start = now + self.min_interval
+
+    def _decrease(self, now: float, latency: float, factor: float) -> None:
+        if now - self._last_decrease < latency:
+            return
+        self._last_decrease = now
+        self.limit = max(1.0, self.limit * factor)
+
+    async def release(self, latency: float, status: Optional[int], retry_after: Optional[float] = None) -> None:
+        """Record a finished request; `status` is None when it failed without a response"""
+        loop = asyncio.get_running_loop()
+        async with self._cond:
+            self.in_flight -= 1
+            now = loop.time()
+            if status is None or status in _BACKOFF_STATUSES:
+                self._decrease(now, latency, 0.5)
+                if retry_after:
+                    self.blocked_until = max(self.blocked_until, now + retry_after)
+            else:
+                floor = self._latency_floor
+                self._latency_floor = latency if floor is None else min(latency, floor * 1.05)
+                if floor is not None and latency > max(3 * floor, 0.25):
+                    self._decrease(now, latency, 0.75)
+                elif status < 400:
+                    self.limit = min(float(self.maximum), self.limit + 1.0 / self.limit)
+            self._cond.notify_all()
+
 
 class WebCrawler:
+    """Same-domain crawler with incremental re-crawls.
+
+    Fetches run on one pooled `httpx.AsyncClient` (keep-alive, at most
+    `max_concurrency` connections) as a continuous pipeline: a new request
+    starts as soon as one finishes, within a per-host `HostLimiter` window
+    that starts at `initial_concurrency`. URLs are canonicalized before the
+    visited check and fetched from a `CrawlFrontier` seeded from the site's
+    sitemaps; robots.txt rules and Crawl-delay are honored. `page_cache`
+    (url -> content_hash, etag, last_modified, last_crawled_at) from the
+    previous crawl is sent as conditional request headers, sitemap pages
+    whose lastmod predates the last crawl are not fetched at all, and pages
+    whose text hash is unchanged are not returned; `updated_cache` holds the
+    cache to store for the next crawl.
+    `crawl()` is synchronous and runs its own event loop, so call it from a
+    worker thread, not from async code.
+    """
     def __init__(
         self,
         start_url: str,
         max_pages: int = 10,
         max_depth: int = 3,
         page_cache: Optional[Dict[str, Dict]] = None,
-        max_workers: int = 6,
-        crawl_delay: float = 0.2,
+        max_concurrency: int = 16,
+        initial_concurrency: int = 4,
+        crawl_delay: float = 0.0,
+        request_timeout: float = 10.0,
+        respect_robots: bool = True,
+        use_sitemaps: bool = True,
+        progress_callback: Optional[Callable[[int, int], None]] = None,
+        on_page_state: Optional[Callable[[str, Dict, bool], None]] = None,
     ):
-        self.start_url = start_url
+        self.start_url = canonicalize_url(start_url)
         self.max_pages = max_pages
         self.max_depth = max_depth
         self.visited_urls: Set[str] = set()
         self.crawled_pages: List[Dict[str, str]] = []
-        self.base_domain = urlparse(start_url).netloc
+        self.base_domain = urlparse(self.start_url).netloc
         self.page_cache: Dict[str, Dict] = page_cache or {}
         self.updated_cache: Dict[str, Dict] = dict(self.page_cache)
         self.pages_scanned = 0
-        self.max_workers = max(1, min(max_workers, 12))
+        # Sitemap pages not fetched because their lastmod predates the last crawl
+        self.pages_skipped = 0
+        self.max_concurrency = max(1, max_concurrency)
+        self.initial_concurrency = max(1, min(initial_concurrency, self.max_concurrency))
+        # Minimum spacing between request starts to one host
         self.crawl_delay = max(0.0, crawl_delay)
-        self._lock = threading.Lock()
+        self.request_timeout = request_timeout
+        self.respect_robots = respect_robots
+        self.use_sitemaps = use_sitemaps
+        # Called with (pages_scanned, pages_changed) as the crawl advances; may raise to stop it
+        self.progress_callback = progress_callback
+        # Called with (url, state, changed) once a page is settled; changed pages are also returned by crawl()
+        self.on_page_state = on_page_state
+        self.limiters: Dict[str, HostLimiter] = {}
+        self.frontier: Optional[CrawlFrontier] = None
+        self._stop: Optional[asyncio.Event] = None
+        self._error: Optional[BaseException] = None
     
     def normalize_url(self, url: str) -> str:
-        parsed = urlparse(url)
-        scheme = parsed.scheme.lower()
-        netloc = parsed.netloc.lower()
-        if (scheme == "http" and netloc.endswith(":80")) or (scheme == "https" and netloc.endswith(":443")):
-            netloc = netloc.split(":")[0]
-        path = parsed.path or ""
-        if path != "/" and path.endswith("/"):
-            path = path[:-1]
-        normalized = f"{scheme}://{netloc}{path}"
-        if parsed.query:
-            normalized = f"{normalized}?{parsed.query}"
-        return normalized
+        return canonicalize_url(url)
 
     def is_valid_url(self, url: str) -> bool:
         """Check if URL is valid and belongs to the same domain"""
         parsed = urlparse(url)
         if parsed.scheme not in ['http', 'https'] or parsed.netloc != self.base_domain:
             return False
-        with self._lock:
-            return url not in self.visited_urls
-    
-    def extract_text(self, html: str) -> str:
-        """Extract text content from HTML"""
-        soup = BeautifulSoup(html, 'html.parser')
-        
-        # Remove script and style elements
-        for script in soup(["script", "style"]):
-            script.decompose()
-        
-        # Get text
-        text = soup.get_text()
-        
-        # Clean up whitespace
-        lines = (line.strip() for line in text.splitlines())
-        chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
-        text = ' '.join(chunk for chunk in chunks if chunk)
-        
-        return text
+        return url not in self.visited_urls
     
-    def get_title(self, soup: BeautifulSoup) -> str:
-        """Extract page title"""
-        title_tag = soup.find('title')
-        return title_tag.get_text() if title_tag else "No Title"
-    
-    def _hash_content(self, text: str) -> str:
-        normalized = "".join(ch for ch in text.lower() if not ch.isdigit())
-        normalized = " ".join(normalized.split())
-        return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
-
-    def crawl_page(self, url: str, depth: int) -> List[str]:
-        """Crawl a single page and return links"""
-        with self._lock:
-            if depth > self.max_depth or len(self.crawled_pages) >= self.max_pages:
-                return []
-            if url in self.visited_urls:
-                return []
-            self.visited_urls.add(url)
-        
+    def parse_page(self, url: str, html: str) -> Dict:
+        """Title, text, content hash, same-domain links and canonical URL of a fetched page"""
+        page = extract_page(html)
+        base_href = page.pop('base')
+        base = urljoin(url, base_href) if base_href else url
+
+        canonical = None
+        if page['canonical']:
+            candidate = self.normalize_url(urljoin(base, page['canonical']))
+            if urlparse(candidate).netloc == self.base_domain:
+                canonical = candidate
+        page['canonical'] = canonical
+
+        links = []
+        for href in page['links']:
+            absolute_url = self.normalize_url(urljoin(base, href))
+            if self.is_valid_url(absolute_url):
+                links.append(absolute_url)
+        page['links'] = links
+        return page
+
+    def _limiter(self, url: str) -> HostLimiter:
+        host = urlparse(url).netloc
+        limiter = self.limiters.get(host)
+        if limiter is None:
+            limiter = HostLimiter(self.initial_concurrency, self.max_concurrency, self.crawl_delay)
+            self.limiters[host] = limiter
+        return limiter
+
+    async def _load_robots(self, client: httpx.AsyncClient) -> RobotsPolicy:
+        """robots.txt of the crawled host; missing or unreadable files allow everything"""
+        robots_url = f"{urlparse(self.start_url).scheme}://{self.base_domain}/robots.txt"
+        try:
+            response = await self._fetch(client, robots_url, conditional=False)
+        except httpx.HTTPError as e:
+            logger.warning(f"Could not fetch {robots_url}: {str(e)}")
+            return RobotsPolicy(ROBOTS_AGENT)
+        if response.status_code != 200:
+            return RobotsPolicy(ROBOTS_AGENT)
+
+        robots = RobotsPolicy(ROBOTS_AGENT, response.text)
+        delay = robots.crawl_delay()
+        if delay:
+            self.crawl_delay = max(self.crawl_delay, min(delay, _MAX_CRAWL_DELAY_SECONDS))
+            self._limiter(self.start_url).min_interval = self.crawl_delay
+        return robots
+
+    async def _seed_from_sitemaps(self, client: httpx.AsyncClient, robots: RobotsPolicy) -> None:
+        """Queue same-domain sitemap URLs one level below the start page"""
+        pending = robots.sitemaps() or [f"{urlparse(self.start_url).scheme}://{self.base_domain}/sitemap.xml"]
+        fetched: Set[str] = set()
+        entries: Dict[str, SitemapEntry] = {}
+        while pending and len(fetched) < MAX_SITEMAP_FILES and len(entries) < MAX_SITEMAP_URLS:
+            sitemap_url = pending.pop(0)
+            if sitemap_url in fetched:
+                continue
+            fetched.add(sitemap_url)
+            try:
+                response = await self._fetch(client, sitemap_url, conditional=False)
+            except httpx.HTTPError as e:
+                logger.warning(f"Could not fetch sitemap {sitemap_url}: {str(e)}")
+                continue
+            if response.status_code != 200:
+                continue
+            page_entries, children = parse_sitemap(response.content)
+            pending.extend(children)
+            for entry in page_entries:
+                entry.url = self.normalize_url(entry.url)
+                if urlparse(entry.url).netloc == self.base_domain and entry.url not in entries:
+                    entries[entry.url] = entry
+
+        crawled_at = {url: cached['last_crawled_at'] for url, cached in self.page_cache.items() if cached.get('last_crawled_at')}
+        added = self.frontier.add_many(entries.values(), 1, skip=crawled_at)
+        self.pages_skipped = self.frontier.unchanged
+        if entries:
+            logger.info(f"Sitemap: {len(entries)} URLs, {added} queued, {self.pages_skipped} unchanged since the last crawl")
+
+    def _enqueue(self, url: str, depth: int) -> None:
+        url = self.normalize_url(url)
+        if urlparse(url).netloc == self.base_domain:
+            self.frontier.add(url, depth)
+
+    def _done(self) -> bool:
+        return self._stop.is_set() or len(self.crawled_pages) >= self.max_pages
+
+    async def _fetch(self, client: httpx.AsyncClient, url: str, conditional: bool = True) -> httpx.Response:
+        headers = {}
+        cached = self.page_cache.get(url, {}) if conditional else {}
+        if cached.get('etag'):
+            headers['If-None-Match'] = cached['etag']
+        if cached.get('last_modified'):
+            headers['If-Modified-Since'] = cached['last_modified']
+
+        limiter = self._limiter(url)
+        await limiter.acquire()
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        status = None
+        retry_after = None
+        try:
+            response = await client.get(url, headers=headers)
+            status = response.status_code
+            if status in _BACKOFF_STATUSES:
+                retry_after = _parse_retry_after(response.headers.get('Retry-After'))
+            return response
+        finally:
+            await limiter.release(loop.time() - started, status, retry_after)
+
+    async def _crawl_url(self, client: httpx.AsyncClient, entry: tuple) -> None:
+        """Crawl one frontier entry; a failure is logged and only loses that page"""
         try:
-            url = self.normalize_url(url)
-            logger.info(f"Crawling: {url} (depth: {depth})")
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (compatible; Chatbot/1.0)'
-            }
-
-            cached = self.page_cache.get(url, {})
-            if cached.get('etag'):
-                headers['If-None-Match'] = cached['etag']
-            if cached.get('last_modified'):
-                headers['If-Modified-Since'] = cached['last_modified']
-
-            response = requests.get(url, timeout=10, headers=headers)
-            with self._lock:
-                self.pages_scanned += 1
-
-            if response.status_code == 304:
-                self.visited_urls.add(url)
-                return []
-
-            response.raise_for_status()
-            
-            soup = BeautifulSoup(response.text, 'html.parser')
-            title = self.get_title(soup)
-            text = self.extract_text(response.text)
-
-            content_hash = self._hash_content(text)
-            etag = response.headers.get('ETag')
-            last_modified = response.headers.get('Last-Modified')
-
-            prev_hash = cached.get('content_hash')
-            is_changed = prev_hash != content_hash
-
-            with self._lock:
-                self.updated_cache[url] = {
-                    'content_hash': content_hash,
-                    'etag': etag,
-                    'last_modified': last_modified,
-                    'last_crawled_at': time.time()
-                }
-
-            if is_changed:
-                with self._lock:
-                    if len(self.crawled_pages) < self.max_pages:
-                        self.crawled_pages.append({
-                            'url': url,
-                            'title': title,
-                            'content': text,
-                            'depth': depth,
-                            'content_hash': content_hash,
-                            'etag': etag,
-                            'last_modified': last_modified
-                        })
-            
-            # Extract links for further crawling
-            links = []
-            for link in soup.find_all('a', href=True):
-                absolute_url = urljoin(url, link['href'])
-                # Remove fragments
-                absolute_url = absolute_url.split('#')[0]
-                absolute_url = self.normalize_url(absolute_url)
-                if self.is_valid_url(absolute_url):
-                    links.append(absolute_url)
-            
-            return links
-            
+            await self._visit(client, entry)
         except Exception as e:
-            logger.error(f"Error crawling {url}: {str(e)}")
-            return []
-    
-    def crawl(self) -> List[Dict[str, str]]:
-        """Start crawling from the start URL"""
-        urls_to_crawl = [(self.start_url, 0)]
+            logger.error(f"Error crawling {entry[4]}: {str(e)}")
 
-        if self.max_workers <= 1:
-            while urls_to_crawl and len(self.crawled_pages) < self.max_pages:
-                url, depth = urls_to_crawl.pop(0)
-                url = self.normalize_url(url)
+    async def _visit(self, client: httpx.AsyncClient, entry: tuple) -> None:
+        depth, url, attempt = entry[0], entry[4], entry[5]
+        logger.info(f"Crawling: {url} (depth: {depth})")
+        response = await self._fetch(client, url)
 
-                new_links = self.crawl_page(url, depth)
+        if response.status_code in _BACKOFF_STATUSES and attempt < _MAX_RETRIES:
+            self.frontier.retry(entry)
+            return
+        self.pages_scanned += 1
 
-                for link in new_links:
-                    urls_to_crawl.append((link, depth + 1))
+        if response.status_code == 304:
+            cached = self.page_cache.get(url)
+            if cached:
+                self._settle(url, dict(cached, last_crawled_at=time.time()), False)
+            return
+        if response.is_error:
+            logger.error(f"Error crawling {url}: HTTP {response.status_code}")
+            return
 
-                if self.crawl_delay:
-                    time.sleep(self.crawl_delay)
-        else:
-            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-                while urls_to_crawl and len(self.crawled_pages) < self.max_pages:
-                    batch = []
-                    while urls_to_crawl and len(batch) < self.max_workers:
-                        url, depth = urls_to_crawl.pop(0)
-                        url = self.normalize_url(url)
-                        batch.append((url, depth))
-
-                    futures = {executor.submit(self.crawl_page, url, depth): depth for url, depth in batch}
-                    for future in as_completed(futures):
-                        depth = futures[future]
-                        try:
-                            new_links = future.result() or []
-                        except Exception:
-                            new_links = []
-
-                        for link in new_links:
-                            urls_to_crawl.append((link, depth + 1))
-
-                    if self.crawl_delay:
-                        time.sleep(self.crawl_delay)
-        
-        logger.info(f"Crawled {len(self.crawled_pages)} pages")
+        # Parsing is CPU-bound; keep it off the event loop so fetches keep flowing
+        page = await asyncio.to_thread(self.parse_page, url, response.text)
+        canonical = page['canonical']
+        if canonical and canonical != url:
+            # Another URL is the canonical copy: skip this one if that was already
+            # seen (it is crawled under its own URL), otherwise store it under it
+            if not self.frontier.claim(canonical):
+                return
+            url = canonical
+        title, text, content_hash = page['title'], page['text'], page['content_hash']
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+
+        state = {
+            'content_hash': content_hash,
+            'etag': etag,
+            'last_modified': last_modified,
+            'last_crawled_at': time.time()
+        }
+
+        prev_hash = self.page_cache.get(url, {}).get('content_hash')
+        changed = prev_hash != content_hash
+        if changed:
+            if len(self.crawled_pages) >= self.max_pages:
+                # Over the page budget: keep the old state so a later crawl still ingests it
+                return
+            self.crawled_pages.append({
+                'url': url,
+                'title': title,
+                'content': text,
+                'depth': depth,
+                'content_hash': content_hash,
+                'etag': etag,
+                'last_modified': last_modified
+            })
+        self._settle(url, state, changed)
+
+        for link in page['links']:
+            self._enqueue(link, depth + 1)
+
+    def _settle(self, url: str, state: Dict, changed: bool) -> None:
+        self.updated_cache[url] = state
+        if self.on_page_state:
+            self.on_page_state(url, state, changed)
+
+    async def _worker(self, client: httpx.AsyncClient) -> None:
+        # Also checks the stop flag: a cancellation that lands inside httpx's own
+        # timeout scope can be absorbed there instead of ending the task
+        while not self._stop.is_set():
+            entry = await self.frontier.get()
+            try:
+                if not self._done():
+                    await self._crawl_url(client, entry)
+                    if self.progress_callback:
+                        self.progress_callback(self.pages_scanned, len(self.crawled_pages))
+                    if len(self.crawled_pages) >= self.max_pages:
+                        self._stop.set()
+            except Exception as e:
+                # Page errors are handled in _crawl_url; this is the progress
+                # callback raising (e.g. the job was cancelled): stop the crawl
+                self._error = e
+                self._stop.set()
+            finally:
+                self.frontier.task_done()
+
+    async def crawl_async(self) -> List[Dict[str, str]]:
+        self._stop = asyncio.Event()
+        self._error = None
+        limits = httpx.Limits(max_connections=self.max_concurrency, max_keepalive_connections=self.max_concurrency)
+        async with httpx.AsyncClient(
+            headers={'User-Agent': USER_AGENT},
+            timeout=self.request_timeout,
+            limits=limits,
+            follow_redirects=True,
+        ) as client:
+            robots = await self._load_robots(client) if self.respect_robots else None
+            self.frontier = CrawlFrontier(self.max_depth, robots)
+            self.visited_urls = self.frontier.seen
+            if not self.frontier.add(self.start_url, 0):
+                logger.warning(f"robots.txt disallows {self.start_url}")
+            if self.use_sitemaps:
+                await self._seed_from_sitemaps(client, robots or RobotsPolicy(ROBOTS_AGENT))
+
+            workers = [asyncio.create_task(self._worker(client)) for _ in range(self.max_concurrency)]
+            drained = asyncio.create_task(self.frontier.join())
+            stopped = asyncio.create_task(self._stop.wait())
+            try:
+                await asyncio.wait({drained, stopped}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                self._stop.set()
+                for task in (*workers, drained, stopped):
+                    task.cancel()
+                await asyncio.gather(*workers, drained, stopped, return_exceptions=True)
+
+        if self._error is not None:
+            raise self._error
+        logger.info(
+            f"Crawled {len(self.crawled_pages)} pages ({self.pages_scanned} fetched, {self.pages_skipped} unchanged per sitemap, "
+            f"{self.frontier.disallowed} disallowed by robots.txt)"
+        )
         return self.crawled_pages
+
+    def crawl(self) -> List[Dict[str, str]]:
+        """Start crawling from the start URL"""
+        return asyncio.run(self.crawl_async())
@@ -1,10 +1,13 @@
-from app.utils.parsers import parse_pdf, parse_docx, parse_xlsx, chunk_text
+from app.utils.parsers import parse_pdf, iter_pdf_pages, parse_docx, parse_xlsx, iter_xlsx_segments, chunk_text, iter_chunks
 from app.utils.csv_export import export_leads_to_csv
 
 __all__ = [
     "parse_pdf",
+    "iter_pdf_pages",
     "parse_docx",
     "parse_xlsx",
+    "iter_xlsx_segments",
     "chunk_text",
+    "iter_chunks",
     "export_leads_to_csv",
 ]
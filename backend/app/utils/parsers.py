@@ -3,31 +3,140 @@ import pdfplumber
 from docx import Document
 import openpyxl
 import pandas as pd
-from typing import List
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Iterable, Iterator, List, Optional, Tuple
 import io
+import itertools
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
 
+logger = logging.getLogger(__name__)
 
-def parse_pdf(file_content: bytes) -> str:
-    """Parse PDF file and extract text"""
-    text = ""
-    
+
+def _extract_page_range(path: str, start: int, end: int) -> List[Tuple[int, str]]:
+    """Text of pages [start, end) of the PDF at `path`, as (page_number, text) pairs.
+
+    Pages pdfplumber cannot read fall back to PyPDF2 one by one; pages
+    neither can read are skipped.
+    """
+    fallback_reader = None
+
+    def _fallback(index: int, error: Exception) -> str:
+        nonlocal fallback_reader
+        try:
+            if fallback_reader is None:
+                fallback_reader = PyPDF2.PdfReader(path)
+            return fallback_reader.pages[index].extract_text() or ""
+        except Exception as e2:
+            logger.warning(f"Skipping unreadable PDF page {index + 1}: {error}, {e2}")
+            return ""
+
+    pages: List[Tuple[int, str]] = []
     try:
-        # Try pdfplumber first (better for complex PDFs)
-        with pdfplumber.open(io.BytesIO(file_content)) as pdf:
-            for page in pdf.pages:
-                page_text = page.extract_text()
-                if page_text:
-                    text += page_text + "\n"
+        pdf = pdfplumber.open(path)
     except Exception as e:
-        # Fallback to PyPDF2
+        for index in range(start, end):
+            pages.append((index + 1, _fallback(index, e)))
+        return pages
+
+    with pdf:
+        for index in range(start, end):
+            try:
+                page = pdf.pages[index]
+                text = page.extract_text() or ""
+                # Release the page's parsed layout before moving on
+                page.close()
+            except Exception as e:
+                text = _fallback(index, e)
+            pages.append((index + 1, text))
+    return pages
+
+
+# Shared by PDF page ranges and bulk uploads; sized by the first caller
+_parse_pool: Optional[ProcessPoolExecutor] = None
+_parse_pool_lock = threading.Lock()
+
+
+def _get_parse_pool(workers: int) -> ProcessPoolExecutor:
+    global _parse_pool
+    with _parse_pool_lock:
+        if _parse_pool is None:
+            # spawn: forking a threaded server process is not safe
+            _parse_pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        return _parse_pool
+
+
+def _count_pdf_pages(path: str) -> int:
+    try:
+        return len(PyPDF2.PdfReader(path).pages)
+    except Exception:
+        with pdfplumber.open(path) as pdf:
+            return len(pdf.pages)
+
+
+def iter_pdf_pages(
+    file_content: bytes,
+    workers: int = 0,
+    pages_per_task: int = 20,
+    parallel_min_pages: int = 40,
+) -> Iterator[Tuple[int, str]]:
+    """Yield (page_number, text) for every page with text, in page order, as pages are extracted.
+
+    PDFs with at least `parallel_min_pages` pages are split into ranges of
+    `pages_per_task` pages parsed in a pool of `workers` processes (0 parses
+    in this process); at most two ranges per worker are in flight, so parsed
+    text never piles up ahead of the consumer.
+    """
+    with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as f:
+        f.write(file_content)
+        path = f.name
+    try:
         try:
-            pdf_reader = PyPDF2.PdfReader(io.BytesIO(file_content))
-            for page in pdf_reader.pages:
-                text += page.extract_text() + "\n"
-        except Exception as e2:
-            raise Exception(f"Failed to parse PDF: {str(e)}, {str(e2)}")
-    
-    return text.strip()
+            page_count = _count_pdf_pages(path)
+        except Exception as e:
+            raise Exception(f"Failed to parse PDF: {str(e)}")
+
+        pages_per_task = max(1, pages_per_task)
+        ranges = [(start, min(start + pages_per_task, page_count)) for start in range(0, page_count, pages_per_task)]
+        if workers <= 0 or page_count < parallel_min_pages:
+            for start, end in ranges:
+                for page_number, text in _extract_page_range(path, start, end):
+                    if text:
+                        yield page_number, text
+            return
+
+        pool = _get_parse_pool(workers)
+        in_flight: deque = deque()
+        pending_ranges = iter(ranges)
+        try:
+            for start, end in itertools.islice(pending_ranges, workers * 2):
+                in_flight.append(pool.submit(_extract_page_range, path, start, end))
+            while in_flight:
+                pages = in_flight.popleft().result()
+                next_range = next(pending_ranges, None)
+                if next_range is not None:
+                    in_flight.append(pool.submit(_extract_page_range, path, *next_range))
+                for page_number, text in pages:
+                    if text:
+                        yield page_number, text
+        finally:
+            for future in in_flight:
+                future.cancel()
+            # Workers may still be reading the file
+            for future in in_flight:
+                if not future.cancelled():
+                    future.exception()
+    finally:
+        os.remove(path)
+
+
+def parse_pdf(file_content: bytes) -> str:
+    """Parse PDF file and extract text"""
+    return "\n".join(text for _, text in iter_pdf_pages(file_content)).strip()
 
 
 def parse_docx(file_content: bytes) -> str:
@@ -40,50 +149,42 @@ def parse_docx(file_content: bytes) -> str:
         raise Exception(f"Failed to parse DOCX: {str(e)}")
 
 
-def parse_xlsx(file_content: bytes) -> str:
-    """Parse XLSX file and extract text"""
+def iter_xlsx_segments(file_content: bytes) -> Iterator[str]:
+    """Text of an XLSX workbook one sheet at a time; joined with newlines it equals `parse_xlsx`"""
     try:
         # Use pandas for better handling
         df = pd.read_excel(io.BytesIO(file_content), sheet_name=None)
-        
-        text_parts = []
-        for sheet_name, sheet_df in df.items():
-            text_parts.append(f"Sheet: {sheet_name}\n")
-            text_parts.append(sheet_df.to_string(index=False))
-            text_parts.append("\n")
-        
-        return "\n".join(text_parts).strip()
     except Exception as e:
         raise Exception(f"Failed to parse XLSX: {str(e)}")
 
+    while df:
+        sheet_name = next(iter(df))
+        # Release each sheet's frame once its text has been produced
+        sheet_df = df.pop(sheet_name)
+        yield f"Sheet: {sheet_name}\n"
+        yield sheet_df.to_string(index=False)
+        yield "\n"
 
-def chunk_text(text: str, chunk_size: int = 1000, overlap: int = 200) -> List[str]:
-    """Split text into chunks with overlap, favoring paragraph boundaries for better retrieval."""
-    if not text:
-        return []
 
-    paragraphs = [p.strip() for p in text.split("\n\n") if p.strip()]
-    if not paragraphs:
-        paragraphs = [text.strip()]
-
-    chunks: List[str] = []
-    current = ""
+def parse_xlsx(file_content: bytes) -> str:
+    """Parse XLSX file and extract text"""
+    return "\n".join(iter_xlsx_segments(file_content)).strip()
 
-    def _flush(chunk: str):
-        if chunk:
-            chunks.append(chunk)
 
+def _chunk_paragraphs(paragraphs: Iterable[str], chunk_size: int, overlap: int) -> Iterator[str]:
+    current = ""
     for paragraph in paragraphs:
         if len(paragraph) > chunk_size:
             if current:
-                _flush(current)
+                yield current
                 current = ""
 
             start = 0
             while start < len(paragraph):
                 end = start + chunk_size
                 chunk = paragraph[start:end]
-                _flush(chunk)
+                if chunk:
+                    yield chunk
                 start = end - overlap if overlap > 0 else end
             continue
 
@@ -92,12 +193,97 @@ def chunk_text(text: str, chunk_size: int = 1000, overlap: int = 200) -> List[st
         elif len(current) + 2 + len(paragraph) <= chunk_size:
             current = f"{current}\n\n{paragraph}"
         else:
-            _flush(current)
+            yield current
             if overlap > 0:
                 tail = current[-overlap:]
                 current = f"{tail}\n\n{paragraph}" if tail else paragraph
             else:
                 current = paragraph
 
-    _flush(current)
-    return chunks
+    if current:
+        yield current
+
+
+def _iter_paragraphs(segments: Iterable[str], separator: str) -> Iterator[str]:
+    # Text after the last paragraph break of a segment may continue in the next one
+    buffer: Optional[str] = None
+    for segment in segments:
+        buffer = segment if buffer is None else f"{buffer}{separator}{segment}"
+        parts = buffer.split("\n\n")
+        buffer = parts.pop()
+        for part in parts:
+            if part.strip():
+                yield part.strip()
+    if buffer and buffer.strip():
+        yield buffer.strip()
+
+
+def iter_chunks(segments: Iterable[str], chunk_size: int = 1000, overlap: int = 200, separator: str = "\n") -> Iterator[str]:
+    """Chunk a stream of text segments (e.g. PDF pages) as they arrive.
+
+    Produces the same chunks as `chunk_text` over the segments joined with
+    `separator`, holding only the current paragraph in memory.
+    """
+    return _chunk_paragraphs(_iter_paragraphs(segments, separator), chunk_size, overlap)
+
+
+def parse_document_chunks(path: str, kind: str) -> List[str]:
+    """Chunks of the document file at `path`; `kind` is "pdf", "docx" or "xlsx"."""
+    with open(path, "rb") as f:
+        file_content = f.read()
+    if kind == "pdf":
+        return list(iter_chunks(text for _, text in iter_pdf_pages(file_content)))
+    if kind == "docx":
+        return chunk_text(parse_docx(file_content))
+    if kind == "xlsx":
+        return list(iter_chunks(iter_xlsx_segments(file_content)))
+    raise Exception(f"Unsupported file type: {kind}")
+
+
+def iter_parsed_documents(
+    documents: List[Tuple[str, str]],
+    workers: int = 0,
+) -> Iterator[Tuple[int, Optional[List[str]], Optional[str]]]:
+    """Parse (path, kind) documents, yielding (index, chunks, error) as each one finishes.
+
+    Documents are parsed in the shared parse pool with at most two per
+    worker in flight (0 workers parses in this process, in order).
+    """
+    if workers <= 0:
+        for index, (path, kind) in enumerate(documents):
+            try:
+                yield index, parse_document_chunks(path, kind), None
+            except Exception as e:
+                yield index, None, str(e)
+        return
+
+    pool = _get_parse_pool(workers)
+    pending = iter(enumerate(documents))
+    in_flight = {}
+
+    def submit_next() -> None:
+        item = next(pending, None)
+        if item is not None:
+            index, (path, kind) = item
+            in_flight[pool.submit(parse_document_chunks, path, kind)] = index
+
+    try:
+        for _ in range(workers * 2):
+            submit_next()
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                index = in_flight.pop(future)
+                submit_next()
+                error = future.exception()
+                yield index, (None if error else future.result()), (str(error) if error else None)
+    finally:
+        for future in in_flight:
+            future.cancel()
+
+
+def chunk_text(text: str, chunk_size: int = 1000, overlap: int = 200) -> List[str]:
+    """Split text into chunks with overlap, favoring paragraph boundaries for better retrieval."""
+    if not text:
+        return []
+    return list(iter_chunks([text], chunk_size, overlap))
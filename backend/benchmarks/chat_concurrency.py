@@ -0,0 +1,154 @@
+"""Concurrency benchmark for the chat endpoints.
+
+Fires a fixed number of chat requests at a running backend with a bounded
+number in flight and reports requests/sec and latency percentiles. Run it
+against a single uvicorn worker before and after a change to compare
+per-worker throughput:
+
+    uvicorn app.main:app --workers 1 --port 8000
+    python -m benchmarks.chat_concurrency --widget-id <id> --concurrency 32 --requests 256
+    python -m benchmarks.chat_concurrency --widget-id <id> --stream --json results.json
+"""
+from typing import Dict, List, Optional
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import uuid
+
+import httpx
+
+DEFAULT_QUESTIONS = [
+    "What are your opening hours?",
+    "How long does shipping take?",
+    "Do you offer refunds?",
+    "What payment methods do you accept?",
+    "How can I contact support?",
+    "Do you ship internationally?",
+]
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+
+async def _send(
+    client: httpx.AsyncClient,
+    url: str,
+    payload: Dict,
+    stream: bool,
+) -> Dict:
+    started = time.perf_counter()
+    first_token = None
+    try:
+        if stream:
+            async with client.stream("POST", url, json=payload) as response:
+                status = response.status_code
+                async for line in response.aiter_lines():
+                    if first_token is None and line.startswith("data:") and '"token"' in line:
+                        first_token = time.perf_counter() - started
+        else:
+            response = await client.post(url, json=payload)
+            status = response.status_code
+    except httpx.HTTPError as e:
+        return {"ok": False, "status": None, "error": str(e), "latency": time.perf_counter() - started}
+    return {
+        "ok": 200 <= status < 300,
+        "status": status,
+        "latency": time.perf_counter() - started,
+        "first_token": first_token,
+    }
+
+
+async def run_benchmark(
+    base_url: str,
+    widget_id: str,
+    total_requests: int,
+    concurrency: int,
+    stream: bool = False,
+    questions: Optional[List[str]] = None,
+    timeout: float = 120.0,
+) -> Dict:
+    """Send `total_requests` chat requests with at most `concurrency` in flight"""
+    questions = questions or DEFAULT_QUESTIONS
+    url = base_url.rstrip("/") + ("/api/chat/stream" if stream else "/api/chat")
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(timeout=timeout, limits=limits) as client:
+        async def worker(index: int) -> Dict:
+            payload = {
+                "message": questions[index % len(questions)],
+                "session_id": f"bench-{uuid.uuid4().hex}",
+                "widget_id": widget_id,
+            }
+            async with semaphore:
+                return await _send(client, url, payload, stream)
+
+        started = time.perf_counter()
+        results = await asyncio.gather(*(worker(i) for i in range(total_requests)))
+        elapsed = time.perf_counter() - started
+
+    latencies = [r["latency"] for r in results if r["ok"]]
+    first_tokens = [r["first_token"] for r in results if r["ok"] and r.get("first_token") is not None]
+    errors: Dict[str, int] = {}
+    for r in results:
+        if not r["ok"]:
+            key = str(r.get("status") or r.get("error"))
+            errors[key] = errors.get(key, 0) + 1
+
+    report = {
+        "url": url,
+        "requests": total_requests,
+        "concurrency": concurrency,
+        "succeeded": len(latencies),
+        "errors": errors,
+        "elapsed_seconds": elapsed,
+        "requests_per_second": (len(latencies) / elapsed) if elapsed else 0.0,
+        "latency_seconds": {
+            "mean": statistics.mean(latencies) if latencies else 0.0,
+            "p50": _percentile(latencies, 50),
+            "p95": _percentile(latencies, 95),
+            "p99": _percentile(latencies, 99),
+        },
+    }
+    if stream:
+        report["first_token_seconds"] = {
+            "p50": _percentile(first_tokens, 50),
+            "p95": _percentile(first_tokens, 95),
+        }
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Measure chat endpoint throughput under concurrent load")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--widget-id", required=True)
+    parser.add_argument("--requests", type=int, default=128)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--stream", action="store_true", help="benchmark /api/chat/stream instead of /api/chat")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--json", dest="json_path", help="also write the report to this file")
+    args = parser.parse_args()
+
+    report = asyncio.run(run_benchmark(
+        args.base_url,
+        args.widget_id,
+        total_requests=args.requests,
+        concurrency=args.concurrency,
+        stream=args.stream,
+        timeout=args.timeout,
+    ))
+    print(json.dumps(report, indent=2))
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,231 @@
+"""Crawler pages/sec: the async pipelined engine vs the previous lock-step crawler.
+
+Serves a synthetic site from a local threaded HTTP server (each page links
+to `--fanout` children, responses take `--latency-ms` +/- jitter) and
+crawls it with both engines:
+
+- ``lockstep``: the previous implementation, `requests.get` without a
+  session in thread-pool batches that wait for the slowest page and then
+  sleep, with workers and delay from the old `max_pages` table and the
+  BeautifulSoup extraction;
+- ``async``: `WebCrawler.crawl` with the configured concurrency settings.
+
+`--max-inflight N` makes the server answer 429 with `Retry-After` once
+more than N requests are in flight, which exercises the AIMD back-off.
+
+    python -m benchmarks.crawler_throughput --pages 300 --latency-ms 50
+"""
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+from urllib.parse import urljoin
+import argparse
+import json
+import random
+import threading
+import time
+
+from app.services.web_crawler import USER_AGENT, WebCrawler
+from benchmarks.html_extraction import bs4_extract
+
+
+class FixtureSite:
+    """A tree of `pages` HTML pages on 127.0.0.1 with simulated latency"""
+    def __init__(self, pages: int, fanout: int, latency_ms: float, jitter_ms: float, max_inflight: int = 0):
+        self.pages = pages
+        self.fanout = fanout
+        self.latency = latency_ms / 1000.0
+        self.jitter = jitter_ms / 1000.0
+        self.max_inflight = max_inflight
+        self.inflight = 0
+        self.requests = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}/page/0"
+
+    def render(self, index: int) -> bytes:
+        rng = random.Random(index)
+        children = range(index * self.fanout + 1, min(self.pages, (index + 1) * self.fanout + 1))
+        links = "".join(f'<li><a href="/page/{child}">Page {child}</a></li>' for child in children)
+        words = "shipping returns billing account order support widget pricing plan".split()
+        body = " ".join(rng.choice(words) for _ in range(400))
+        return (
+            f"<html><head><title>Page {index}</title></head><body>"
+            f"<nav><ul><li><a href='/page/0'>Home</a></li>{links}</ul></nav>"
+            f"<main><h1>Page {index}</h1><p>{body}</p></main></body></html>"
+        ).encode("utf-8")
+
+    def _handler(self):
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status: int, body: bytes, headers: Dict[str, str] = None) -> None:
+                self.send_response(status)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                try:
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    # The crawler stopped and closed its in-flight requests
+                    self.close_connection = True
+
+            def do_GET(self):
+                with site._lock:
+                    site.requests += 1
+                    site.inflight += 1
+                    overloaded = site.max_inflight and site.inflight > site.max_inflight
+                try:
+                    if overloaded:
+                        with site._lock:
+                            site.rejected += 1
+                        self._send(429, b"slow down", {"Retry-After": "1"})
+                        return
+                    time.sleep(max(0.0, site.latency + random.uniform(-site.jitter, site.jitter)))
+                    try:
+                        index = int(self.path.rstrip("/").rsplit("/", 1)[-1])
+                    except ValueError:
+                        index = -1
+                    if not 0 <= index < site.pages:
+                        self._send(404, b"not found")
+                        return
+                    self._send(200, site.render(index))
+                finally:
+                    with site._lock:
+                        site.inflight -= 1
+
+        return Handler
+
+    def __enter__(self) -> "FixtureSite":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class LockStepCrawler(WebCrawler):
+    """The previous crawl loop, kept here only as the benchmark baseline"""
+    def __init__(self, start_url: str, max_pages: int, max_depth: int):
+        super().__init__(start_url, max_pages, max_depth)
+        # The table ingest_web_content used before the async engine
+        if max_pages >= 100:
+            self.max_workers, self.crawl_delay = 10, 0.1
+        elif max_pages >= 50:
+            self.max_workers, self.crawl_delay = 8, 0.15
+        elif max_pages >= 20:
+            self.max_workers, self.crawl_delay = 6, 0.2
+        else:
+            self.max_workers, self.crawl_delay = 4, 0.3
+        self._lock = threading.Lock()
+
+    def crawl_page(self, url: str, depth: int) -> List[str]:
+        import requests
+
+        with self._lock:
+            if depth > self.max_depth or len(self.crawled_pages) >= self.max_pages or url in self.visited_urls:
+                return []
+            self.visited_urls.add(url)
+        try:
+            response = requests.get(url, timeout=10, headers={"User-Agent": USER_AGENT})
+            with self._lock:
+                self.pages_scanned += 1
+            response.raise_for_status()
+            page = bs4_extract(response.text)
+            with self._lock:
+                if len(self.crawled_pages) < self.max_pages:
+                    self.crawled_pages.append({"url": url, "title": page["title"], "content": page["text"]})
+            links = [self.normalize_url(urljoin(url, href)) for href in page["links"]]
+            return [link for link in links if self.is_valid_url(link)]
+        except Exception:
+            return []
+
+    def crawl(self) -> List[Dict[str, str]]:
+        urls_to_crawl = [(self.start_url, 0)]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while urls_to_crawl and len(self.crawled_pages) < self.max_pages:
+                batch = []
+                while urls_to_crawl and len(batch) < self.max_workers:
+                    url, depth = urls_to_crawl.pop(0)
+                    batch.append((self.normalize_url(url), depth))
+                futures = {executor.submit(self.crawl_page, url, depth): depth for url, depth in batch}
+                for future in as_completed(futures):
+                    for link in future.result() or []:
+                        urls_to_crawl.append((link, futures[future] + 1))
+                if self.crawl_delay:
+                    time.sleep(self.crawl_delay)
+        return self.crawled_pages
+
+
+def bench_engine(name: str, site: FixtureSite, max_pages: int, max_depth: int, max_concurrency: int, initial_concurrency: int) -> Dict:
+    if name == "lockstep":
+        crawler = LockStepCrawler(site.url, max_pages, max_depth)
+    else:
+        crawler = WebCrawler(
+            site.url, max_pages, max_depth,
+            max_concurrency=max_concurrency, initial_concurrency=initial_concurrency,
+        )
+    requests_before, rejected_before = site.requests, site.rejected
+    started = time.perf_counter()
+    pages = crawler.crawl()
+    elapsed = time.perf_counter() - started
+    report = {
+        "engine": name,
+        "pages": len(pages),
+        "requests": site.requests - requests_before,
+        "rejected_429": site.rejected - rejected_before,
+        "seconds": elapsed,
+        "pages_per_second": len(pages) / elapsed if elapsed else 0.0,
+    }
+    if crawler.limiters:
+        report["final_host_window"] = {host: round(limiter.limit, 2) for host, limiter in crawler.limiters.items()}
+    return report
+
+
+def main() -> None:
+    from app.config import settings
+
+    parser = argparse.ArgumentParser(description="Crawler pages/sec on a local fixture site")
+    parser.add_argument("--pages", type=int, default=300, help="pages to crawl (the site has this many)")
+    parser.add_argument("--fanout", type=int, default=8)
+    parser.add_argument("--max-depth", type=int, default=10)
+    parser.add_argument("--latency-ms", type=float, default=50.0)
+    parser.add_argument("--jitter-ms", type=float, default=40.0)
+    parser.add_argument("--max-inflight", type=int, default=0, help="answer 429 above this many concurrent requests")
+    parser.add_argument("--max-concurrency", type=int, default=settings.CRAWLER_MAX_CONCURRENCY)
+    parser.add_argument("--initial-concurrency", type=int, default=settings.CRAWLER_INITIAL_CONCURRENCY)
+    parser.add_argument("--engines", nargs="+", choices=("lockstep", "async"), default=["lockstep", "async"])
+    parser.add_argument("--json", dest="json_path", help="also write the report to this file")
+    args = parser.parse_args()
+
+    reports = []
+    with FixtureSite(args.pages, args.fanout, args.latency_ms, args.jitter_ms, args.max_inflight) as site:
+        for name in args.engines:
+            try:
+                report = bench_engine(name, site, args.pages, args.max_depth, args.max_concurrency, args.initial_concurrency)
+            except ImportError as e:
+                report = {"engine": name, "error": f"unavailable: {e}"}
+            reports.append(report)
+            print(json.dumps(report, indent=2))
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(reports, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
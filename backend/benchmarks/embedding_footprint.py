@@ -0,0 +1,68 @@
+"""Per-worker memory and cold start with and without the shared embedding server.
+
+Starts fresh interpreters that import the RAG client and embed one query,
+the way a uvicorn worker does on its first chat request, and reports the
+time to that first vector and the process's peak RSS. Start the embedding
+server first to measure the shared mode:
+
+    python -m app.services.embedding_server --socket ./data/embedding.sock &
+    python -m benchmarks.embedding_footprint --socket ./data/embedding.sock --runs 3
+"""
+from typing import Dict, List
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+_PROBE = """
+import json, resource, time
+started = time.perf_counter()
+from app.services.rag import chroma_client
+chroma_client.embedding_function(["How do I reset my password?"])
+print(json.dumps({
+    "first_vector_seconds": time.perf_counter() - started,
+    "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0,
+}))
+"""
+
+
+def probe(socket_path: str) -> Dict:
+    env = dict(os.environ, EMBEDDING_SERVER_SOCKET=socket_path, USE_LOCAL_EMBEDDINGS="true")
+    output = subprocess.run(
+        [sys.executable, "-c", _PROBE], env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def summarize(mode: str, runs: List[Dict]) -> Dict:
+    return {
+        "mode": mode,
+        "runs": len(runs),
+        "first_vector_seconds": statistics.median(r["first_vector_seconds"] for r in runs),
+        "peak_rss_mb": statistics.median(r["peak_rss_mb"] for r in runs),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare worker RSS and cold start with in-process vs shared embeddings")
+    parser.add_argument("--socket", required=True, help="socket of a running embedding server")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--json", dest="json_path", help="also write the report to this file")
+    args = parser.parse_args()
+
+    reports = [
+        summarize("in-process", [probe("") for _ in range(args.runs)]),
+        summarize("shared-server", [probe(args.socket) for _ in range(args.runs)]),
+    ]
+    for report in reports:
+        print(json.dumps(report, indent=2))
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(reports, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
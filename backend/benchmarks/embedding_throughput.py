@@ -0,0 +1,99 @@
+"""Local embedding throughput: sentence-transformers vs ONNX Runtime (fp32 / int8).
+
+Encodes the same set of chunk-sized texts with each backend and reports
+chunks/sec plus the mean and minimum cosine similarity to the
+sentence-transformers vectors, which shows whether the ONNX vectors can
+share a collection with existing ones. Export the model first:
+
+    python -m app.services.onnx_export
+    python -m benchmarks.embedding_throughput --chunks 2000 --batch-size 64
+"""
+from typing import Dict, List, Optional
+import argparse
+import json
+import random
+import time
+
+import numpy as np
+
+BACKENDS = ("torch", "onnx-fp32", "onnx-int8")
+
+_WORDS = (
+    "account billing invoice order shipping return refund password login widget "
+    "subscription plan upgrade support integration api key webhook store product "
+    "price discount delivery tracking customer email phone hours policy warranty"
+).split()
+
+
+def make_chunks(count: int, words_per_chunk: int = 180, seed: int = 0) -> List[str]:
+    """Chunk-sized pseudo-sentences, about the length the ingestion chunker emits"""
+    rng = random.Random(seed)
+    chunks = []
+    for _ in range(count):
+        length = rng.randint(words_per_chunk // 2, words_per_chunk)
+        chunks.append(" ".join(rng.choice(_WORDS) for _ in range(length)) + ".")
+    return chunks
+
+
+def _load_backend(name: str, model_dir: Optional[str]):
+    from app.services.embeddings import LocalEmbeddingFunction, OnnxEmbeddingFunction
+    if name == "torch":
+        return LocalEmbeddingFunction()
+    return OnnxEmbeddingFunction(model_dir=model_dir, quantized=(name == "onnx-int8"))
+
+
+def bench_backend(name: str, chunks: List[str], batch_size: int, model_dir: Optional[str], reference: Optional[np.ndarray]) -> Dict:
+    backend = _load_backend(name, model_dir)
+    backend(chunks[:batch_size])  # warm-up
+
+    started = time.perf_counter()
+    vectors = []
+    for start in range(0, len(chunks), batch_size):
+        vectors.extend(backend(chunks[start:start + batch_size]))
+    elapsed = time.perf_counter() - started
+
+    vectors = np.asarray(vectors, dtype=np.float32)
+    report = {
+        "backend": name,
+        "model_file": getattr(backend, "model_file", None),
+        "chunks": len(chunks),
+        "batch_size": batch_size,
+        "seconds": elapsed,
+        "chunks_per_second": len(chunks) / elapsed if elapsed else 0.0,
+    }
+    if reference is not None:
+        agreement = np.sum(vectors * reference, axis=1)
+        report["cosine_to_torch"] = {"mean": float(agreement.mean()), "min": float(agreement.min())}
+    return report, vectors
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Chunks/sec of the local embedding backends")
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--model-dir", help="exported ONNX model (default ONNX_EMBEDDING_MODEL_DIR)")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--json", dest="json_path", help="also write the report to this file")
+    args = parser.parse_args()
+
+    chunks = make_chunks(args.chunks)
+    reference = None
+    reports = []
+    for name in args.backends:
+        try:
+            report, vectors = bench_backend(name, chunks, args.batch_size, args.model_dir, reference)
+        except (ImportError, OSError) as e:
+            report = {"backend": name, "error": f"unavailable: {e}"}
+        else:
+            if name == "torch":
+                reference = vectors
+        reports.append(report)
+        print(json.dumps(report, indent=2))
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(reports, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
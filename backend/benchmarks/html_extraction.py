@@ -0,0 +1,112 @@
+"""HTML extraction cost and output size: single-pass lxml vs the previous BeautifulSoup path.
+
+Generates pages shaped like a typical marketing/help site (mega-menu,
+header, cookie banner, article, related links, footer) and extracts each
+with both implementations. Reports CPU ms per page, extracted characters
+and the number of chunks the ingestion chunker produces, which is what
+boilerplate costs in embeddings and storage.
+
+    python -m benchmarks.html_extraction --pages 500
+"""
+from typing import Callable, Dict, List
+import argparse
+import hashlib
+import json
+import random
+import time
+
+from app.services.web_crawler import extract_page
+from app.utils.parsers import iter_chunks
+
+_WORDS = (
+    "account billing invoice order shipping return refund password login widget "
+    "subscription plan upgrade support integration api key webhook store product "
+    "price discount delivery tracking customer email phone hours policy warranty"
+).split()
+
+
+def make_page(index: int, menu_links: int = 60, paragraphs: int = 8) -> str:
+    rng = random.Random(index)
+
+    def sentence(words: int) -> str:
+        return " ".join(rng.choice(_WORDS) for _ in range(words)).capitalize() + "."
+
+    menu = "".join(f'<li><a href="/section/{i}">{sentence(2)}</a></li>' for i in range(menu_links))
+    body = "".join(f"<p>{' '.join(sentence(rng.randint(8, 20)) for _ in range(5))}</p>" for _ in range(paragraphs))
+    related = "".join(f'<li><a href="/page/{rng.randint(0, 999)}">{sentence(4)}</a></li>' for _ in range(10))
+    footer = "".join(f'<a href="/legal/{i}">{sentence(2)}</a> ' for i in range(30))
+    return (
+        f"<!DOCTYPE html><html><head><title>Page {index}</title>"
+        f"<style>body {{ font-family: sans-serif }}</style><script>window.dataLayer = [];</script></head><body>"
+        f"<header class='site-header'><a href='/'>Logo</a><form role='search'><input name='q'></form></header>"
+        f"<nav class='mega-menu'><ul>{menu}</ul></nav>"
+        f"<div id='cookie-banner' class='cookie-consent'>{sentence(30)} <button>Accept</button></div>"
+        f"<main><article><h1>{sentence(6)}</h1>{body}</article></main>"
+        f"<aside><h2>Related</h2><ul>{related}</ul></aside>"
+        f"<footer>{footer}<p>{sentence(20)}</p></footer></body></html>"
+    )
+
+
+def bs4_extract(html: str) -> Dict:
+    """The previous extraction: two html.parser passes plus a per-character hash walk"""
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html, 'html.parser')
+    title_tag = soup.find('title')
+    title = title_tag.get_text() if title_tag else "No Title"
+    links = [link['href'] for link in soup.find_all('a', href=True)]
+
+    text_soup = BeautifulSoup(html, 'html.parser')
+    for script in text_soup(["script", "style"]):
+        script.decompose()
+    lines = (line.strip() for line in text_soup.get_text().splitlines())
+    chunks = (phrase.strip() for line in lines for phrase in line.split("  "))
+    text = ' '.join(chunk for chunk in chunks if chunk)
+
+    normalized = "".join(ch for ch in text.lower() if not ch.isdigit())
+    normalized = " ".join(normalized.split())
+    content_hash = hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+    return {'title': title, 'text': text, 'content_hash': content_hash, 'links': links}
+
+
+def bench(name: str, extract: Callable[[str], Dict], pages: List[str]) -> Dict:
+    extract(pages[0])  # warm-up
+    started = time.process_time()
+    results = [extract(html) for html in pages]
+    elapsed = time.process_time() - started
+    chunks = sum(len(list(iter_chunks([result['text']]))) for result in results)
+    return {
+        "extractor": name,
+        "pages": len(pages),
+        "cpu_ms_per_page": elapsed * 1000 / len(pages),
+        "chars_per_page": sum(len(result['text']) for result in results) / len(pages),
+        "chunks_per_page": chunks / len(pages),
+        "links_per_page": sum(len(result['links']) for result in results) / len(pages),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="CPU and chunk count per page of the HTML extractors")
+    parser.add_argument("--pages", type=int, default=500)
+    parser.add_argument("--menu-links", type=int, default=60)
+    parser.add_argument("--paragraphs", type=int, default=8)
+    parser.add_argument("--json", dest="json_path", help="also write the report to this file")
+    args = parser.parse_args()
+
+    pages = [make_page(index, args.menu_links, args.paragraphs) for index in range(args.pages)]
+    reports = []
+    for name, extract in (("bs4", bs4_extract), ("lxml", extract_page)):
+        try:
+            report = bench(name, extract, pages)
+        except ImportError as e:
+            report = {"extractor": name, "error": f"unavailable: {e}"}
+        reports.append(report)
+        print(json.dumps(report, indent=2))
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(reports, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""Recall@k of quantized embedding storage against float32, on real tenant data.
+
+Loads a tenant's stored chunk vectors from the active vector store and uses
+recent visitor questions from that widget's conversations as queries (or a
+sample of the chunks themselves, leave-one-out, when there is no history).
+Exact float32 search is the ground truth; each quantization mode is scored
+with and without float32 re-scoring, using the same encoding the NumPy store
+uses:
+
+    python -m benchmarks.quantization_recall --organization-id 1 --widget-id <id>
+    python -m benchmarks.quantization_recall --all --k 5 --json recall.json
+"""
+from typing import Dict, List, Optional, Tuple
+import argparse
+import json
+
+import numpy as np
+
+from app.services.numpy_vector_store import approximate_scores, quantize
+
+MODES = ("float16", "int8")
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1.0, norms)
+
+
+def _top_k(scores: np.ndarray, k: int, exclude: Optional[int]) -> List[int]:
+    if exclude is not None:
+        scores = scores.copy()
+        scores[exclude] = -np.inf
+    k = min(k, len(scores) - (1 if exclude is not None else 0))
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])].tolist()
+
+
+def recall_report(
+    corpus: np.ndarray,
+    queries: np.ndarray,
+    k: int,
+    rescore_factors: List[int],
+    exclude: Optional[List[int]] = None,
+) -> Dict:
+    """Recall@k per (mode, rescore factor) relative to exact float32 search"""
+    corpus = _normalize(corpus.astype(np.float32))
+    queries = _normalize(queries.astype(np.float32))
+    exclude = exclude or [None] * len(queries)
+    exact_scores = corpus @ queries.T
+    truth = [set(_top_k(exact_scores[:, i], k, exclude[i])) for i in range(len(queries))]
+
+    report = {
+        "rows": len(corpus),
+        "dim": corpus.shape[1],
+        "queries": len(queries),
+        "k": k,
+        "float32_bytes": int(corpus.nbytes),
+        "modes": {},
+    }
+    for mode in MODES:
+        codes, scales = quantize(corpus, mode)
+        approx = approximate_scores(codes, scales, queries)
+        resident = codes.nbytes + (scales.nbytes if scales is not None else 0)
+        results = {"bytes": int(resident), "memory_ratio": resident / corpus.nbytes}
+        for factor in rescore_factors:
+            recalls = []
+            for i in range(len(queries)):
+                shortlist = _top_k(approx[:, i], k * max(1, factor), exclude[i])
+                if factor > 0:
+                    # Re-score the shortlist with the float32 vectors
+                    exact = exact_scores[shortlist, i]
+                    shortlist = [shortlist[j] for j in np.argsort(-exact)[:k]]
+                recalls.append(len(set(shortlist[:k]) & truth[i]) / float(len(truth[i]) or 1))
+            results[f"recall_at_{k}_rescore_{factor}"] = float(np.mean(recalls)) if recalls else 0.0
+        report["modes"][mode] = results
+    return report
+
+
+def load_tenant(organization_id, widget_id, max_queries: int) -> Tuple[np.ndarray, np.ndarray, Optional[List[int]]]:
+    from app.database import SessionLocal
+    from app.models import Conversation
+    from app.services.rag import chroma_client
+
+    collection = chroma_client.get_collection(organization_id, widget_id, create=False)
+    if collection is None or not collection.count():
+        return np.empty((0, 0)), np.empty((0, 0)), None
+    corpus = np.asarray(collection.get(include=["embeddings"])["embeddings"], dtype=np.float32)
+
+    db = SessionLocal()
+    try:
+        questions = [
+            message for (message,) in db.query(Conversation.message).filter(
+                Conversation.organization_id == int(organization_id),
+                Conversation.widget_id == str(widget_id),
+                Conversation.message.isnot(None),
+            ).order_by(Conversation.created_at.desc()).limit(max_queries).all()
+            if message and message.strip()
+        ]
+    finally:
+        db.close()
+
+    if questions:
+        return corpus, np.asarray(chroma_client.embedding_function(questions), dtype=np.float32), None
+
+    # No visitor history yet: query with the chunks themselves, leave-one-out
+    rng = np.random.default_rng(0)
+    picks = rng.choice(len(corpus), size=min(max_queries, len(corpus)), replace=False)
+    return corpus, corpus[picks], picks.tolist()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Recall@k of float16/int8 embedding storage against float32")
+    parser.add_argument("--organization-id")
+    parser.add_argument("--widget-id")
+    parser.add_argument("--all", action="store_true", help="report every tenant in the active vector store")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--rescore-factors", type=int, nargs="+", default=[0, 4])
+    parser.add_argument("--json", dest="json_path", help="also write the report to this file")
+    args = parser.parse_args()
+
+    from app.services.rag import chroma_client
+
+    if args.all:
+        tenants = chroma_client.backend.list_tenants()
+    elif args.organization_id and args.widget_id:
+        tenants = [(args.organization_id, args.widget_id)]
+    else:
+        parser.error("pass --organization-id and --widget-id, or --all")
+
+    reports = []
+    for organization_id, widget_id in tenants:
+        corpus, queries, exclude = load_tenant(organization_id, widget_id, args.queries)
+        if not len(corpus) or len(corpus) <= args.k:
+            continue
+        report = recall_report(corpus, queries, args.k, args.rescore_factors, exclude)
+        report.update({"organization_id": organization_id, "widget_id": widget_id})
+        reports.append(report)
+        print(json.dumps(report, indent=2))
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(reports, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,350 @@
+"""Retrieval latency and quality of `ChromaDBClient` on synthetic multi-tenant corpora.
+
+For each corpus size the suite ingests deterministic tenant corpora through
+`ChromaDBClient.add_documents` (vector store and keyword index), then drives
+two paths under concurrent load:
+
+* ``query`` -- `ChromaDBClient.query`, scored for recall@k against brute-force
+  cosine search over the same vectors;
+* ``chat_payload`` -- the full `_prepare_chat_payload` retrieval path (hybrid
+  BM25 + vector fusion, MMR and prompt assembly) against a scratch database.
+
+Embeddings come from a deterministic bag-of-words hash function, so runs are
+reproducible and need no model. Everything lives in a temporary directory;
+the configured database and vector store are never touched:
+
+    python -m benchmarks.retrieval --sizes 1000 10000 100000 --json retrieval.json
+    python -m benchmarks.retrieval --backend numpy --sizes 1000000 --tenants 8
+    python -m benchmarks.retrieval --json new.json --baseline retrieval.json
+
+With ``--baseline`` the run is compared to an earlier report and exits
+non-zero when p95 latency or recall regresses past ``--max-regression``.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import zlib
+
+import numpy as np
+
+DEFAULT_SIZES = (1000, 10000, 100000)
+PATHS = ("query", "chat_payload")
+ADD_BATCH = 1000
+VOCABULARY = 5000
+
+
+class HashEmbeddingFunction:
+    """Deterministic bag-of-words embeddings.
+
+    Every token maps to a fixed pseudo-random unit vector seeded by its
+    CRC32; a text embeds to the normalized sum of its token vectors, so texts
+    sharing words are close the way real embeddings of related text are.
+    """
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+        self.model_name = f"hash-bow-{dim}"
+        self._token_vectors: Dict[str, np.ndarray] = {}
+        self._lock = threading.Lock()
+
+    def _vector(self, token: str) -> np.ndarray:
+        vector = self._token_vectors.get(token)
+        if vector is None:
+            rng = np.random.default_rng(zlib.crc32(token.encode("utf-8")))
+            vector = rng.standard_normal(self.dim).astype(np.float32)
+            vector /= np.linalg.norm(vector)
+            with self._lock:
+                self._token_vectors[token] = vector
+        return vector
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in text.lower().split():
+                out[row] += self._vector(token)
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        return out / np.where(norms == 0, 1.0, norms)
+
+    def __call__(self, input: List[str]) -> List[List[float]]:
+        return self.embed(list(input)).tolist()
+
+
+def make_tenant_corpus(chunks: int, seed: int, topics: int = 40, words_per_chunk: int = 60) -> List[str]:
+    """Chunks drawn from a tenant's topics (clusters of related words) plus background vocabulary"""
+    rng = np.random.default_rng(seed)
+    topic_words = [rng.choice(VOCABULARY, size=30, replace=False) for _ in range(topics)]
+    texts = []
+    for _ in range(chunks):
+        topic = topic_words[rng.integers(topics)]
+        words = np.concatenate([
+            rng.choice(topic, size=words_per_chunk * 3 // 4),
+            rng.integers(VOCABULARY, size=words_per_chunk // 4),
+        ])
+        texts.append(" ".join(f"w{word}" for word in words))
+    return texts
+
+
+def make_queries(corpus: List[str], count: int, seed: int, words: int = 8) -> List[str]:
+    """Short questions made of words taken from random chunks of the tenant"""
+    rng = np.random.default_rng(seed)
+    queries = []
+    for idx in rng.integers(len(corpus), size=count):
+        tokens = corpus[idx].split()
+        queries.append(" ".join(rng.choice(tokens, size=min(words, len(tokens)), replace=False)))
+    return queries
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))]
+
+
+def _latency_ms(latencies: List[float]) -> Dict:
+    return {
+        "mean": statistics.mean(latencies) * 1000,
+        "p50": _percentile(latencies, 50) * 1000,
+        "p95": _percentile(latencies, 95) * 1000,
+        "p99": _percentile(latencies, 99) * 1000,
+    }
+
+
+def _rss_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _dir_bytes(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files if os.path.exists(os.path.join(root, name)))
+    return total
+
+
+def configure_environment(workdir: str, backend: str) -> None:
+    """Point settings at scratch storage; must run before anything under `app` is imported"""
+    os.environ.update({
+        "VECTOR_STORE_BACKEND": backend,
+        "CHROMA_PERSIST_DIR": os.path.join(workdir, "chroma"),
+        "NUMPY_STORE_DIR": os.path.join(workdir, "vectors"),
+        "LEXICAL_INDEX_PATH": os.path.join(workdir, "lexical", "index.db"),
+        "CHUNK_EMBEDDING_STORE_PATH": os.path.join(workdir, "embeddings", "chunks.db"),
+        "CHUNK_EMBEDDING_STORE_ENABLED": "false",
+        "DATABASE_URL": f"sqlite:///{os.path.join(workdir, 'bench.db')}",
+        "CHROMA_MEMORY_BUDGET_MB": "0",
+        # The hash embedding function replaces the model; don't load one at import
+        "USE_LOCAL_EMBEDDINGS": "false",
+        "EMBEDDING_SERVER_SOCKET": "",
+    })
+    os.environ.setdefault("OPENAPI_KEY2", "benchmark")
+    os.environ.setdefault("JWT_SECRET", "benchmark")
+
+
+def ingest(client, embedder: HashEmbeddingFunction, tenants: List[Tuple[int, str]], chunks_per_tenant: int, seed: int) -> Dict[Tuple[int, str], Tuple[List[str], np.ndarray, List[str]]]:
+    """Load every tenant; returns (ids, vectors, texts) per tenant for brute-force ground truth"""
+    from app.services.context_selection import count_tokens
+
+    loaded = {}
+    for t_idx, (organization_id, widget_id) in enumerate(tenants):
+        texts = make_tenant_corpus(chunks_per_tenant, seed=seed + t_idx)
+        ids = [f"org_{organization_id}_{widget_id}_chunk_{i}" for i in range(len(texts))]
+        for start in range(0, len(texts), ADD_BATCH):
+            batch = texts[start:start + ADD_BATCH]
+            client.add_documents(
+                documents=batch,
+                metadatas=[{
+                    "organization_id": str(organization_id),
+                    "widget_id": widget_id,
+                    "source_id": str((start + i) % 20),
+                    "source_type": "TEXT",
+                    "title": f"Synthetic {widget_id}",
+                    "chunk_index": start + i,
+                    "token_count": count_tokens(text),
+                } for i, text in enumerate(batch)],
+                ids=ids[start:start + ADD_BATCH],
+            )
+        loaded[(organization_id, widget_id)] = (ids, embedder.embed(texts), texts)
+    return loaded
+
+
+def run_load(task, jobs: List, concurrency: int) -> Tuple[List[float], List, float]:
+    """Run `task(job)` for every job on a thread pool; returns latencies, results and wall time"""
+    def timed(job):
+        started = time.perf_counter()
+        result = task(job)
+        return time.perf_counter() - started, result
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(timed, jobs))
+    wall = time.perf_counter() - started
+    return [latency for latency, _ in outcomes], [result for _, result in outcomes], wall
+
+
+def bench_size(size: int, args, workdir: str, size_index: int) -> List[Dict]:
+    from app.database import SessionLocal
+    from app.services.chat_service import _prepare_chat_payload
+    from app.services.rag import chroma_client
+
+    embedder = chroma_client.embedding_function.backend
+    organization_id = 1000 + size_index
+    tenants = [(organization_id, f"bench-{size}-{t}") for t in range(args.tenants)]
+    chunks_per_tenant = max(1, size // args.tenants)
+
+    rss_before, disk_before = _rss_bytes(), _dir_bytes(workdir)
+    started = time.perf_counter()
+    loaded = ingest(chroma_client, embedder, tenants, chunks_per_tenant, seed=args.seed + size_index * 1000)
+    ingest_seconds = time.perf_counter() - started
+
+    rng = np.random.default_rng(args.seed + size)
+    jobs = []
+    for q_idx in range(args.queries):
+        tenant = tenants[int(rng.integers(len(tenants)))]
+        query = make_queries(loaded[tenant][2], 1, seed=args.seed + size + q_idx)[0]
+        jobs.append((tenant, query))
+
+    def query_task(job):
+        (org, widget), text = job
+        return chroma_client.query(text, n_results=args.k, organization_id=org, widget_id=widget)["ids"][0]
+
+    def payload_task(job):
+        (org, widget), text = job
+        db = SessionLocal()
+        try:
+            return _prepare_chat_payload(text, f"bench-{id(job)}", widget, org, db)
+        finally:
+            db.close()
+
+    # Warm the collection handles and caches once before timing
+    for tenant in tenants:
+        query_task((tenant, "warm up"))
+    rss_after, disk_after = _rss_bytes(), _dir_bytes(workdir)
+    total_chunks = chunks_per_tenant * len(tenants)
+
+    common = {
+        "size": total_chunks,
+        "tenants": len(tenants),
+        "backend": args.backend,
+        "concurrency": args.concurrency,
+        "ingest_chunks_per_second": total_chunks / ingest_seconds if ingest_seconds else 0.0,
+        "memory_bytes_per_chunk": max(0, rss_after - rss_before) / total_chunks,
+        "disk_bytes_per_chunk": max(0, disk_after - disk_before) / total_chunks,
+    }
+
+    reports = []
+    if "query" in args.paths:
+        latencies, results, wall = run_load(query_task, jobs, args.concurrency)
+        recalls = []
+        for ((tenant, text), found) in zip(jobs, results):
+            ids, vectors, _ = loaded[tenant]
+            scores = vectors @ embedder.embed([text])[0]
+            k = min(args.k, len(ids))
+            top = np.argpartition(-scores, k - 1)[:k]
+            recalls.append(len(set(found) & {ids[i] for i in top}) / float(k))
+        reports.append(dict(common, path="query", queries=len(jobs), queries_per_second=len(jobs) / wall,
+                            latency_ms=_latency_ms(latencies), **{f"recall_at_{args.k}": statistics.mean(recalls)}))
+    if "chat_payload" in args.paths:
+        latencies, _, wall = run_load(payload_task, jobs, args.concurrency)
+        reports.append(dict(common, path="chat_payload", queries=len(jobs), queries_per_second=len(jobs) / wall,
+                            latency_ms=_latency_ms(latencies)))
+    return reports
+
+
+def compare(results: List[Dict], baseline: List[Dict], k: int, max_regression: float) -> List[str]:
+    """Regressions of p95 latency or recall against a previous report"""
+    previous = {(r["size"], r["path"], r["backend"]): r for r in baseline}
+    problems = []
+    for result in results:
+        before = previous.get((result["size"], result["path"], result["backend"]))
+        if before is None:
+            continue
+        label = f"{result['path']} @ {result['size']} ({result['backend']})"
+        p95, p95_before = result["latency_ms"]["p95"], before["latency_ms"]["p95"]
+        if p95_before and p95 > p95_before * (1 + max_regression):
+            problems.append(f"{label}: p95 {p95_before:.1f}ms -> {p95:.1f}ms")
+        key = f"recall_at_{k}"
+        if key in result and key in before and result[key] < before[key] - max_regression * before[key]:
+            problems.append(f"{label}: {key} {before[key]:.3f} -> {result[key]:.3f}")
+    return problems
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark ChromaDBClient retrieval latency and recall")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES), help="total chunks per run (1k .. 1M)")
+    parser.add_argument("--tenants", type=int, default=4, help="widgets the chunks are spread across")
+    parser.add_argument("--backend", choices=("chroma", "numpy"), default="chroma")
+    parser.add_argument("--paths", nargs="+", choices=PATHS, default=list(PATHS))
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", dest="json_path", help="write the machine-readable report here")
+    parser.add_argument("--baseline", help="earlier --json report to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.2, help="allowed relative p95/recall regression")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="bench-retrieval-")
+    configure_environment(workdir, args.backend)
+    try:
+        from app.database import init_db
+        from app.services.embeddings import CachedEmbeddingFunction, EmbeddingCache
+        from app.services.rag import chroma_client
+
+        init_db()
+        # Same cache wrapper production uses, private so runs don't share hits
+        chroma_client.embedding_function = CachedEmbeddingFunction(
+            HashEmbeddingFunction(args.dim), cache=EmbeddingCache(max_entries=5000, ttl_seconds=3600),
+        )
+
+        results = []
+        for size_index, size in enumerate(args.sizes):
+            for report in bench_size(size, args, workdir, size_index):
+                results.append(report)
+                print(json.dumps(report, indent=2))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "backend": args.backend,
+            "tenants": args.tenants,
+            "queries": args.queries,
+            "concurrency": args.concurrency,
+            "k": args.k,
+            "dim": args.dim,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        problems = compare(results, baseline.get("results", []), args.k, args.max_regression)
+        for problem in problems:
+            print(f"REGRESSION {problem}")
+        if problems:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""Compare the vector-store backends on a synthetic tenant corpus.
+
+Builds one clustered corpus of random unit vectors, loads it into each
+backend through the same collection API `ChromaDBClient` uses, and reports
+ingest throughput, query latency percentiles, recall@k against exact search
+and on-disk size:
+
+    python -m benchmarks.vector_store --rows 20000 --dim 384 --queries 200
+    python -m benchmarks.vector_store --backends numpy-flat numpy-ivf --json results.json
+"""
+from typing import Dict, List
+import argparse
+import json
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+BACKENDS = ("chroma", "numpy-flat", "numpy-ivf")
+ADD_BATCH = 500
+
+
+def make_corpus(rows: int, dim: int, queries: int, clusters: int = 64, seed: int = 0):
+    """Clustered unit vectors (closer to real embeddings than uniform noise) plus perturbed queries"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    labels = rng.integers(clusters, size=rows)
+    corpus = centers[labels] + 0.6 * rng.normal(size=(rows, dim)).astype(np.float32)
+    corpus /= np.linalg.norm(corpus, axis=1, keepdims=True)
+    picks = rng.choice(rows, size=queries, replace=False)
+    probes = corpus[picks] + 0.3 * rng.normal(size=(queries, dim)).astype(np.float32) / np.sqrt(dim)
+    probes /= np.linalg.norm(probes, axis=1, keepdims=True)
+    return corpus, probes
+
+
+def exact_top_k(corpus: np.ndarray, probes: np.ndarray, k: int) -> List[List[int]]:
+    scores = probes @ corpus.T
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    return [row[np.argsort(-scores[i, row])].tolist() for i, row in enumerate(top)]
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))]
+
+
+def _dir_bytes(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return total
+
+
+def _open_backend(name: str, workdir: str):
+    if name == "chroma":
+        from app.services.vector_store import ChromaVectorStore
+        return ChromaVectorStore(persist_dir=workdir)
+    from app.services.numpy_vector_store import NumpyVectorStore
+    if name == "numpy-flat":
+        return NumpyVectorStore(workdir, ivf_min_rows=0)
+    if name == "numpy-ivf":
+        return NumpyVectorStore(workdir, ivf_min_rows=1)
+    raise ValueError(f"Unknown backend '{name}'")
+
+
+def bench_backend(name: str, corpus: np.ndarray, probes: np.ndarray, truth: List[List[int]], k: int) -> Dict:
+    workdir = tempfile.mkdtemp(prefix=f"bench-{name}-")
+    try:
+        store = _open_backend(name, workdir)
+        collection = store.open_collection(1, "bench", None)
+        ids = [str(i) for i in range(len(corpus))]
+
+        started = time.perf_counter()
+        for start in range(0, len(corpus), ADD_BATCH):
+            stop = start + ADD_BATCH
+            collection.add(
+                ids=ids[start:stop],
+                embeddings=corpus[start:stop].tolist(),
+                documents=[f"chunk {i}" for i in range(start, min(stop, len(corpus)))],
+                metadatas=[{"source_id": str(i % 50)} for i in range(start, min(stop, len(corpus)))],
+            )
+        ingest_seconds = time.perf_counter() - started
+
+        latencies, recalls = [], []
+        for probe, expected in zip(probes, truth):
+            started = time.perf_counter()
+            results = collection.query(
+                query_embeddings=[probe.tolist()],
+                n_results=k,
+                include=["documents", "metadatas", "distances"],
+            )
+            latencies.append(time.perf_counter() - started)
+            found = {int(doc_id) for doc_id in results["ids"][0]}
+            recalls.append(len(found & set(expected)) / float(k))
+
+        return {
+            "backend": name,
+            "rows": len(corpus),
+            "ingest_rows_per_second": len(corpus) / ingest_seconds if ingest_seconds else 0.0,
+            "query_ms": {
+                "mean": statistics.mean(latencies) * 1000,
+                "p50": _percentile(latencies, 50) * 1000,
+                "p95": _percentile(latencies, 95) * 1000,
+                "p99": _percentile(latencies, 99) * 1000,
+            },
+            f"recall_at_{k}": statistics.mean(recalls),
+            "disk_bytes": _dir_bytes(workdir),
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the Chroma and NumPy vector-store backends")
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=list(BACKENDS))
+    parser.add_argument("--json", dest="json_path", help="also write the report to this file")
+    args = parser.parse_args()
+
+    corpus, probes = make_corpus(args.rows, args.dim, args.queries)
+    truth = exact_top_k(corpus, probes, args.k)
+    reports = []
+    for name in args.backends:
+        try:
+            reports.append(bench_backend(name, corpus, probes, truth, args.k))
+        except ImportError as e:
+            reports.append({"backend": name, "error": f"unavailable: {e}"})
+        print(json.dumps(reports[-1], indent=2))
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(reports, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
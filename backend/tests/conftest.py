@@ -0,0 +1,39 @@
+"""Test settings: a throwaway SQLite database and data directory.
+
+The environment is set before `app` is imported, because `app.config`
+reads it once and several services open their stores at import time.
+"""
+import os
+import tempfile
+
+_workdir = tempfile.mkdtemp(prefix="chatbot-tests-")
+os.environ.setdefault("OPENAPI_KEY2", "test-key")
+os.environ.setdefault("JWT_SECRET", "test-secret")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_workdir, 'test.db')}")
+os.environ.setdefault("USE_LOCAL_EMBEDDINGS", "false")
+os.environ.setdefault("INGESTION_WORKERS", "0")
+for _name, _path in (
+    ("CHROMA_PERSIST_DIR", "chroma"),
+    ("CHUNK_EMBEDDING_STORE_PATH", "embeddings/chunks.db"),
+    ("NUMPY_STORE_DIR", "vectors"),
+    ("LEXICAL_INDEX_PATH", "lexical/index.db"),
+    ("UPLOAD_DIR", "uploads"),
+    ("EXPORT_DIR", "exports"),
+):
+    os.environ.setdefault(_name, os.path.join(_workdir, _path))
+
+import pytest  # noqa: E402
+
+from app.database import Base, SessionLocal, engine  # noqa: E402
+import app.models  # noqa: E402,F401
+
+
+@pytest.fixture
+def db():
+    Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+        Base.metadata.drop_all(bind=engine)
@@ -0,0 +1,71 @@
+import hashlib
+
+import numpy as np
+import pytest
+
+from app.models import Conversation
+from app.services import chat_service
+from app.services.answer_cache import answer_cache
+
+ORG_ID = 1
+WIDGET_ID = "widget-1"
+FOLLOW_UP = "how much does it cost?"
+
+
+def _fake_embedding(texts):
+    vectors = []
+    for text in texts:
+        seed = int(hashlib.sha1(text.encode("utf-8")).hexdigest()[:8], 16)
+        vectors.append(np.random.default_rng(seed).standard_normal(16).tolist())
+    return vectors
+
+
+@pytest.fixture(autouse=True)
+def cache(monkeypatch):
+    monkeypatch.setattr(chat_service.settings, "ANSWER_CACHE_ENABLED", True)
+    monkeypatch.setattr(answer_cache, "_embed", lambda text: _unit(_fake_embedding([text])[0]))
+    answer_cache.invalidate(ORG_ID, WIDGET_ID)
+    yield answer_cache
+    answer_cache.invalidate(ORG_ID, WIDGET_ID)
+
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def _add_turn(db, session_id, message, response):
+    db.add(Conversation(session_id=session_id, widget_id=WIDGET_ID, organization_id=ORG_ID, message=message, response=response, role="user"))
+    db.commit()
+
+
+def _lookup(db, session_id, message=FOLLOW_UP):
+    return chat_service._lookup_cached_answer(message, session_id, WIDGET_ID, ORG_ID, db)
+
+
+def test_follow_up_answer_is_not_shared_between_sessions(db):
+    _add_turn(db, "session-a", "Tell me about the Pro plan", "The Pro plan includes ...")
+    _add_turn(db, "session-b", "Tell me about the Basic plan", "The Basic plan includes ...")
+
+    cached, probe = _lookup(db, "session-a")
+    assert cached is None
+    chat_service.remember_answer(probe, "The Pro plan costs $49 per month.", [])
+
+    cached, probe = _lookup(db, "session-b")
+    assert cached is None
+    assert answer_cache.stats()["entries"] == 0
+
+
+def test_first_question_of_a_session_is_cached(db):
+    cached, probe = _lookup(db, "session-a", "What are your opening hours?")
+    assert cached is None and probe is not None
+    chat_service.remember_answer(probe, "We are open 9 to 5 on weekdays.", [])
+
+    cached, _ = _lookup(db, "session-b", "What are your opening hours?")
+    assert cached is not None
+    assert cached.answer == "We are open 9 to 5 on weekdays."
+
+    # The same question asked as a follow-up is answered from its own history
+    _add_turn(db, "session-c", "Do you deliver?", "Yes, nationwide.")
+    cached, probe = _lookup(db, "session-c", "What are your opening hours?")
+    assert cached is None and probe is None
@@ -0,0 +1,66 @@
+import json
+import os
+import types
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api import knowledge
+from app.auth import require_admin
+from app.database import get_db
+from app.models import IngestionJob
+from app.services.ingestion_jobs import _staging_dir
+
+LIMITS = {
+    "subscription_active": True,
+    "max_document_size_mb": 1,
+    "monthly_document_limit": 100,
+}
+
+
+@pytest.fixture
+def client(db, monkeypatch):
+    monkeypatch.setattr(knowledge, "get_effective_limits", lambda db, organization_id: dict(LIMITS))
+    monkeypatch.setattr(knowledge, "get_or_create_subscription_usage", lambda db, organization_id: types.SimpleNamespace(documents_count=0))
+
+    app = FastAPI()
+    app.include_router(knowledge.router)
+    app.dependency_overrides[get_db] = lambda: db
+    app.dependency_overrides[require_admin] = lambda: types.SimpleNamespace(id=1, organization_id=1)
+    return TestClient(app)
+
+
+def _staged_files():
+    staging_dir = _staging_dir()
+    return sorted(os.listdir(staging_dir)) if os.path.isdir(staging_dir) else []
+
+
+def test_upload_is_staged_and_queued(client, db):
+    before = _staged_files()
+    content = b"%PDF-1.4 " + b"x" * 4096
+    response = client.post(
+        "/api/admin/knowledge/upload",
+        files={"file": ("guide.pdf", content, "application/pdf")},
+        data={"widget_id": "widget-1"},
+    )
+    assert response.status_code == 202, response.text
+
+    job = db.get(IngestionJob, response.json()["id"])
+    staged_path = json.loads(job.payload)["staged_path"]
+    with open(staged_path, "rb") as f:
+        assert f.read() == content
+    assert len(_staged_files()) == len(before) + 1
+
+
+def test_oversized_upload_is_rejected_without_leaving_a_staged_file(client, db):
+    before = _staged_files()
+    response = client.post(
+        "/api/admin/knowledge/upload",
+        files={"file": ("big.pdf", b"x" * (1024 * 1024 + 1), "application/pdf")},
+        data={"widget_id": "widget-1"},
+    )
+    assert response.status_code == 400
+    assert "exceeds 1 MB" in response.json()["detail"]
+    assert _staged_files() == before
+    assert db.query(IngestionJob).count() == 0
@@ -0,0 +1,82 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+
+import pytest
+
+from app.services.web_crawler import WebCrawler
+
+PAGES = 6
+
+
+class _SiteHandler(BaseHTTPRequestHandler):
+    """/page/0 links to every other page; each page has its own text"""
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        try:
+            index = int(self.path.rstrip("/").rsplit("/", 1)[-1])
+        except ValueError:
+            index = -1
+        if not 0 <= index < PAGES:
+            self.send_error(404)
+            return
+        links = "".join(f'<a href="/page/{i}">Page {i}</a>' for i in range(1, PAGES)) if index == 0 else ""
+        body = f"<html><head><title>Page {index}</title></head><body><main><p>Content of page {index}</p>{links}</main></body></html>"
+        data = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+@pytest.fixture
+def site():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _SiteHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def _crawler(start_url: str, **kwargs) -> WebCrawler:
+    return WebCrawler(start_url, max_pages=20, max_depth=2, respect_robots=False, use_sitemaps=False, **kwargs)
+
+
+def test_page_error_does_not_stop_the_crawl(site, monkeypatch):
+    crawler = _crawler(f"{site}/page/0")
+    parse_page = crawler.parse_page
+
+    def failing_parse(url, html):
+        if url.endswith("/page/2"):
+            raise ValueError("unparseable page")
+        return parse_page(url, html)
+
+    monkeypatch.setattr(crawler, "parse_page", failing_parse)
+    pages = crawler.crawl()
+
+    urls = sorted(page["url"] for page in pages)
+    assert urls == sorted(f"{site}/page/{i}" for i in range(PAGES) if i != 2)
+    assert crawler.pages_scanned == PAGES
+
+
+def test_page_state_callback_error_does_not_stop_the_crawl(site):
+    def on_page_state(url, state, changed):
+        if url.endswith("/page/3"):
+            raise RuntimeError("database is locked")
+
+    pages = _crawler(f"{site}/page/0", on_page_state=on_page_state).crawl()
+    assert len(pages) == PAGES
+
+
+def test_progress_callback_error_stops_the_crawl(site):
+    class Cancelled(Exception):
+        pass
+
+    def progress(scanned, changed):
+        raise Cancelled()
+
+    with pytest.raises(Cancelled):
+        _crawler(f"{site}/page/0", progress_callback=progress).crawl()
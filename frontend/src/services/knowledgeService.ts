@@ -1,22 +1,67 @@
 import api from './api';
-import { KnowledgeSource, WebCrawlRequest, WebCrawlResponse } from '../types';
+import { BulkUploadResponse, IngestionJob, KnowledgeSource, WebCrawlRequest, WebCrawlResponse } from '../types';
+
+const JOB_POLL_INTERVAL_MS = 1500;
+const TERMINAL_JOB_STATUSES = ['succeeded', 'failed', 'cancelled'];
+
+// Ingestion runs as a background job: poll it until it finishes and resolve
+// with its result, or reject in the same shape as an API error.
+async function waitForJob(job: IngestionJob, onProgress?: (job: IngestionJob) => void): Promise<any> {
+  while (!TERMINAL_JOB_STATUSES.includes(job.status)) {
+    await new Promise((resolve) => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+    const response = await api.get<IngestionJob>(`/api/admin/knowledge/jobs/${job.id}`);
+    job = response.data;
+    onProgress?.(job);
+  }
+  if (job.status !== 'succeeded') {
+    const detail = job.status === 'cancelled' ? 'Ingestion cancelled' : job.error || 'Ingestion failed';
+    throw { response: { data: { detail } } };
+  }
+  return job.result;
+}
 
 export const knowledgeService = {
-  async crawlWebsite(request: WebCrawlRequest): Promise<WebCrawlResponse> {
-    const response = await api.post<WebCrawlResponse>('/api/admin/knowledge/crawl', request);
-    return response.data;
+  async crawlWebsite(request: WebCrawlRequest, onProgress?: (job: IngestionJob) => void): Promise<WebCrawlResponse> {
+    const response = await api.post<IngestionJob>('/api/admin/knowledge/crawl', request);
+    return waitForJob(response.data, onProgress);
   },
 
-  async uploadDocument(file: File, widgetId: string): Promise<any> {
+  async uploadDocument(file: File, widgetId: string, onProgress?: (job: IngestionJob) => void): Promise<any> {
     const formData = new FormData();
     formData.append('file', file);
     formData.append('widget_id', widgetId);
 
-    const response = await api.post('/api/admin/knowledge/upload', formData, {
+    const response = await api.post<IngestionJob>('/api/admin/knowledge/upload', formData, {
       headers: {
         'Content-Type': 'multipart/form-data',
       },
     });
+    return waitForJob(response.data, onProgress);
+  },
+
+  // Many documents and/or ZIP archives in one ingestion job; resolves with per-file results
+  async uploadDocuments(files: File[], widgetId: string, onProgress?: (job: IngestionJob) => void): Promise<BulkUploadResponse> {
+    const formData = new FormData();
+    files.forEach((file) => formData.append('files', file));
+    formData.append('widget_id', widgetId);
+
+    const response = await api.post<IngestionJob>('/api/admin/knowledge/upload/bulk', formData, {
+      headers: {
+        'Content-Type': 'multipart/form-data',
+      },
+    });
+    return waitForJob(response.data, onProgress);
+  },
+
+  async listJobs(widgetId: string, activeOnly = false): Promise<IngestionJob[]> {
+    const response = await api.get<IngestionJob[]>('/api/admin/knowledge/jobs', {
+      params: { widget_id: widgetId, active_only: activeOnly },
+    });
+    return response.data;
+  },
+
+  async cancelJob(jobId: number): Promise<IngestionJob> {
+    const response = await api.post<IngestionJob>(`/api/admin/knowledge/jobs/${jobId}/cancel`);
     return response.data;
   },
 
@@ -39,11 +84,11 @@ export const knowledgeService = {
   },
 
   async ingestText(widgetId: string, title: string, content: string): Promise<any> {
-    const response = await api.post('/api/admin/knowledge/ingest-text', {
+    const response = await api.post<IngestionJob>('/api/admin/knowledge/ingest-text', {
       widget_id: widgetId,
       title,
       content,
     });
-    return response.data;
+    return waitForJob(response.data);
   },
 };
@@ -32,6 +32,36 @@ export interface WebCrawlResponse {
   message: string;
 }
 
+export interface BulkUploadFileResult {
+  filename: string;
+  status: 'succeeded' | 'failed' | 'skipped';
+  source_id?: number | null;
+  chunks?: number;
+  error?: string | null;
+}
+
+export interface BulkUploadResponse {
+  documents_ingested: number;
+  files: BulkUploadFileResult[];
+}
+
+export interface IngestionJob {
+  id: number;
+  widget_id: string;
+  job_type: 'crawl' | 'document' | 'bulk' | 'text';
+  status: 'queued' | 'running' | 'succeeded' | 'failed' | 'cancelled';
+  stage?: string | null;
+  progress: Record<string, number>;
+  embedding_hit_ratio?: number | null;
+  result?: any;
+  error?: string | null;
+  cancel_requested: boolean;
+  attempts: number;
+  created_at?: string;
+  started_at?: string | null;
+  finished_at?: string | null;
+}
+
 export interface ChatMessage {
   message: string;
   session_id: string;